@@ -0,0 +1,460 @@
+"""
+A local stand-in for the Graph mail, Power BI refresh and Key Vault secret endpoints used by the benchmarks.
+
+Requests arrive as http://127.0.0.1:{port}/{original host}{original path}, e.g.
+http://127.0.0.1:8123/graph.microsoft.com/v1.0/me, so links the server returns can
+point at the real hosts and still be routed back here by the benchmark transport.
+
+The server runs in its own process so that its CPU time and memory don't count
+against the client being measured.
+"""
+import base64
+import json
+import multiprocessing
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+
+GRAPH = "graph.microsoft.com"
+OUTLOOK = "outlook.office.com"
+POWER_BI = "api.powerbi.com"
+
+# Bytes the attachment content repeats; a prime length so that ranges don't line up with it.
+PATTERN = bytes(range(251))
+
+# Newest message received at, so message times are stable between runs.
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp()
+
+
+class MockConfig:
+    """
+    Behaviour of the mock server.
+
+    Attributes:
+        latency (float): Seconds added to every response.
+        message_count (int): Number of messages in every mailbox folder.
+        max_page_size (int): Largest page of messages returned, whatever $top asks for.
+        attachment_size (int): Size in bytes of every attachment.
+        throttle_rate (float): Fraction of requests answered with 429.
+        retry_after (float): Retry-After in seconds sent with each 429.
+        refresh_duration (tuple): Minimum and maximum seconds a Power BI refresh runs for.
+        refresh_history (int): Completed refreshes each dataflow and semantic model already has.
+        seed (int): Seed for the throttling and refresh duration random numbers.
+    """
+
+    def __init__(self, latency=0.0, message_count=50000, max_page_size=1000, attachment_size=8 * 1024 * 1024,
+                 throttle_rate=0.0, retry_after=1.0, refresh_duration=(5, 15), refresh_history=5, seed=0):
+        self.latency = latency
+        self.message_count = message_count
+        self.max_page_size = max_page_size
+        self.attachment_size = attachment_size
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.refresh_duration = refresh_duration
+        self.refresh_history = refresh_history
+        self.seed = seed
+
+
+def _timestamp(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+def _pattern_bytes(start, length):
+    """
+    Returns length bytes of attachment content starting at offset start.
+    """
+    offset = start % len(PATTERN)
+    repeats = (offset + length) // len(PATTERN) + 1
+    return (PATTERN * repeats)[offset:offset + length]
+
+
+class MockState:
+    """
+    Everything the server remembers between requests: refresh histories, secrets, upload sessions and request counts.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.refreshes = {}
+        self.secrets = {}
+        self.uploads = {}
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = {}
+            self.throttled = 0
+            self.bytes_sent = 0
+
+    def count(self, route):
+        with self.lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+            throttle = self.random.random() < self.config.throttle_rate
+            if throttle:
+                self.throttled += 1
+            return throttle
+
+    def stats(self):
+        with self.lock:
+            return {"requests": dict(self.requests), "throttled": self.throttled, "bytes_sent": self.bytes_sent}
+
+    def refresh_history(self, key):
+        """
+        Returns the refreshes of a dataflow or semantic model, oldest first, seeding its completed history on first use.
+        """
+        with self.lock:
+            if key not in self.refreshes:
+                now = time.time()
+                self.refreshes[key] = [
+                    {"id": str(uuid.uuid4()), "start": now - 3600 * (index + 1), "duration": self.random.uniform(*self.config.refresh_duration)}
+                    for index in reversed(range(self.config.refresh_history))
+                ]
+            return self.refreshes[key]
+
+    def start_refresh(self, key):
+        history = self.refresh_history(key)
+        with self.lock:
+            refresh = {"id": str(uuid.uuid4()), "start": time.time(), "duration": self.random.uniform(*self.config.refresh_duration)}
+            history.append(refresh)
+        return refresh
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    # Headers and body are written separately, so don't let Nagle hold the body back
+    disable_nagle_algorithm = True
+
+    # Routes as (method, host, path pattern, handler name, route name for the request counts)
+    ROUTES = [
+        ("GET", GRAPH, r"/v1\.0/me", "_get_me", "graph GET /me"),
+        ("GET", GRAPH, r"/v1\.0/users/[^/]+(/mailFolders/[^/]+)?/messages", "_list_messages", "graph GET messages"),
+        ("GET", GRAPH, r"/v1\.0/users/[^/]+/messages/([^/]+)/attachments", "_list_attachments", "graph GET attachments"),
+        ("GET", GRAPH, r"/v1\.0/users/[^/]+/messages/([^/]+)/attachments/([^/]+)/\$value", "_get_attachment_value", "graph GET attachment $value"),
+        ("GET", GRAPH, r"/v1\.0/users/[^/]+/messages/([^/]+)/attachments/([^/]+)", "_get_attachment", "graph GET attachment"),
+        ("GET", GRAPH, r"/v1\.0/users/[^/]+/messages/([^/]+)/?", "_get_message", "graph GET message"),
+        ("DELETE", GRAPH, r"/v1\.0/users/[^/]+/messages/([^/]+)", "_no_content", "graph DELETE message"),
+        ("POST", GRAPH, r"/v1\.0/\$batch", "_batch", "graph POST $batch"),
+        ("POST", GRAPH, r"/v1\.0/me/sendMail", "_accepted", "graph POST sendMail"),
+        ("POST", GRAPH, r"/v1\.0/me/messages", "_create_draft", "graph POST draft"),
+        ("POST", GRAPH, r"/v1\.0/me/messages/([^/]+)/attachments", "_add_attachment", "graph POST attachment"),
+        ("POST", GRAPH, r"/v1\.0/me/messages/([^/]+)/attachments/createUploadSession", "_create_upload_session", "graph POST createUploadSession"),
+        ("POST", GRAPH, r"/v1\.0/me/messages/([^/]+)/send", "_accepted", "graph POST send draft"),
+        ("DELETE", GRAPH, r"/v1\.0/me/messages/([^/]+)", "_no_content", "graph DELETE draft"),
+        ("PUT", OUTLOOK, r"/api/v2\.0/AttachmentSessions/([^/]+)", "_upload_chunk", "outlook PUT upload chunk"),
+        ("GET", OUTLOOK, r"/api/v2\.0/AttachmentSessions/([^/]+)", "_get_upload_session", "outlook GET upload session"),
+        ("POST", POWER_BI, r"/v1\.0/myorg/groups/([^/]+)/dataflows/([^/]+)/refreshes", "_start_dataflow_refresh", "powerbi POST dataflow refresh"),
+        ("GET", POWER_BI, r"/v1\.0/myorg/groups/([^/]+)/dataflows/([^/]+)/transactions", "_list_transactions", "powerbi GET dataflow transactions"),
+        ("POST", POWER_BI, r"/v1\.0/myorg/datasets/([^/]+)/refreshes", "_start_dataset_refresh", "powerbi POST dataset refresh"),
+        ("GET", POWER_BI, r"/v1\.0/myorg/datasets/([^/]+)/refreshes", "_list_dataset_refreshes", "powerbi GET dataset refreshes"),
+        ("GET", None, r"/secrets/([^/]+)", "_get_secret", "keyvault GET secret"),
+        ("PUT", None, r"/secrets/([^/]+)", "_put_secret", "keyvault PUT secret"),
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    # Responses
+
+    def _send(self, status, body=b"", content_type="application/json", headers=None):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        if body:
+            self.send_header("Content-Type", content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.state.lock:
+            self.server.state.bytes_sent += len(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _dispatch(self, method):
+        parts = urlsplit(self.path)
+        host, _, path = unquote(parts.path).lstrip("/").partition("/")
+        path = "/" + path
+        self.query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        state = self.server.state
+
+        if host == "_stats":
+            return self._send(200, state.stats())
+        if host == "_reset":
+            self._read_body()
+            state.reset()
+            return self._send(204)
+
+        for route_method, route_host, pattern, handler, route in self.ROUTES:
+            if route_method != method or (route_host is not None and route_host != host):
+                continue
+            if route_host is None and not host.endswith(".vault.azure.net"):
+                continue
+            match = re.fullmatch(pattern, path)
+            if match is None:
+                continue
+
+            if state.config.latency:
+                time.sleep(state.config.latency)
+            if state.count(route):
+                self._read_body()
+                return self._send(429, {"error": {"code": "TooManyRequests"}}, headers={"Retry-After": str(state.config.retry_after)})
+            return getattr(self, handler)(host, *match.groups())
+
+        self._read_body()
+        self._send(404, {"error": {"code": "NotFound", "message": f"No mock route for {method} {host}{path}"}})
+
+    # Graph
+
+    def _get_me(self, host):
+        self._send(200, {"id": "benchmark-user", "userPrincipalName": "benchmark@example.com"})
+
+    def _message(self, index):
+        return {
+            "id": f"msg-{index:08d}",
+            "subject": f"Daily extract {index}",
+            "from": {"emailAddress": {"name": "Sender", "address": f"sender{index % 50}@example.com"}},
+            "receivedDateTime": _timestamp(EPOCH - index * 60),
+            "parentFolderId": "inbox",
+            "hasAttachments": True,
+        }
+
+    def _list_messages(self, host, folder):
+        config = self.server.state.config
+        skip = int(self.query.get("$skip", 0))
+        top = min(int(self.query.get("$top", 10)), config.max_page_size)
+        end = min(skip + top, config.message_count)
+
+        body = {"value": [self._message(index) for index in range(skip, end)]}
+        if end < config.message_count:
+            base = self.path.split("?", 1)[0].lstrip("/")
+            body["@odata.nextLink"] = f"https://{base}?%24top={top}&%24skip={end}"
+        self._send(200, body)
+
+    def _attachment_metadata(self, message_id):
+        return {
+            "id": "att-0",
+            "name": f"{message_id}.csv",
+            "contentType": "text/csv",
+            "size": self.server.state.config.attachment_size,
+            "lastModifiedDateTime": _timestamp(EPOCH),
+        }
+
+    def _list_attachments(self, host, message_id):
+        self._send(200, {"value": [self._attachment_metadata(message_id)]})
+
+    def _get_attachment(self, host, message_id, attachment_id):
+        attachment = self._attachment_metadata(message_id)
+        attachment["contentBytes"] = base64.b64encode(_pattern_bytes(0, attachment["size"])).decode()
+        self._send(200, attachment)
+
+    def _get_attachment_value(self, host, message_id, attachment_id):
+        size = self.server.state.config.attachment_size
+        start, end = 0, size - 1
+        status = 200
+
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+            status = 206
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(end - start + 1))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+
+        # Stream the content so that large attachments aren't held in memory
+        offset = start
+        while offset <= end:
+            length = min(1024 * 1024, end - offset + 1)
+            self.wfile.write(_pattern_bytes(offset, length))
+            offset += length
+        with self.server.state.lock:
+            self.server.state.bytes_sent += end - start + 1
+
+    def _get_message(self, host, message_id):
+        self._send(200, {"id": message_id})
+
+    def _no_content(self, host, *args):
+        self._send(204)
+
+    def _accepted(self, host, *args):
+        self._read_body()
+        self._send(202)
+
+    def _batch(self, host):
+        payload = json.loads(self._read_body() or b"{}")
+        responses = []
+        for request in payload.get("requests", []):
+            status = 204 if request.get("method") == "DELETE" else 200
+            body = None
+            if request.get("method") == "GET" and request.get("url", "").split("?")[0].endswith("/attachments"):
+                body = {"value": [self._attachment_metadata(request["url"].split("/")[-2])]}
+            elif request.get("method") == "GET":
+                body = {"id": request.get("url", "").rstrip("/").split("/")[-1]}
+            responses.append({"id": request["id"], "status": status, "headers": {}, "body": body})
+        self._send(200, {"responses": responses})
+
+    def _create_draft(self, host):
+        self._read_body()
+        self._send(201, {"id": f"draft-{uuid.uuid4().hex}"})
+
+    def _add_attachment(self, host, message_id):
+        attachment = json.loads(self._read_body() or b"{}")
+        self._send(201, {"id": f"att-{uuid.uuid4().hex}", "name": attachment.get("name")})
+
+    def _create_upload_session(self, host, message_id):
+        item = json.loads(self._read_body() or b"{}").get("AttachmentItem", {})
+        session_id = uuid.uuid4().hex
+        with self.server.state.lock:
+            self.server.state.uploads[session_id] = {"size": item.get("size", 0), "received": 0}
+        upload_url = f"https://{OUTLOOK}/api/v2.0/AttachmentSessions/{session_id}?authtoken=benchmark"
+        self._send(201, {"uploadUrl": upload_url, "nextExpectedRanges": ["0-"]})
+
+    def _upload_session_status(self, upload):
+        return {"nextExpectedRanges": [f"{upload['received']}-"]}
+
+    def _upload_chunk(self, host, session_id):
+        body = self._read_body()
+        upload = self.server.state.uploads.get(session_id)
+        if upload is None:
+            return self._send(404, {"error": {"code": "ItemNotFound"}})
+
+        match = re.fullmatch(r"bytes (\d+)-(\d+)/(\d+)", self.headers.get("Content-Range", ""))
+        if match is None or int(match.group(1)) != upload["received"] or int(match.group(2)) - int(match.group(1)) + 1 != len(body):
+            return self._send(416, {"error": {"code": "InvalidRange"}, **self._upload_session_status(upload)})
+
+        with self.server.state.lock:
+            upload["received"] += len(body)
+        if upload["received"] >= upload["size"]:
+            return self._send(201, headers={"Location": f"https://{GRAPH}/v1.0/me/messages/draft/attachments/{session_id}"})
+        self._send(200, self._upload_session_status(upload))
+
+    def _get_upload_session(self, host, session_id):
+        upload = self.server.state.uploads.get(session_id)
+        if upload is None:
+            return self._send(404, {"error": {"code": "ItemNotFound"}})
+        self._send(200, self._upload_session_status(upload))
+
+    # Power BI
+
+    def _refresh_entries(self, key, id_field, in_progress_status, success_status):
+        top = int(self.query.get("$top", 100))
+        now = time.time()
+        entries = []
+        for refresh in reversed(self.server.state.refresh_history(key)[-top:]):
+            ended = refresh["start"] + refresh["duration"]
+            entry = {id_field: refresh["id"], "refreshType": "ViaApi", "startTime": _timestamp(refresh["start"])}
+            if ended <= now:
+                entry["endTime"] = _timestamp(ended)
+                entry["status"] = success_status
+            else:
+                entry["status"] = in_progress_status
+            entries.append(entry)
+        return {"value": entries}
+
+    def _start_dataflow_refresh(self, host, workspace_id, dataflow_id):
+        self._read_body()
+        self.server.state.start_refresh(("dataflow", workspace_id, dataflow_id))
+        self._send(200)
+
+    def _list_transactions(self, host, workspace_id, dataflow_id):
+        self._send(200, self._refresh_entries(("dataflow", workspace_id, dataflow_id), "id", "InProgress", "Success"))
+
+    def _start_dataset_refresh(self, host, dataset_id):
+        self._read_body()
+        refresh = self.server.state.start_refresh(("dataset", dataset_id))
+        location = f"https://{POWER_BI}/v1.0/myorg/datasets/{dataset_id}/refreshes/{refresh['id']}"
+        self._send(202, headers={"RequestId": refresh["id"], "Location": location})
+
+    def _list_dataset_refreshes(self, host, dataset_id):
+        self._send(200, self._refresh_entries(("dataset", dataset_id), "requestId", "Unknown", "Completed"))
+
+    # Key Vault
+
+    def _secret_bundle(self, host, name):
+        secret = self.server.state.secrets[(host, name)]
+        return {"value": secret["value"], "id": f"https://{host}/secrets/{name}/{secret['version']}", "attributes": {"updated": secret["updated"]}}
+
+    def _get_secret(self, host, name):
+        if (host, name) not in self.server.state.secrets:
+            return self._send(404, {"error": {"code": "SecretNotFound"}})
+        self._send(200, self._secret_bundle(host, name))
+
+    def _put_secret(self, host, name):
+        value = json.loads(self._read_body() or b"{}").get("value")
+        with self.server.state.lock:
+            self.server.state.secrets[(host, name)] = {"value": value, "version": uuid.uuid4().hex, "updated": int(time.time())}
+        self._send(200, self._secret_bundle(host, name))
+
+
+def _serve(config, port_queue):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockHandler)
+    server.daemon_threads = True
+    server.state = MockState(config)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+class MockServer:
+    """
+    Runs the mock server in a child process.
+
+    Example:
+        with MockServer(MockConfig(latency=0.02)) as server:
+            print(server.base_url)
+
+    Attributes:
+        config (MockConfig): The server behaviour.
+        base_url (str): URL the server listens on, e.g. http://127.0.0.1:8123.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or MockConfig()
+        self.base_url = None
+        self._process = None
+
+    def start(self):
+        port_queue = multiprocessing.Queue()
+        self._process = multiprocessing.Process(target=_serve, args=(self.config, port_queue), daemon=True)
+        self._process.start()
+        self.base_url = f"http://127.0.0.1:{port_queue.get(timeout=30)}"
+        return self
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
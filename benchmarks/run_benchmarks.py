@@ -0,0 +1,333 @@
+"""
+Benchmarks the Graph mail and Power BI refresh paths against the local mock server.
+
+Usage:
+    python benchmarks/run_benchmarks.py [paging] [attachments] [polling] [secrets] [sending] [options]
+
+Runs every scenario when none are named. See --help for the latency, page size,
+attachment size and throttling options. Results are printed as a table and can be
+saved with --json so that runs before and after a change can be compared.
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from unittest import mock
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests  # noqa: E402
+
+from benchmarks.mock_server import MockConfig, MockServer  # noqa: E402
+from fabric_python_helper import graph_api, pbi_admin  # noqa: E402
+from fabric_python_helper.credentials import LocalCredentialProvider, set_default_provider  # noqa: E402
+from fabric_python_helper.transport import HttpTransport, configure_rate_limit  # noqa: E402
+
+
+SCENARIOS = ["paging", "attachments", "polling", "secrets", "sending"]
+
+
+class _RedirectingSession:
+    """
+    Wraps a pooled session, sending every request to the mock server and timing it.
+    """
+
+    def __init__(self, session, transport):
+        self.session = session
+        self.transport = transport
+
+    def request(self, method, url, **kwargs):
+        parts = urlsplit(url)
+        local_url = f"{self.transport.base_url}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+
+        start = time.perf_counter()
+        response = self.session.request(method, local_url, **kwargs)
+        self.transport.record(time.perf_counter() - start)
+        return response
+
+    def close(self):
+        self.session.close()
+
+
+class MockTransport(HttpTransport):
+    """
+    An HttpTransport that keeps its pooling, retries and rate limits but talks to the mock server.
+
+    Latencies are measured per HTTP attempt, to the response headers.
+    """
+
+    def __init__(self, base_url, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+        self.latencies = []
+        self._latencies_lock = threading.Lock()
+
+    def _create_session(self):
+        return _RedirectingSession(super()._create_session(), self)
+
+    def record(self, seconds):
+        with self._latencies_lock:
+            self.latencies.append(seconds)
+
+
+class _OfflineApp:
+    """
+    Replaces msal.PublicClientApplication, which contacts the authority as soon as it is created.
+    """
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def get_accounts(self):
+        return []
+
+
+def make_emails(transport):
+    with mock.patch("msal.PublicClientApplication", _OfflineApp):
+        emails = graph_api.Emails("benchmark-tenant", "benchmark-client", "https://benchmark.vault.azure.net", "benchmark-secret", transport=transport)
+
+    # Authentication isn't part of the benchmark, so start with a long lived token
+    emails.access_token = "benchmark-token"
+    emails.token_expires_at = float("inf")
+    emails.user_id = "benchmark-user"
+    return emails
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+# Scenarios. Each returns the number of items processed and the number of bytes moved.
+
+def run_paging(args, transport):
+    emails = make_emails(transport)
+    count = sum(1 for _ in emails.iter_messages(page_size=args.page_size))
+    if count != args.messages:
+        raise Exception(f"Expected {args.messages} messages but paged through {count}.")
+    return count, 0
+
+
+def run_attachments(args, transport):
+    emails = make_emails(transport)
+    directory = tempfile.mkdtemp(prefix="benchmark_attachments_")
+
+    def download(index):
+        path = os.path.join(directory, f"{index}.bin")
+        result = emails.download_attachment_to_file(f"msg-{index:08d}", "att-0", path, max_workers=args.range_workers, range_size=args.range_size)
+        os.remove(path)
+        if result["size"] != args.attachment_size:
+            raise Exception(f"Expected {args.attachment_size} bytes but downloaded {result['size']}.")
+        return result["size"]
+
+    try:
+        with ThreadPoolExecutor(max_workers=args.download_workers) as executor:
+            total = sum(executor.map(download, range(args.attachments)))
+    finally:
+        os.rmdir(directory)
+    return args.attachments, total
+
+
+def run_polling(args, transport):
+    refreshers = []
+    for index in range(args.refreshes):
+        if index % 2:
+            refreshers.append(pbi_admin.SemanticModels(f"dataset-{index}", "benchmark-token", transport=transport))
+        else:
+            refreshers.append(pbi_admin.Dataflows("benchmark-workspace", f"dataflow-{index}", "benchmark-token", transport=transport))
+
+    poller = pbi_admin.RefreshPoller(loop_interval=args.poll_interval)
+    handles = [refresher.start_refresh(expected_duration=args.refresh_min, poller=poller) for refresher in refreshers]
+
+    statuses = [handle.result() for handle in handles]
+    failed = [status for status in statuses if status not in ("Success", "Completed")]
+    if failed:
+        raise Exception(f"{len(failed)} refreshes didn't succeed: {failed[:5]}")
+    return len(handles), 0
+
+
+def run_secrets(args, transport):
+    emails = make_emails(transport)
+
+    def store(index):
+        emails._store_refresh_token(f"refresh-token-{index}")
+
+    # The first write creates the secret; the rest should mostly be coalesced away
+    emails._store_refresh_token("refresh-token-initial", force=True)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(store, range(args.secret_writes)))
+    return args.secret_writes + 1, 0
+
+
+def run_sending(args, transport):
+    emails = make_emails(transport)
+    directory = tempfile.mkdtemp(prefix="benchmark_sending_")
+
+    paths = []
+    try:
+        for index in range(args.attachments):
+            path = os.path.join(directory, f"extract_{index}.bin")
+            with open(path, "wb") as file:
+                for start in range(0, args.attachment_size, 1024 * 1024):
+                    file.write(os.urandom(min(1024 * 1024, args.attachment_size - start)))
+            paths.append(path)
+
+        emails.send_email("Benchmark extract", "Attached.", ["recipient@example.com"], attachments=paths, max_workers=args.upload_workers)
+    finally:
+        for path in paths:
+            os.remove(path)
+        os.rmdir(directory)
+    return args.attachments, args.attachments * args.attachment_size
+
+
+RUNNERS = {"paging": run_paging, "attachments": run_attachments, "polling": run_polling, "secrets": run_secrets, "sending": run_sending}
+
+
+def run_scenario(name, args):
+    config = MockConfig(
+        latency=args.latency,
+        message_count=args.messages,
+        max_page_size=args.max_page_size,
+        attachment_size=args.attachment_size,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        refresh_duration=(args.refresh_min, args.refresh_max),
+        seed=args.seed,
+    )
+
+    with MockServer(config) as server:
+        transport = MockTransport(server.base_url, pool_maxsize=max(args.download_workers * args.range_workers, 32))
+
+        if args.memory:
+            tracemalloc.start()
+
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, redirect_stdout(sys.stdout if args.verbose else devnull):
+            items, transferred = RUNNERS[name](args, transport)
+        elapsed = time.perf_counter() - start
+
+        peak_memory = None
+        if args.memory:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        stats = requests.get(f"{server.base_url}/_stats").json()
+        transport.close()
+
+    latencies = transport.latencies
+    return {
+        "scenario": name,
+        "seconds": elapsed,
+        "items": items,
+        "items_per_second": items / elapsed if elapsed else None,
+        "mib_per_second": transferred / 1024 ** 2 / elapsed if transferred and elapsed else None,
+        "requests": len(latencies),
+        "throttled": stats["throttled"],
+        "latency_p50_ms": percentile(latencies, 0.5) * 1000 if latencies else None,
+        "latency_p99_ms": percentile(latencies, 0.99) * 1000 if latencies else None,
+        "latency_mean_ms": statistics.mean(latencies) * 1000 if latencies else None,
+        "peak_traced_mib": peak_memory / 1024 ** 2 if peak_memory is not None else None,
+        "max_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "server_requests": stats["requests"],
+    }
+
+
+def print_results(results):
+    columns = [
+        ("scenario", "{}"), ("seconds", "{:.2f}"), ("items", "{}"), ("items_per_second", "{:.1f}"), ("mib_per_second", "{:.1f}"),
+        ("requests", "{}"), ("throttled", "{}"), ("latency_p50_ms", "{:.2f}"), ("latency_p99_ms", "{:.2f}"),
+        ("peak_traced_mib", "{:.1f}"), ("max_rss_mib", "{:.1f}"),
+    ]
+    rows = [[name for name, _ in columns]]
+    for result in results:
+        rows.append(["-" if result[name] is None else template.format(result[name]) for name, template in columns])
+
+    widths = [max(len(row[index]) for row in rows) for index in range(len(columns))]
+    for row in rows:
+        print("  ".join(value.rjust(width) for value, width in zip(row, widths)))
+
+    for result in results:
+        print(f"\n{result['scenario']} requests by endpoint:")
+        for route, count in sorted(result["server_requests"].items()):
+            print(f"  {count:>8}  {route}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenarios", nargs="*", metavar="scenario", help=f"Scenarios to run: {', '.join(SCENARIOS)}. Defaults to all.")
+
+    server = parser.add_argument_group("mock server")
+    server.add_argument("--latency", type=float, default=0.02, help="Seconds added to every response. Default 0.02.")
+    server.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered with 429. Default 0.")
+    server.add_argument("--retry-after", type=float, default=1.0, help="Retry-After sent with each 429, in seconds. Default 1.")
+    server.add_argument("--max-page-size", type=int, default=1000, help="Largest page of messages the server returns. Default 1000.")
+    server.add_argument("--seed", type=int, default=0, help="Seed for throttling and refresh durations. Default 0.")
+
+    paging = parser.add_argument_group("paging")
+    paging.add_argument("--messages", type=int, default=50000, help="Messages in the mailbox. Default 50000.")
+    paging.add_argument("--page-size", type=int, default=1000, help="Page size requested by the client. Default 1000.")
+
+    attachments = parser.add_argument_group("attachments and sending")
+    attachments.add_argument("--attachments", type=int, default=8, help="Attachments to download, or to send on one email. Default 8.")
+    attachments.add_argument("--attachment-size", type=int, default=64 * 1024 * 1024, help="Bytes per attachment. Default 64 MiB.")
+    attachments.add_argument("--download-workers", type=int, default=4, help="Attachments downloaded at once. Default 4.")
+    attachments.add_argument("--range-workers", type=int, default=1, help="Parallel ranges per attachment. Default 1.")
+    attachments.add_argument("--upload-workers", type=int, default=1, help="Attachments uploaded at once when sending. Default 1.")
+    attachments.add_argument("--range-size", type=int, default=16 * 1024 * 1024, help="Bytes per range. Default 16 MiB.")
+
+    polling = parser.add_argument_group("polling")
+    polling.add_argument("--refreshes", type=int, default=200, help="Refreshes to start and poll, half dataflows and half semantic models. Default 200.")
+    polling.add_argument("--refresh-min", type=float, default=5, help="Shortest refresh duration in seconds. Default 5.")
+    polling.add_argument("--refresh-max", type=float, default=15, help="Longest refresh duration in seconds. Default 15.")
+    polling.add_argument("--poll-interval", type=float, default=2, help="Seconds between poll cycles. Default 2.")
+
+    secrets = parser.add_argument_group("secrets")
+    secrets.add_argument("--secret-writes", type=int, default=100, help="Refresh token writes attempted from 8 threads. Default 100.")
+
+    output = parser.add_argument_group("output")
+    output.add_argument("--no-rate-limit", action="store_true", help="Remove the client-side Graph rate limit.")
+    output.add_argument("--no-memory", dest="memory", action="store_false", help="Skip tracemalloc, which slows the client down.")
+    output.add_argument("--json", help="File to save the results to.")
+    output.add_argument("--verbose", action="store_true", help="Show the library's own output.")
+
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenario: {', '.join(unknown)}")
+    args.scenarios = args.scenarios or SCENARIOS
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Outside Fabric, serve the secrets and tokens the library asks for locally
+    set_default_provider(LocalCredentialProvider(
+        secrets={"benchmark-secret": "benchmark-secret"},
+        tokens={"keyvault": "benchmark-token", "pbi": "benchmark-token"},
+    ))
+
+    if args.no_rate_limit:
+        configure_rate_limit("graph", None)
+
+    results = [run_scenario(name, args) for name in args.scenarios]
+    print_results(results)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({"arguments": vars(args), "results": results}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
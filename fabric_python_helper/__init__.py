@@ -1,10 +1,50 @@
-from .graph_api import Emails
-from .pbi_admin import AccessTokens
-from .pbi_admin import Dataflows
-from .pbi_admin import SemanticModels
+import importlib
+
+# Public names and the submodules they live in. Submodules, and the msal, requests and
+# notebookutils packages they use, are only imported when a name is first accessed, so
+# importing the package is fast and works outside Fabric.
+_LAZY = {
+    "Emails": "graph_api",
+    "AsyncEmails": "graph_api_async",
+    "MailboxIndex": "mail_index",
+    "MessageQuery": "mail_query",
+    "AttachmentCache": "attachment_cache",
+    "MailboxIngestionPipeline": "mail_pipeline",
+    "AccessTokens": "pbi_admin",
+    "Dataflows": "pbi_admin",
+    "SemanticModels": "pbi_admin",
+    "RefreshPoller": "pbi_admin",
+    "HttpTransport": "transport",
+    "RetryPolicy": "transport",
+    "configure_rate_limit": "transport",
+    "RefreshOrchestrator": "orchestration",
+    "MetricsCollector": "instrumentation",
+    "add_listener": "instrumentation",
+    "remove_listener": "instrumentation",
+    "use_logging": "instrumentation",
+    "CredentialProvider": "credentials",
+    "EnvironmentCredentialProvider": "credentials",
+    "LocalCredentialProvider": "credentials",
+    "set_default_provider": "credentials",
+}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_LAZY[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
+
 
 __version__="0.2.8"
 __author__="Ben Dobbs"
 __author_email__="bdobbs@archwaytrust.co.uk"
 __description__="Collection of useful python code for automation in Microsoft Fabric."
-__url__="https://github.com/ArchwayTrust/Fabric-PythonHelper"
\ No newline at end of file
+__url__="https://github.com/ArchwayTrust/Fabric-PythonHelper"
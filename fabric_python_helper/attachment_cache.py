@@ -0,0 +1,274 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+
+class AttachmentCache:
+    """
+    A content-addressed on-disk cache of downloaded attachments.
+
+    Attachments are looked up by (mailbox, message ID, attachment ID, lastModifiedDateTime),
+    so a changed attachment is never served stale. Content is stored once per sha256 hash, so
+    the same file attached to many messages takes up space only once. When the stored content
+    grows beyond max_size_bytes the least recently used content is evicted.
+
+    Attributes:
+        directory (str): Directory holding the cache, e.g. /lakehouse/default/Files/attachment_cache.
+        max_size_bytes (int): Maximum total size of the stored content.
+    """
+
+    def __init__(self, directory, max_size_bytes=10 * 1024 ** 3):
+        """
+        Opens the cache, creating its directory and index if needed.
+
+        Parameters:
+            directory (str): Directory holding the cache.
+            max_size_bytes (int): Maximum total size of the stored content. Defaults to 10 GiB.
+        """
+        self.directory = directory
+        self.max_size_bytes = max_size_bytes
+        os.makedirs(os.path.join(directory, "objects"), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(directory, "index.db"), check_same_thread=False)
+
+        with self._connection:
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    mailbox TEXT NOT NULL,
+                    message_id TEXT NOT NULL,
+                    attachment_id TEXT NOT NULL,
+                    last_modified TEXT NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    PRIMARY KEY (mailbox, message_id, attachment_id, last_modified)
+                )
+                """
+            )
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS objects (
+                    sha256 TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+
+    def close(self):
+        """
+        Closes the cache index.
+        """
+        self._connection.close()
+
+    def _object_path(self, sha256):
+        return os.path.join(self.directory, "objects", sha256[:2], sha256)
+
+    def _lookup(self, mailbox, message_id, attachment_id, last_modified):
+        """
+        Finds the hash of a cached attachment's content and marks it as recently used. Must be called holding the lock.
+
+        Returns:
+            str: The sha256 hex digest, or None on a miss.
+        """
+        row = self._connection.execute(
+            "SELECT sha256 FROM entries WHERE mailbox = ? AND message_id = ? AND attachment_id = ? AND last_modified = ?",
+            (mailbox, message_id, attachment_id, last_modified),
+        ).fetchone()
+        if row is None:
+            return None
+
+        with self._connection:
+            self._connection.execute("UPDATE objects SET last_access = ? WHERE sha256 = ?", (time.time(), row[0]))
+        return row[0]
+
+    def _forget(self, sha256):
+        """
+        Removes the entries for content that was removed from disk outside the cache. Must be called holding the lock.
+        """
+        with self._connection:
+            self._connection.execute("DELETE FROM entries WHERE sha256 = ?", (sha256,))
+            self._connection.execute("DELETE FROM objects WHERE sha256 = ?", (sha256,))
+
+    def get_path(self, mailbox, message_id, attachment_id, last_modified):
+        """
+        Looks up a cached attachment and marks it as recently used.
+
+        The content can be evicted by a concurrent put once this returns, so use open() to
+        read it from a process that also stores attachments.
+
+        Parameters:
+            mailbox (str): The user ID or shared mailbox email.
+            message_id (str): The ID of the message.
+            attachment_id (str): The ID of the attachment.
+            last_modified (str): The attachment's lastModifiedDateTime.
+
+        Returns:
+            str: Path of the cached content, or None on a miss. The file must not be modified.
+        """
+        with self._lock:
+            sha256 = self._lookup(mailbox, message_id, attachment_id, last_modified)
+            if sha256 is None:
+                return None
+
+            path = self._object_path(sha256)
+            if not os.path.exists(path):
+                self._forget(sha256)
+                return None
+            return path
+
+    def open(self, mailbox, message_id, attachment_id, last_modified):
+        """
+        Opens a cached attachment for reading and marks it as recently used.
+
+        The file is opened while the cache is locked, so it stays readable until it is closed
+        even if a concurrent put evicts its content in the meantime.
+
+        Parameters:
+            mailbox (str): The user ID or shared mailbox email.
+            message_id (str): The ID of the message.
+            attachment_id (str): The ID of the attachment.
+            last_modified (str): The attachment's lastModifiedDateTime.
+
+        Returns:
+            file: The cached content opened in binary mode, named by its sha256, or None on a miss. The caller must close it.
+        """
+        with self._lock:
+            sha256 = self._lookup(mailbox, message_id, attachment_id, last_modified)
+            if sha256 is None:
+                return None
+
+            try:
+                return open(self._object_path(sha256), "rb")
+            except FileNotFoundError:
+                self._forget(sha256)
+                return None
+
+    def get(self, mailbox, message_id, attachment_id, last_modified):
+        """
+        Reads a cached attachment.
+
+        Parameters:
+            mailbox (str): The user ID or shared mailbox email.
+            message_id (str): The ID of the message.
+            attachment_id (str): The ID of the attachment.
+            last_modified (str): The attachment's lastModifiedDateTime.
+
+        Returns:
+            bytes: The cached content, or None on a miss.
+        """
+        file = self.open(mailbox, message_id, attachment_id, last_modified)
+        if file is None:
+            return None
+        with file:
+            return file.read()
+
+    def put(self, mailbox, message_id, attachment_id, last_modified, content):
+        """
+        Stores an attachment's content.
+
+        Parameters:
+            mailbox (str): The user ID or shared mailbox email.
+            message_id (str): The ID of the message.
+            attachment_id (str): The ID of the attachment.
+            last_modified (str): The attachment's lastModifiedDateTime.
+            content (bytes): The attachment content.
+
+        Returns:
+            str: The sha256 hex digest of the content.
+        """
+        sha256 = hashlib.sha256(content).hexdigest()
+        path = self._object_path(sha256)
+
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{threading.get_ident()}.partial"
+            with open(temp_path, "wb") as file:
+                file.write(content)
+            os.replace(temp_path, path)
+
+        self._add_entry(mailbox, message_id, attachment_id, last_modified, sha256, len(content))
+        return sha256
+
+    def put_file(self, mailbox, message_id, attachment_id, last_modified, source_path, sha256=None):
+        """
+        Stores an attachment that has already been downloaded to a file, copying it into the cache.
+
+        Parameters:
+            mailbox (str): The user ID or shared mailbox email.
+            message_id (str): The ID of the message.
+            attachment_id (str): The ID of the attachment.
+            last_modified (str): The attachment's lastModifiedDateTime.
+            source_path (str): The downloaded file.
+            sha256 (str): Optional. The file's sha256 hex digest if already known.
+
+        Returns:
+            str: The sha256 hex digest of the content.
+        """
+        if sha256 is None:
+            checksum = hashlib.sha256()
+            with open(source_path, "rb") as file:
+                for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                    checksum.update(chunk)
+            sha256 = checksum.hexdigest()
+
+        path = self._object_path(sha256)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{threading.get_ident()}.partial"
+            shutil.copyfile(source_path, temp_path)
+            os.replace(temp_path, path)
+
+        self._add_entry(mailbox, message_id, attachment_id, last_modified, sha256, os.path.getsize(path))
+        return sha256
+
+    def _add_entry(self, mailbox, message_id, attachment_id, last_modified, sha256, size):
+        """
+        Records a cache entry and its content, then evicts content if the cache is over its size limit.
+        """
+        with self._lock:
+            with self._connection:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO entries (mailbox, message_id, attachment_id, last_modified, sha256) VALUES (?, ?, ?, ?, ?)",
+                    (mailbox, message_id, attachment_id, last_modified, sha256),
+                )
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO objects (sha256, size, last_access) VALUES (?, ?, ?)", (sha256, size, time.time())
+                )
+            self._evict(keep=sha256)
+
+    def _evict(self, keep=None):
+        """
+        Removes least recently used content until the cache is within max_size_bytes. Must be called holding the lock.
+
+        Parameters:
+            keep (str): Optional. Hash of content that must not be evicted, e.g. the one just added.
+        """
+        total_size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+        if total_size <= self.max_size_bytes:
+            return
+
+        for sha256, size in self._connection.execute("SELECT sha256, size FROM objects ORDER BY last_access").fetchall():
+            if total_size <= self.max_size_bytes:
+                break
+            if sha256 == keep:
+                continue
+
+            with self._connection:
+                self._connection.execute("DELETE FROM entries WHERE sha256 = ?", (sha256,))
+                self._connection.execute("DELETE FROM objects WHERE sha256 = ?", (sha256,))
+            path = self._object_path(sha256)
+            if os.path.exists(path):
+                os.remove(path)
+            total_size -= size
+
+    def size(self):
+        """
+        Returns:
+            int: Total size in bytes of the stored content.
+        """
+        with self._lock:
+            return self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
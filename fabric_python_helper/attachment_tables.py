@@ -0,0 +1,284 @@
+import codecs
+import importlib
+import os
+
+
+# File extensions that can be read as tables, by format.
+TABLE_FORMATS = {".csv": "csv", ".txt": "csv", ".tsv": "csv", ".xlsx": "xlsx", ".xlsm": "xlsx"}
+
+# The optional packages needed for each feature and the extra that installs them.
+_EXTRAS = {"pyarrow": "tables", "openpyxl": "xlsx", "deltalake": "delta"}
+
+
+def _import_optional(name):
+    """
+    Imports an optional dependency on first use, so it is only needed by the features that use it.
+
+    Parameters:
+        name (str): The module name, e.g. "pyarrow.csv".
+
+    Returns:
+        module: The imported module.
+    """
+    try:
+        return importlib.import_module(name)
+    except ImportError as e:
+        package = name.split(".")[0]
+        raise ImportError(f"Reading attachments as tables requires {package}. Install it with: pip install fabric_python_helper[{_EXTRAS[package]}]") from e
+
+
+def detect_format(name):
+    """
+    Parameters:
+        name (str): The attachment's file name.
+
+    Returns:
+        str: "csv" or "xlsx".
+    """
+    extension = os.path.splitext(name or "")[1].lower()
+    if extension not in TABLE_FORMATS:
+        raise ValueError(f"Cannot read {name} as a table. Pass file_format='csv' or 'xlsx'.")
+    return TABLE_FORMATS[extension]
+
+
+def to_schema(schema):
+    """
+    Parameters:
+        schema (pyarrow.Schema or dict): A schema, or a dict of column names to pyarrow types. None to infer.
+
+    Returns:
+        pyarrow.Schema: The schema, or None.
+    """
+    if schema is None:
+        return None
+    pa = _import_optional("pyarrow")
+    return schema if isinstance(schema, pa.Schema) else pa.schema(list(schema.items()))
+
+
+def read_csv_batches(stream, schema=None, block_size=16 * 1024 * 1024, delimiter=",", encoding="utf8", skip_rows=0):
+    """
+    Parses a CSV stream incrementally into Arrow record batches.
+
+    The stream is read and parsed block_size bytes at a time by pyarrow's streaming
+    CSV reader, so memory is bounded by the block size rather than the file size. Without
+    a schema, column types are inferred from the first block; a later value that doesn't
+    fit the inferred type raises, in which case pass a schema.
+
+    Parameters:
+        stream (file-like): A readable binary stream, e.g. a streamed HTTP response.
+        schema (pyarrow.Schema or dict): Optional. Types of some or all columns, by name. Other columns are inferred.
+        block_size (int): Bytes parsed into each batch. Defaults to 16 MiB.
+        delimiter (str): Field delimiter. Defaults to ",".
+        encoding (str): Encoding of the file. Defaults to "utf8".
+        skip_rows (int): Rows to skip before the header. Defaults to 0.
+
+    Returns:
+        pyarrow.RecordBatchReader: A reader yielding the batches.
+    """
+    csv = _import_optional("pyarrow.csv")
+    schema = to_schema(schema)
+
+    # pyarrow only skips transcoding when the encoding is spelled "utf8"
+    if codecs.lookup(encoding).name == "utf-8":
+        encoding = "utf8"
+
+    read_options = csv.ReadOptions(block_size=block_size, encoding=encoding, skip_rows=skip_rows)
+    parse_options = csv.ParseOptions(delimiter=delimiter)
+    convert_options = csv.ConvertOptions(column_types=schema) if schema is not None else csv.ConvertOptions()
+
+    return csv.open_csv(stream, read_options=read_options, parse_options=parse_options, convert_options=convert_options)
+
+
+def _xlsx_column(pa, name, values, field_type):
+    """
+    Converts a column of cell values to an Arrow array, inferring its type if field_type is None.
+
+    Values are always inferred first and then cast with safe=True, so a value that doesn't
+    fit the column's type raises rather than being truncated or dropped.
+    """
+    if field_type is not None and (pa.types.is_string(field_type) or pa.types.is_large_string(field_type)):
+        # Text columns often hold a mix of codes typed as numbers and as text
+        values = [None if value is None else str(value) for value in values]
+
+    try:
+        array = pa.array(values)
+        if field_type is None:
+            # Excel stores every number as a double; openpyxl only returns whole ones as int
+            return array.cast(pa.float64()) if pa.types.is_integer(array.type) else array
+        return array.cast(field_type, safe=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+        expected = f" as {field_type}" if field_type is not None else ""
+        raise ValueError(f"Column {name} has values that can't be read{expected}: {e}. Pass a schema giving its type.") from e
+
+
+def _xlsx_rows_to_batch(pa, names, rows, schema):
+    columns = list(zip(*rows)) if rows else [() for _ in names]
+    types = [field.type for field in schema] if schema is not None else [None] * len(names)
+    arrays = [_xlsx_column(pa, name, column, field_type) for name, column, field_type in zip(names, columns, types)]
+    if schema is None:
+        return pa.RecordBatch.from_arrays(arrays, names=names)
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def read_xlsx_batches(path, sheet_name=None, schema=None, batch_size=65536, skip_rows=0):
+    """
+    Reads a worksheet into Arrow record batches of batch_size rows.
+
+    The workbook is opened in openpyxl's read-only mode, which streams the sheet rather
+    than loading it, and rows are converted to columns one batch at a time, so memory is
+    bounded by the batch size. The first row after skip_rows holds the column names.
+    Without a schema, column types are inferred from the first batch, with numbers read as
+    float64 as Excel stores them, and later batches are converted to them. A later value
+    that doesn't fit, such as text in a numeric column or any value in a column that was
+    empty throughout the first batch, raises a ValueError asking for a schema.
+
+    Parameters:
+        path (str): Path to the .xlsx file. xlsx files are zip archives, so they can't be parsed as they are downloaded.
+        sheet_name (str): Optional. The worksheet to read. Defaults to the active sheet.
+        schema (pyarrow.Schema or dict): Optional. Types of every column, in order.
+        batch_size (int): Rows per batch. Defaults to 65,536.
+        skip_rows (int): Rows to skip before the header. Defaults to 0.
+
+    Returns:
+        pyarrow.RecordBatchReader: A reader yielding the batches.
+    """
+    pa = _import_optional("pyarrow")
+    openpyxl = _import_optional("openpyxl")
+    schema = to_schema(schema)
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name else workbook.active
+        rows = sheet.iter_rows(min_row=skip_rows + 1, values_only=True)
+
+        header = next(rows, None)
+        if header is None:
+            raise ValueError(f"Worksheet {sheet.title} is empty.")
+        names = [str(name) if name is not None else f"column_{index}" for index, name in enumerate(header)]
+        if schema is not None and len(schema) != len(names):
+            raise ValueError(f"The schema has {len(schema)} columns but worksheet {sheet.title} has {len(names)}.")
+
+        def read_rows():
+            batch = []
+            for row in rows:
+                # Blank rows come back as all None
+                if any(value is not None for value in row):
+                    batch.append(row[:len(names)] + (None,) * (len(names) - len(row)))
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+        row_batches = read_rows()
+        first = _xlsx_rows_to_batch(pa, names, next(row_batches, []), schema)
+    except BaseException:
+        workbook.close()
+        raise
+
+    def batches():
+        try:
+            yield first
+            for batch in row_batches:
+                yield _xlsx_rows_to_batch(pa, names, batch, first.schema)
+        finally:
+            workbook.close()
+
+    return pa.RecordBatchReader.from_batches(first.schema, batches())
+
+
+def with_cleanup(reader, cleanup):
+    """
+    Wraps a reader so that cleanup is called once its batches are exhausted or it is discarded.
+
+    Parameters:
+        reader (pyarrow.RecordBatchReader): The reader to wrap.
+        cleanup (callable): Called with no arguments, e.g. to close a response or delete a temporary file.
+
+    Returns:
+        pyarrow.RecordBatchReader: A reader yielding the same batches.
+    """
+    pa = _import_optional("pyarrow")
+
+    def batches():
+        try:
+            yield from reader
+        finally:
+            cleanup()
+
+    return pa.RecordBatchReader.from_batches(reader.schema, batches())
+
+
+def write_parquet(reader, destination, compression="snappy"):
+    """
+    Writes record batches to a Parquet file as they are read.
+
+    The file is written alongside the destination and moved into place once complete.
+
+    Parameters:
+        reader (pyarrow.RecordBatchReader): The batches to write.
+        destination (str): Path of the Parquet file, e.g. under /lakehouse/default/Files/.
+        compression (str): Parquet compression codec. Defaults to "snappy".
+
+    Returns:
+        dict: The number of rows and batches written and the path.
+    """
+    parquet = _import_optional("pyarrow.parquet")
+
+    path = os.fspath(destination)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    rows = 0
+    batches = 0
+    temp_path = f"{path}.partial"
+    try:
+        with parquet.ParquetWriter(temp_path, reader.schema, compression=compression) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+                rows += batch.num_rows
+                batches += 1
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return {"rows": rows, "batches": batches, "path": path}
+
+
+def write_delta(reader, table_uri, mode="append", partition_by=None, storage_options=None):
+    """
+    Writes record batches to a Delta table as they are read, using the deltalake package.
+
+    Parameters:
+        reader (pyarrow.RecordBatchReader): The batches to write.
+        table_uri (str): The table's location, e.g. /lakehouse/default/Tables/my_table or an abfss:// URI.
+        mode (str): "append", "overwrite", "error" or "ignore". Defaults to "append".
+        partition_by (list of str): Optional. Columns to partition a new table by.
+        storage_options (dict): Optional. Passed to deltalake, e.g. a bearer token for abfss:// URIs.
+
+    Returns:
+        dict: The number of rows and batches written and the table URI.
+    """
+    deltalake = _import_optional("deltalake")
+    pa = _import_optional("pyarrow")
+
+    counts = {"rows": 0, "batches": 0}
+
+    def counted():
+        for batch in reader:
+            counts["rows"] += batch.num_rows
+            counts["batches"] += 1
+            yield batch
+
+    deltalake.write_deltalake(
+        table_uri,
+        pa.RecordBatchReader.from_batches(reader.schema, counted()),
+        mode=mode,
+        partition_by=partition_by,
+        storage_options=storage_options,
+    )
+
+    return {**counts, "table_uri": table_uri}
@@ -0,0 +1,183 @@
+import json
+import os
+import re
+import threading
+
+
+class CredentialProvider:
+    """
+    Supplies Key Vault secrets and access tokens to the library.
+
+    Emails and AccessTokens read every secret and token through a provider, so the library
+    can run outside Fabric by swapping the default FabricCredentialProvider for another
+    implementation. Subclasses implement get_secret and get_token.
+    """
+
+    def get_secret(self, akv_url, secret_name):
+        """
+        Parameters:
+            akv_url (str): Azure Key Vault URL, in the form https://{key_vault_name}.vault.azure.net/.
+            secret_name (str): Name of the secret.
+
+        Returns:
+            str: The secret value.
+        """
+        raise NotImplementedError
+
+    def get_token(self, audience):
+        """
+        Parameters:
+            audience (str): The resource the token is for: "keyvault", "pbi" or "storage".
+
+        Returns:
+            str: An access token for the audience.
+        """
+        raise NotImplementedError
+
+
+class FabricCredentialProvider(CredentialProvider):
+    """
+    Reads secrets and tokens as the notebook owner through Fabric's mssparkutils. The default provider.
+
+    notebookutils is only imported on first use, so the library can be imported outside Fabric.
+    """
+
+    def __init__(self):
+        self._mssparkutils = None
+
+    @property
+    def mssparkutils(self):
+        if self._mssparkutils is None:
+            from notebookutils import mssparkutils
+            self._mssparkutils = mssparkutils
+        return self._mssparkutils
+
+    def get_secret(self, akv_url, secret_name):
+        return self.mssparkutils.credentials.getSecret(akv_url, secret_name)
+
+    def get_token(self, audience):
+        return self.mssparkutils.credentials.getToken(audience)
+
+
+def _environment_name(prefix, name):
+    return prefix + re.sub(r"[^A-Za-z0-9]", "_", name).upper()
+
+
+class EnvironmentCredentialProvider(CredentialProvider):
+    """
+    Reads secrets and tokens from environment variables, e.g. on plain Linux workers or in CI.
+
+    A secret named "Graph-Refresh" is read from FABRIC_SECRET_GRAPH_REFRESH and a token
+    for "pbi" from FABRIC_TOKEN_PBI; the Key Vault URL is ignored.
+
+    Attributes:
+        secret_prefix (str): Prefix of secret variable names.
+        token_prefix (str): Prefix of token variable names.
+    """
+
+    def __init__(self, secret_prefix="FABRIC_SECRET_", token_prefix="FABRIC_TOKEN_"):
+        """
+        Parameters:
+            secret_prefix (str): Prefix of secret variable names. Defaults to "FABRIC_SECRET_".
+            token_prefix (str): Prefix of token variable names. Defaults to "FABRIC_TOKEN_".
+        """
+        self.secret_prefix = secret_prefix
+        self.token_prefix = token_prefix
+
+    def _read(self, variable):
+        value = os.environ.get(variable)
+        if value is None:
+            raise Exception(f"Environment variable {variable} is not set.")
+        return value
+
+    def get_secret(self, akv_url, secret_name):
+        return self._read(_environment_name(self.secret_prefix, secret_name))
+
+    def get_token(self, audience):
+        return self._read(_environment_name(self.token_prefix, audience))
+
+
+class LocalCredentialProvider(CredentialProvider):
+    """
+    Serves secrets and tokens held in memory or in a local JSON file, e.g. for local development and benchmarks.
+
+    The file holds {"secrets": {name: value}, "tokens": {audience: token}}. Tokens may also
+    be given as callables, which are called each time a token is needed.
+
+    Attributes:
+        path (str): JSON file the values were loaded from, or None.
+    """
+
+    def __init__(self, secrets=None, tokens=None, path=None):
+        """
+        Parameters:
+            secrets (dict): Optional. Secret values by name.
+            tokens (dict): Optional. Tokens, or callables returning them, by audience.
+            path (str): Optional. JSON file to load secrets and tokens from. Values passed directly take precedence.
+        """
+        self.path = path
+        self._secrets = {}
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+        if path:
+            with open(os.path.expanduser(path)) as file:
+                stored = json.load(file)
+            self._secrets.update(stored.get("secrets", {}))
+            self._tokens.update(stored.get("tokens", {}))
+
+        self._secrets.update(secrets or {})
+        self._tokens.update(tokens or {})
+
+    def set_secret(self, secret_name, value):
+        """
+        Parameters:
+            secret_name (str): Name of the secret.
+            value (str): The secret value.
+        """
+        with self._lock:
+            self._secrets[secret_name] = value
+
+    def get_secret(self, akv_url, secret_name):
+        with self._lock:
+            if secret_name not in self._secrets:
+                raise Exception(f"No local secret named {secret_name}.")
+            return self._secrets[secret_name]
+
+    def get_token(self, audience):
+        with self._lock:
+            if audience not in self._tokens:
+                raise Exception(f"No local token for {audience}.")
+            token = self._tokens[audience]
+        return token() if callable(token) else token
+
+
+_default_provider = None
+_default_provider_lock = threading.Lock()
+
+
+def set_default_provider(provider):
+    """
+    Sets the provider used by every Emails and AccessTokens instance that isn't given one.
+
+    Parameters:
+        provider (CredentialProvider): The provider, or None to restore the Fabric provider.
+    """
+    global _default_provider
+    with _default_provider_lock:
+        _default_provider = provider
+
+
+def get_default_provider():
+    """
+    Returns the process-wide credential provider, which is Fabric's mssparkutils unless set_default_provider() was called.
+
+    Returns:
+        CredentialProvider: The default provider.
+    """
+    global _default_provider
+    if _default_provider is None:
+        with _default_provider_lock:
+            if _default_provider is None:
+                _default_provider = FabricCredentialProvider()
+    return _default_provider
@@ -1,9 +1,30 @@
-import msal
-import requests
 import json
+import logging
 import base64
+import io
 import time
-from notebookutils import mssparkutils
+import threading
+import hashlib
+import os
+import shutil
+import random
+import tempfile
+import itertools
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .credentials import get_default_provider
+from .transport import get_default_transport
+from .mail_query import MessageQuery, ATTACHMENT_METADATA_FIELDS, order_by_in_filter
+from . import attachment_tables
+from .instrumentation import notify
+
+logger = logging.getLogger(__name__)
+
+# Graph rejects requests over 4 MB, so attachments are only sent in a request body while their base64 encoding stays under 3 MB.
+INLINE_ATTACHMENT_LIMIT = 3 * 1024 * 1024
+
+# Upload session chunks must be a multiple of 320 KiB and under 4 MB.
+UPLOAD_CHUNK_UNIT = 320 * 1024
 
 class Emails:
     """
@@ -16,13 +37,30 @@ class Emails:
         akv_url (str): Azure Key Vault URL, in the form https://{key_vault_name}.vault.azure.net/.
         refresh_secret_name (str): Name of the secret in the Azure Key Vault that holds the refresh token.
         app (msal.PublicClientApplication): MSAL instance for Azure authentication.
-        access_token (str): Token for authenticated access to the Graph API.
+        access_token (str): Token for authenticated access to the Graph API. Renewed automatically before it expires.
+        token_expires_at (float): Unix time at which the access token expires.
+        token_cache_path (str): File the MSAL token cache is persisted to, or None to keep it in memory.
+        transport (HttpTransport): Pooled HTTP transport used for all Graph and Key Vault calls.
     """
 
     REDIRECT_URI = "https://login.microsoftonline.com/common/oauth2/nativeclient"
     SCOPES = ["User.Read", "Mail.ReadWrite", "Mail.Send"]
 
-    def __init__(self, tennant_id, client_id, akv_url, refresh_secret_name):
+    # Maximum number of sub-requests Graph accepts in one $batch call.
+    BATCH_SIZE = 20
+
+    # One lock per key vault secret so that instances in the same process don't write concurrently.
+    _secret_write_locks = {}
+    _secret_write_locks_guard = threading.Lock()
+
+    # Graph allows a handful of concurrent requests per mailbox. Each search pages one request at a
+    # time, so this caps the searches of one mailbox running at once across every search_mailboxes
+    # call and instance in the process; searches beyond it wait their turn.
+    MAX_CONCURRENCY_PER_MAILBOX = 4
+    _mailbox_semaphores = {}
+    _mailbox_semaphores_guard = threading.Lock()
+
+    def __init__(self, tennant_id, client_id, akv_url, refresh_secret_name, transport=None, min_secret_write_age=43200, token_cache_path=None, renew_before_expiry=300, credentials=None):
         """
         Initializes the GraphAPI_Emails class with required Azure and Graph API parameters.
 
@@ -31,88 +69,310 @@ class Emails:
             client_id (str): Client ID for Azure authentication.
             akv_url (str): Azure Key Vault URL.
             refresh_secret_name (str): Name of the secret in the Azure Key Vault.
+            transport (HttpTransport): Optional. Shared transport to send requests through. Defaults to the process-wide transport.
+            min_secret_write_age (int): Seconds since the refresh secret was last updated before connect() replaces it again. Defaults to 12 hours.
+            token_cache_path (str): Optional. File to persist the MSAL token cache to, e.g. /lakehouse/default/Files/tokens/mail.bin, so that
+                                    later sessions can connect without the key vault. It holds refresh tokens so must be kept private.
+            renew_before_expiry (int): Seconds before the access token expires to renew it. Defaults to 300.
+            credentials (CredentialProvider): Optional. Source of the refresh secret and Key Vault tokens. Defaults to the process-wide provider, which uses mssparkutils.
         """
         self.tennant_id = tennant_id
         self.client_id = client_id
         self.akv_url = akv_url  # URL for Azure Key Vault
         self.refresh_secret_name = refresh_secret_name  # Refresh secret name in the Azure Key Vault
-        
+        self.transport = transport or get_default_transport()
+        self.min_secret_write_age = min_secret_write_age
+        self.token_cache_path = token_cache_path
+        self.renew_before_expiry = renew_before_expiry
+        self.credentials = credentials or get_default_provider()
+
+        # Imported on first use as it is slow to load
+        import msal
+
+        # Load the persisted token cache, if any, so acquire_token_silent can use it
+        self.token_cache = msal.SerializableTokenCache()
+        if token_cache_path and os.path.exists(token_cache_path):
+            with open(token_cache_path) as file:
+                self.token_cache.deserialize(file.read())
+
         # Initialize the MSAL confidential client
         self.app = msal.PublicClientApplication(
             client_id=self.client_id,
-            authority=f"https://login.microsoftonline.com/{self.tennant_id}"
+            authority=f"https://login.microsoftonline.com/{self.tennant_id}",
+            token_cache=self.token_cache
         )
 
         self.token_response = None
         self.access_token = None
         self.refresh_token = None
+        self.token_expires_at = 0
+        self.account = None
+        self._token_lock = threading.Lock()
+
+        notify(logger, logging.INFO, "If you have previously authenticated run connect().")
+        notify(logger, logging.INFO, "If you need to trigger a device authenication flow run get_initial_tokens().")
+
+    def _auth_headers(self, content_type=None):
+        """
+        Returns the cached Graph API headers for the current access token, renewing it first if it is about to expire.
+
+        Parameters:
+            content_type (str): Optional. Value for the Content-Type header.
+
+        Returns:
+            dict: The request headers. Must not be modified.
+        """
+        return self.transport.auth_headers(self._get_access_token(), content_type)
+
+    def _get_access_token(self):
+        """
+        Returns the current access token, renewing it first if it expires within renew_before_expiry seconds.
+
+        Returns:
+            str: The access token.
+        """
+        access_token = self.access_token
+        if access_token is not None and time.time() >= self.token_expires_at - self.renew_before_expiry:
+            self._renew_access_token(access_token)
+            access_token = self.access_token
+        return access_token
+
+    def _renew_access_token(self, stale_token):
+        """
+        Replaces an expiring or rejected access token with a new one from MSAL.
+
+        Only one thread renews at a time; threads that were waiting for the lock find
+        the token already replaced and return without calling the token endpoint again.
+
+        Parameters:
+            stale_token (str): The access token that needs replacing.
+        """
+        with self._token_lock:
+            if self.access_token != stale_token:
+                # Another thread has already renewed it
+                return
+
+            result = None
+            if self.account is not None:
+                # Bypass the cached access token, which is the one being replaced
+                result = self.app.acquire_token_silent(self.SCOPES, account=self.account, force_refresh=True)
+            if (not result or "access_token" not in result) and self.refresh_token:
+                result = self.app.acquire_token_by_refresh_token(self.refresh_token, self.SCOPES)
+            if not result or "access_token" not in result:
+                raise Exception(f"Couldn't renew access token. Error: {result}")
+
+            try:
+                self._set_tokens(result)
+            except Exception as e:
+                # The new access token is usable even if the refresh secret couldn't be updated
+                notify(logger, logging.WARNING, f"Failed to store renewed refresh token. Error: {e}")
+
+    def _set_tokens(self, result, store_refresh_token=True):
+        """
+        Takes the tokens from an MSAL result, persists the token cache and stores a rotated refresh token.
+
+        Parameters:
+            result (dict): The MSAL token response.
+            store_refresh_token (bool): Whether to store a changed refresh token in the key vault. Defaults to True.
+        """
+        self.token_response = result
+        self.token_expires_at = time.time() + int(result.get("expires_in", 3600))
+        self.access_token = result["access_token"]
+        self._save_token_cache()
+
+        refresh_token = result.get("refresh_token")
+        if refresh_token and refresh_token != self.refresh_token:
+            self.refresh_token = refresh_token
+            if store_refresh_token:
+                self._store_refresh_token(refresh_token)
+
+    def _save_token_cache(self):
+        """
+        Writes the MSAL token cache to token_cache_path if it has changed.
+        """
+        if not self.token_cache_path or not self.token_cache.has_state_changed:
+            return
+
+        directory = os.path.dirname(self.token_cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        temp_path = f"{self.token_cache_path}.partial"
+        with open(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as file:
+            file.write(self.token_cache.serialize())
+        os.replace(temp_path, self.token_cache_path)
+        self.token_cache.has_state_changed = False
+
+    def _find_account(self):
+        """
+        Returns:
+            dict: The MSAL account of the authenticated user in the token cache, or None.
+        """
+        accounts = self.app.get_accounts()
+        upn = getattr(self, "user_principal_name", None)
+        if upn:
+            accounts = [account for account in accounts if account.get("username", "").lower() == upn.lower()]
+        return accounts[0] if len(accounts) == 1 else None
+
+    def _request(self, method, url, headers=None, **kwargs):
+        """
+        Sends a Graph request with the current access token. If the token is rejected
+        with a 401 it is renewed and the request is retried once.
+
+        Parameters:
+            method (str): HTTP method.
+            url (str): The request URL.
+            headers (dict): Optional. Request headers; the Authorization header is always set from the current token.
+            **kwargs: Passed through to HttpTransport.request.
+
+        Returns:
+            Response: The response object.
+        """
+        for attempt in range(2):
+            access_token = self._get_access_token()
+            authorization = f"Bearer {access_token}"
+            if headers is None:
+                request_headers = self.transport.auth_headers(access_token)
+            elif headers.get("Authorization") == authorization:
+                request_headers = headers
+            else:
+                request_headers = {**headers, "Authorization": authorization}
+
+            response = self.transport.request(method, url, headers=request_headers, **kwargs)
+            if response.status_code != 401 or attempt == 1 or access_token is None:
+                return response
+
+            response.close()
+            self._renew_access_token(access_token)
 
-        print("If you have previously authenticated run connect().")
-        print("If you need to trigger a device authenication flow run get_initial_tokens().")
-   
     def connect(self):
-        print("Retrieving refresh token from Azure Key Vault:")
-        try:
-            # Get latest refresh token
-            self.refresh_token = mssparkutils.credentials.getSecret(self.akv_url, self.refresh_secret_name)
-            print("Success!")
-        except Exception as e:
-            self.token_response = None
-            self.access_token = None
-            print("Couldn't retrieve secret from key vault.")
-            print("Ensure that the notebook user has permissions on the key vault. Then try running get_initial_tokens()")
-            raise Exception(f"Issue retrieving secret from key vault. Error: {e}") from None
+        result = None
+        account = self._find_account()
+        if account is not None:
+            notify(logger, logging.INFO, "Using the persisted token cache to acquire access token:")
+            result = self.app.acquire_token_silent(self.SCOPES, account=account)
+            if result and "access_token" in result:
+                notify(logger, logging.INFO, "Success!")
+            else:
+                result = None
+
+        if result is None:
+            notify(logger, logging.INFO, "Retrieving refresh token from Azure Key Vault:")
+            try:
+                # Get latest refresh token
+                self.refresh_token = self.credentials.get_secret(self.akv_url, self.refresh_secret_name)
+                notify(logger, logging.INFO, "Success!")
+            except Exception as e:
+                self.token_response = None
+                self.access_token = None
+                notify(logger, logging.ERROR, "Couldn't retrieve secret from key vault.")
+                notify(logger, logging.ERROR, "Ensure that the notebook user has permissions on the key vault. Then try running get_initial_tokens()")
+                raise Exception(f"Issue retrieving secret from key vault. Error: {e}") from None
+
+            notify(logger, logging.INFO, "Using stored refresh token to acquire access token and get user details:")
 
-        print("Using stored refresh token to acquire access token and get user details:")
         try:
             # Get access token.
-            self.token_response = self.app.acquire_token_by_refresh_token(self.refresh_token, self.SCOPES)
-            self.access_token = self.token_response["access_token"]
-            self.refresh_token = self.token_response["refresh_token"]
-            self._store_refresh_token(self.refresh_token)
+            if result is None:
+                result = self.app.acquire_token_by_refresh_token(self.refresh_token, self.SCOPES)
+            with self._token_lock:
+                self._set_tokens(result)
             self.user = self.get_user()
             self.user_principal_name = self.user.get("userPrincipalName")
             self.user_id = self.user.get("id")
-            print(f"You are authenticated as {self.user_principal_name} ({self.user_id}).")
+            self.account = self._find_account()
+            notify(logger, logging.INFO, f"You are authenticated as {self.user_principal_name} ({self.user_id}).")
 
         except Exception as e:
             self.access_token = None
-            print("Couldn't get access token. Try running get_initial_tokens()")
+            notify(logger, logging.ERROR, "Couldn't get access token. Try running get_initial_tokens()")
             raise Exception(f"Couldn't get access token. Error: {e}") from None
 
-    def _store_refresh_token(self, refresh_token):
+    def _get_secret_write_lock(self):
+        """
+        Returns the in-process lock guarding writes to this instance's refresh secret.
+
+        Returns:
+            threading.Lock: The lock shared by all instances using the same key vault secret.
+        """
+        key = (self.akv_url, self.refresh_secret_name)
+        with self._secret_write_locks_guard:
+            if key not in self._secret_write_locks:
+                self._secret_write_locks[key] = threading.Lock()
+            return self._secret_write_locks[key]
+
+    def _get_stored_secret(self, url, headers):
+        """
+        Reads the current refresh secret and its attributes from the Azure Key Vault.
+
+        Parameters:
+            url (str): The secret URL.
+            headers (dict): Headers holding the key vault access token.
+
+        Returns:
+            dict: The secret bundle, including value and attributes.updated, or None if it doesn't exist yet.
+        """
+        response = self.transport.get(url, headers=headers)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    def _store_refresh_token(self, refresh_token, force=False):
         """
         Stores the given refresh token in the Azure Key Vault.
 
         This method updates the Azure Key Vault secret with the new refresh token
-        for future authentications.
+        for future authentications. Unless force is True the write is skipped when
+        the stored value is unchanged, or when the secret was updated less than
+        min_secret_write_age seconds ago (e.g. by a parallel notebook). Any refresh
+        token issued recently remains valid, so an older stored value is still usable.
+
+        Writes for the same secret are serialised within the process and the stored
+        secret is re-read just before writing, so concurrent writers don't all create
+        new versions. Across processes the last writer wins, which is safe because each
+        writer stores a valid token.
 
         Parameters:
             refresh_token (str): The refresh token to be stored in the Azure Key Vault.
+            force (bool): Write the secret regardless of the coalescing policy. Defaults to False.
+
+        Returns:
+            bool: True if a new secret version was written, False if the write was skipped.
         """
         # Get credentials for key vault using workbook owner.
-        akv_cred = mssparkutils.credentials.getToken('keyvault')
+        akv_cred = self.credentials.get_token('keyvault')
 
         # Prepare the URL and headers for the Azure Key Vault request
         url = f"{self.akv_url}/secrets/{self.refresh_secret_name}?api-version=7.4"
-        headers = {
-            "Authorization": f"Bearer {akv_cred}",
-            "Content-Type": "application/json"
-        }
+        headers = self.transport.auth_headers(akv_cred, "application/json")
+
+        with self._get_secret_write_lock():
+            if not force:
+                stored_secret = self._get_stored_secret(url, headers)
+                if stored_secret is not None:
+                    if stored_secret.get("value") == refresh_token:
+                        notify(logger, logging.INFO, "Refresh secret is unchanged. Skipping update.")
+                        return False
+
+                    last_updated = stored_secret.get("attributes", {}).get("updated")
+                    if last_updated and time.time() - last_updated < self.min_secret_write_age:
+                        notify(logger, logging.INFO, "Refresh secret was updated recently. Skipping update.")
+                        return False
 
-        # Convert the refresh token to a JSON formatted string
-        data = json.dumps({"value": refresh_token})
+            # Convert the refresh token to a JSON formatted string
+            data = json.dumps({"value": refresh_token})
 
-        # Make the PUT request to the Azure Key Vault to update the secret
-        response = requests.put(url, headers=headers, data=data)
+            # Make the PUT request to the Azure Key Vault to update the secret
+            response = self.transport.put(url, headers=headers, data=data)
 
         # Check the response from the Azure Key Vault
         if response.status_code == 200:
-            print("Refresh secret updated successfully.")
+            notify(logger, logging.INFO, "Refresh secret updated successfully.")
+            return True
         else:
-            print("Failed to update secret.")
-            print("Status code:", response.status_code)
-            print("Response:", response.text)
+            notify(logger, logging.ERROR, "Failed to update secret.")
+            notify(logger, logging.ERROR, f"Status code: {response.status_code}, Response: {response.text}")
             raise Exception(f"Failed to update Secret. Code: {response.status_code}, Text: {response.text}")
 
 
@@ -142,74 +402,269 @@ class Emails:
 
         # Check if the authentication was successful
         if "access_token" in result:
-            print("Successfully authenticated.")
+            notify(logger, logging.INFO, "Successfully authenticated.")
             # Store the access token and refresh token from the result
-            self.access_token = result['access_token']
-            self.refresh_token = result['refresh_token']
+            with self._token_lock:
+                self._set_tokens(result, store_refresh_token=False)
+            self.account = self._find_account()
             # Store the new refresh token in the key vault
-            self._store_refresh_token(self.refresh_token)
+            self._store_refresh_token(self.refresh_token, force=True)
         else:
             # Handle authentication failure
-            print(f"Authentication failed. Result was: {result}")
+            notify(logger, logging.ERROR, f"Authentication failed. Result was: {result}")
             raise Exception(f"Authentication failed. Error: {result}")
 
-    def search_message_by_subject_and_sender(self, subject, sender_email, only_search_inbox=True, only_return_latest=True, shared_mailbox_email=None):
+    def iter_messages(self, filter=None, folder="Inbox", select='id,subject,from,receivedDateTime,parentFolderId,hasAttachments', order_by='receivedDateTime desc', page_size=50, shared_mailbox_email=None, query=None, expand_attachments=False):
         """
-        Searches for an email by its subject and sender's email using Microsoft Graph API with pagination.
+        Lazily yields messages one at a time, fetching pages from the Microsoft Graph API only as they are needed.
 
-        This method queries the Microsoft Graph API to find all emails that match
-        the given subject and sender's email address, handling pagination to gather all results.
+        Filtering, ordering and the selected fields are all applied by the server, and the
+        next page is only requested once the consumer has iterated past the current one,
+        so stopping early (e.g. after the first message) avoids fetching the rest.
 
         Parameters:
-            subject (str): The subject of the email to search for.
-            sender_email (str): The email address of the sender of the email.
-            only_search_inbox (bool): Defaults to True. Limits search to only the main inbox.
-            only_return_latest (bool): Defaults to True. If True, returns the ID of the latest message.
+            filter (str): Optional. An OData $filter expression.
+            folder (str): Optional. Mail folder ID or well-known name. Defaults to "Inbox"; None searches the whole mailbox.
+            select (str): Comma separated fields to return. Defaults to the fields used by search_message_by_subject_and_sender.
+            order_by (str): Optional. An OData $orderby expression. Defaults to newest first.
+            page_size (int): Number of messages per page ($top). Defaults to 50.
             shared_mailbox_email (str): Optional. The email address of the shared mailbox to search in.
+            query (MessageQuery): Optional. A query built with MessageQuery, used instead of filter, folder, select and order_by.
+            expand_attachments (bool): Whether to include attachment metadata (not content) in an "attachments" list on each message. Defaults to False.
 
-        Returns:
-            str or list: The ID of the latest email or a list of emails that match the search criteria.
-                         Returns None if no match is found.
+        Yields:
+            dict: Each matching message.
         """
-        headers = {'Authorization': f'Bearer {self.access_token}'}
+        headers = self._auth_headers()
 
         # Determine the user ID or shared mailbox email to use in the endpoint
         mailbox_id = shared_mailbox_email if shared_mailbox_email else self.user_id
 
-        if only_search_inbox:
-            endpoint = f"https://graph.microsoft.com/v1.0/users/{mailbox_id}/mailFolders/Inbox/messages"
+        if query is not None:
+            folder = query.folder
+            query_parameters, extra_headers = query.build()
+            if extra_headers:
+                headers = {**headers, **extra_headers}
+        else:
+            query_parameters = {}
+            if filter:
+                query_parameters['$filter'] = filter
+            if select:
+                query_parameters['$select'] = select
+            if order_by:
+                query_parameters['$orderby'] = order_by
+        query_parameters['$top'] = page_size
+        if expand_attachments:
+            query_parameters['$expand'] = f"attachments($select={ATTACHMENT_METADATA_FIELDS})"
+
+        if folder:
+            endpoint = f"https://graph.microsoft.com/v1.0/users/{mailbox_id}/mailFolders/{folder}/messages"
         else:
             endpoint = f"https://graph.microsoft.com/v1.0/users/{mailbox_id}/messages"
 
-        query_parameters = {
-            '$filter': f"subject eq '{subject}' and from/emailAddress/address eq '{sender_email}'",
-            '$select': 'id,subject,from,receivedDateTime,parentFolderId,hasAttachments'
-        }
+        order_by_in_filter(query_parameters)
 
-        messages = []
         while endpoint:
-            response = requests.get(endpoint, headers=headers, params=query_parameters)
+            response = self._request("GET", endpoint, headers=headers, params=query_parameters)
             if response.status_code != 200:
                 # Handle unsuccessful API call
-                raise Exception(f"Error searching message by subject: {response.json()}")
+                raise Exception(f"Error searching messages: {response.text}")
 
             data = response.json()
-            messages.extend(data.get('value', []))
+            yield from data.get('value', [])
 
             # Update the endpoint for the next page, if any
             endpoint = data.get('@odata.nextLink')
             query_parameters = None  # Ensure subsequent requests do not repeat the initial query parameters
 
-        if messages:
-            sorted_messages = sorted(messages, key=lambda x: x['receivedDateTime'], reverse=True)
+    def _get_mailbox_semaphore(self, mailbox_id):
+        """
+        Returns the semaphore limiting concurrent searches of a mailbox across all instances in the process.
 
-            if only_return_latest:
-                return sorted_messages[0]['id']
-            else:
+        It counts whole searches, not requests: a single search holds one slot while it pages
+        through results one request at a time. Other Emails methods don't take it.
+
+        Parameters:
+            mailbox_id (str): The user ID or shared mailbox email.
+
+        Returns:
+            threading.Semaphore: The mailbox's semaphore.
+        """
+        with self._mailbox_semaphores_guard:
+            if mailbox_id not in self._mailbox_semaphores:
+                self._mailbox_semaphores[mailbox_id] = threading.Semaphore(self.MAX_CONCURRENCY_PER_MAILBOX)
+            return self._mailbox_semaphores[mailbox_id]
+
+    def _search_mailbox(self, mailbox, query, max_messages, page_size, max_retries):
+        """
+        Runs one mailbox's part of search_mailboxes.
+
+        Throttling, server errors and connection failures are already retried by the transport,
+        and client errors such as 400 or 403 won't succeed on a retry, so the search is only
+        restarted when a response was cut off part way through, which the transport doesn't retry.
+
+        Returns:
+            list of dict: The matching messages, each tagged with the mailbox.
+        """
+        import requests
+
+        for attempt in range(max_retries + 1):
+            try:
+                with self._get_mailbox_semaphore(mailbox):
+                    messages = self.iter_messages(query=query, page_size=page_size, shared_mailbox_email=mailbox)
+                    messages = list(itertools.islice(messages, max_messages))
+                for message in messages:
+                    message['mailbox'] = mailbox
+                return messages
+            except requests.RequestException as e:
+                transient = not isinstance(e, (requests.ConnectionError, requests.Timeout))
+                if not transient or attempt == max_retries:
+                    raise
+                # Back off with jitter so throttled mailboxes don't all retry together
+                time.sleep(random.uniform(0, 2 ** (attempt + 1)))
+
+    def search_mailboxes(self, mailboxes, query, max_workers=8, max_messages=None, page_size=50, max_retries=3):
+        """
+        Runs the same search across many mailboxes concurrently, yielding each mailbox's results as soon as it finishes.
+
+        One mailbox failing doesn't stop the others; its error is yielded in place of results.
+        Breaking out of the loop early cancels the searches that haven't started, and doesn't
+        wait for those still running.
+
+        Parameters:
+            mailboxes (list of str): Email addresses of the mailboxes to search, e.g. shared mailboxes.
+            query (MessageQuery): The search to run in every mailbox.
+            max_workers (int): Number of mailboxes searched at once. Defaults to 8.
+            max_messages (int): Optional. Maximum number of messages to return per mailbox.
+            page_size (int): Number of messages per page. Defaults to 50.
+            max_retries (int): Number of times to restart a mailbox's search after a response is cut off part way through. Defaults to 3.
+
+        Yields:
+            tuple: The mailbox, its matching messages (each with a "mailbox" key), and None, or the mailbox, an empty list and the exception if it failed.
+        """
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = {
+                executor.submit(self._search_mailbox, mailbox, query, max_messages, page_size, max_retries): mailbox
+                for mailbox in mailboxes
+            }
+            for future in as_completed(futures):
+                mailbox = futures[future]
+                try:
+                    yield mailbox, future.result(), None
+                except Exception as e:
+                    yield mailbox, [], e
+        finally:
+            # If the caller stopped early, don't hold them up waiting for the remaining searches
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def search_message_by_subject_and_sender(self, subject, sender_email, only_search_inbox=True, only_return_latest=True, shared_mailbox_email=None):
+        """
+        Searches for an email by its subject and sender's email using Microsoft Graph API with pagination.
+
+        This method queries the Microsoft Graph API to find all emails that match
+        the given subject and sender's email address, newest first. When only the
+        latest message is wanted a single one-message page is requested.
+
+        Parameters:
+            subject (str): The subject of the email to search for.
+            sender_email (str): The email address of the sender of the email.
+            only_search_inbox (bool): Defaults to True. Limits search to only the main inbox.
+            only_return_latest (bool): Defaults to True. If True, returns the ID of the latest message.
+            shared_mailbox_email (str): Optional. The email address of the shared mailbox to search in.
+
+        Returns:
+            str or list: The ID of the latest email or a list of emails that match the search criteria.
+                         Raises an exception if no match is found.
+        """
+        query = MessageQuery(folder="Inbox" if only_search_inbox else None).subject_equals(subject).from_senders(sender_email)
+        messages = self.iter_messages(
+            query=query,
+            page_size=1 if only_return_latest else 50,
+            shared_mailbox_email=shared_mailbox_email
+        )
+
+        if only_return_latest:
+            latest_message = next(messages, None)
+            if latest_message:
+                return latest_message['id']
+        else:
+            sorted_messages = list(messages)
+            if sorted_messages:
                 return sorted_messages
 
         raise Exception("No matching messages found.")
         
+    def sync_mailbox(self, index, folder="Inbox", shared_mailbox_email=None, page_size=200):
+        """
+        Brings a MailboxIndex up to date with a mail folder using a Graph delta query.
+
+        The first sync pages through the whole folder. After that only messages added,
+        changed or removed since the deltaLink saved by the previous sync are fetched,
+        which is usually a single small request. If the saved deltaLink has expired the
+        folder is re-synced from scratch, once; if that expires too, an exception is raised.
+
+        Parameters:
+            index (MailboxIndex): The index to update.
+            folder (str): The mail folder ID or well-known name. Defaults to "Inbox".
+            shared_mailbox_email (str): Optional. The email address of the shared mailbox to sync.
+            page_size (int): Maximum number of messages per page. Defaults to 200.
+
+        Returns:
+            dict: The number of messages changed and removed.
+        """
+        # Determine the user ID or shared mailbox email to use in the endpoint
+        mailbox_id = shared_mailbox_email if shared_mailbox_email else self.user_id
+
+        headers = {**self._auth_headers(), "Prefer": f"odata.maxpagesize={page_size}"}
+
+        full_sync_endpoint = f"https://graph.microsoft.com/v1.0/users/{mailbox_id}/mailFolders/{folder}/messages/delta"
+        full_sync_parameters = {'$select': 'id,subject,from,receivedDateTime,hasAttachments'}
+
+        endpoint = index.get_delta_link(mailbox_id, folder)
+        query_parameters = None
+        if endpoint is None:
+            endpoint, query_parameters = full_sync_endpoint, full_sync_parameters
+
+        changed = 0
+        removed = 0
+        resynced = False
+        while endpoint:
+            response = self._request("GET", endpoint, headers=headers, params=query_parameters)
+
+            if response.status_code == 410:
+                # The delta token has expired, so start again from a full sync, but only once
+                if resynced:
+                    raise Exception(f"Error syncing mailbox: the delta query expired again after a full re-sync. {response.text}")
+                notify(logger, logging.WARNING, "Saved delta link has expired. Re-syncing the folder.")
+                index.reset(mailbox_id, folder)
+                endpoint, query_parameters = full_sync_endpoint, full_sync_parameters
+                changed = 0
+                removed = 0
+                resynced = True
+                continue
+
+            if response.status_code != 200:
+                raise Exception(f"Error syncing mailbox: {response.text}")
+
+            data = response.json()
+            messages = data.get('value', [])
+            removed_ids = [message['id'] for message in messages if '@removed' in message]
+            changed_messages = [message for message in messages if '@removed' not in message]
+
+            # The deltaLink only comes with the last page, and is saved with it so an interrupted sync is never half-recorded
+            delta_link = data.get('@odata.deltaLink')
+            index.apply_changes(mailbox_id, folder, changed_messages, removed_ids, delta_link)
+
+            changed += len(changed_messages)
+            removed += len(removed_ids)
+
+            endpoint = data.get('@odata.nextLink')
+            query_parameters = None
+
+        notify(logger, logging.INFO, f"Mailbox synced. {changed} messages changed, {removed} removed.")
+        return {"changed": changed, "removed": removed}
+
     def get_attachment_ids_and_names(self, message_id, shared_mailbox_email=None):
         """
         Retrieves a list of attachment IDs and names for a specified email message.
@@ -232,13 +687,10 @@ class Emails:
         url = f'https://graph.microsoft.com/v1.0/users/{mailbox_id}/messages/{message_id}/attachments'
 
         # Setting up the authorization header with the access token
-        headers = {
-            'Authorization': f'Bearer {self.access_token}',
-            'Content-Type': 'application/json'
-        }
+        headers = self._auth_headers('application/json')
 
-        # Performing a GET request to retrieve the attachments
-        response = requests.get(url, headers=headers)
+        # Performing a GET request to retrieve the attachments, without their content
+        response = self._request("GET", url, headers=headers, params={'$select': 'id,name'})
 
         # Initializing an empty list to store attachment information
         attachments_info = []
@@ -259,7 +711,49 @@ class Emails:
 
         return attachments_info
     
-    def download_attachment(self, message_id, attachment_id, is_binary=False, encoding='utf-8', shared_mailbox_email=None):
+    def get_attachments_metadata(self, message_id, shared_mailbox_email=None):
+        """
+        Retrieves the metadata of every attachment on a message without downloading their content.
+
+        Parameters:
+            message_id (str): The ID of the email message whose attachments are to be listed.
+            shared_mailbox_email (str): Optional. The email address of the shared mailbox to retrieve attachments from.
+
+        Returns:
+            list of dict: The id, name, contentType, size and lastModifiedDateTime of each attachment.
+        """
+        # Determine the user ID or shared mailbox email to use in the endpoint
+        mailbox_id = shared_mailbox_email if shared_mailbox_email else self.user_id
+
+        # Constructing the URL for the Microsoft Graph API attachments endpoint
+        url = f'https://graph.microsoft.com/v1.0/users/{mailbox_id}/messages/{message_id}/attachments'
+
+        # Selecting only metadata stops Graph returning the base64 content of every attachment
+        response = self._request("GET", url, params={'$select': ATTACHMENT_METADATA_FIELDS})
+        response.raise_for_status()
+
+        return response.json().get('value', [])
+
+    def _get_attachment_last_modified(self, mailbox_id, message_id, attachment_id):
+        """
+        Gets an attachment's lastModifiedDateTime without downloading its content.
+
+        Parameters:
+            mailbox_id (str): The user ID or shared mailbox email.
+            message_id (str): The ID of the message.
+            attachment_id (str): The ID of the attachment.
+
+        Returns:
+            str: The lastModifiedDateTime of the attachment.
+        """
+        url = f'https://graph.microsoft.com/v1.0/users/{mailbox_id}/messages/{message_id}/attachments/{attachment_id}'
+
+        response = self._request("GET", url, params={'$select': 'id,lastModifiedDateTime'})
+        response.raise_for_status()
+
+        return response.json()['lastModifiedDateTime']
+
+    def download_attachment(self, message_id, attachment_id, is_binary=False, encoding='utf-8', shared_mailbox_email=None, cache=None, last_modified=None):
         """
         Downloads an attachment from an email using the Microsoft Graph API.
 
@@ -272,6 +766,8 @@ class Emails:
             is_binary (bool): Flag indicating whether the attachment is a binary file. Default is False.
             encoding (str): The encoding used to decode the attachment's content. Ignored if is_binary is True. Default is 'utf-8'.
             shared_mailbox_email (str): Optional. The email address of the shared mailbox to retrieve the attachment from.
+            cache (AttachmentCache): Optional. Cache to serve the attachment from, and to store it in after downloading.
+            last_modified (str): Optional. The attachment's lastModifiedDateTime, e.g. from get_attachments_metadata. Saves a metadata request when using a cache.
 
         Returns:
             bytes or str: The content of the attachment, either as a byte string (for binary files) or a decoded string (for text files).
@@ -279,23 +775,311 @@ class Emails:
         # Determine the user ID or shared mailbox email to use in the endpoint
         mailbox_id = shared_mailbox_email if shared_mailbox_email else self.user_id
 
+        if cache is not None:
+            last_modified = last_modified or self._get_attachment_last_modified(mailbox_id, message_id, attachment_id)
+            attachment_content = cache.get(mailbox_id, message_id, attachment_id, last_modified)
+            if attachment_content is not None:
+                return attachment_content if is_binary else attachment_content.decode(encoding)
+
         # Constructing the URL to access the attachment via Microsoft Graph API
         attachment_url = f'https://graph.microsoft.com/v1.0/users/{mailbox_id}/messages/{message_id}/attachments/{attachment_id}'
 
         # Setting up the authorization header with the access token
-        headers = {'Authorization': f'Bearer {self.access_token}'}
+        headers = self._auth_headers()
 
         # Making a GET request to fetch the attachment and check success
-        attachment_response = requests.get(attachment_url, headers=headers)
+        attachment_response = self._request("GET", attachment_url, headers=headers)
         attachment_response.raise_for_status()
 
         # Extracting the attachment content from the response
         attachment = attachment_response.json()
         attachment_content = base64.b64decode(attachment["contentBytes"])
 
+        if cache is not None:
+            cache.put(mailbox_id, message_id, attachment_id, attachment.get("lastModifiedDateTime") or last_modified, attachment_content)
+
         # Returning the attachment content based on its type
         return attachment_content if is_binary else attachment_content.decode(encoding)
 
+    def _download_range(self, url, temp_path, start, end, chunk_size, max_retries):
+        """
+        Downloads one byte range of a file and writes it at its offset in temp_path.
+
+        A range that is cut off or comes back short is fetched again after the Graph retry
+        policy's jittered backoff. Errors the transport already retries aren't retried again.
+
+        Parameters:
+            url (str): The URL of the raw content.
+            temp_path (str): The preallocated output file.
+            start (int): First byte of the range.
+            end (int): Last byte of the range, inclusive.
+            chunk_size (int): Number of bytes to read at a time.
+            max_retries (int): Number of times to retry the range after it is cut off or comes back short.
+        """
+        headers = {**self._auth_headers(), "Range": f"bytes={start}-{end}"}
+        retry_policy = self.transport.get_retry_policy("graph")
+
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                with self._request("GET", url, headers=headers, stream=True) as response:
+                    if response.status_code != 206:
+                        raise Exception(f"Ranged request not honoured. Status code: {response.status_code}")
+
+                    written = 0
+                    with open(temp_path, "r+b") as file:
+                        file.seek(start)
+                        for chunk in response.iter_content(chunk_size=chunk_size):
+                            file.write(chunk)
+                            written += len(chunk)
+
+                if written != end - start + 1:
+                    raise Exception(f"Expected {end - start + 1} bytes for range {start}-{end} but received {written}.")
+                return
+            except Exception as e:
+                wait = retry_policy.get_exception_wait(attempt, e, max_retries)
+                if wait is None:
+                    raise
+                time.sleep(wait)
+
+    def download_attachment_to_file(self, message_id, attachment_id, destination, chunk_size=1024 * 1024, shared_mailbox_email=None, max_workers=1, range_size=16 * 1024 * 1024, max_range_retries=3, cache=None, last_modified=None):
+        """
+        Streams an attachment's raw content to a file without holding it in memory.
+
+        This method reads the attachment from the $value endpoint in chunks and writes
+        each chunk as it arrives, so memory use is bounded by chunk_size whatever the
+        size of the attachment. When destination is a path the content is written to a
+        temporary file alongside it and moved into place once complete.
+
+        With max_workers above 1 and a path destination, a file larger than range_size is
+        split into HTTP Range requests of range_size bytes which are fetched concurrently
+        and written at their offsets in a preallocated file, each retried independently.
+        If the server doesn't honour Range requests the download falls back to a single stream.
+
+        Parameters:
+            message_id (str): The ID of the message from which the attachment is to be downloaded.
+            attachment_id (str): The ID of the attachment to be downloaded.
+            destination (str or file-like): Path to write to, e.g. under /lakehouse/default/Files/, or a writable binary file object.
+            chunk_size (int): Number of bytes to read at a time. Defaults to 1 MiB.
+            shared_mailbox_email (str): Optional. The email address of the shared mailbox to retrieve the attachment from.
+            max_workers (int): Number of ranges to download concurrently. Defaults to 1, a single stream.
+            range_size (int): Size of each ranged request in bytes. Defaults to 16 MiB.
+            max_range_retries (int): Number of times to retry a range that is cut off or comes back short. Defaults to 3.
+            cache (AttachmentCache): Optional. Cache to copy the attachment from, and to store path destinations in after downloading.
+            last_modified (str): Optional. The attachment's lastModifiedDateTime, e.g. from get_attachments_metadata. Saves a metadata request when using a cache.
+
+        Returns:
+            dict: The size in bytes, sha256 hex digest and path (None for file objects) of the downloaded content.
+        """
+        # Determine the user ID or shared mailbox email to use in the endpoint
+        mailbox_id = shared_mailbox_email if shared_mailbox_email else self.user_id
+
+        is_path = isinstance(destination, (str, os.PathLike))
+
+        if cache is not None:
+            last_modified = last_modified or self._get_attachment_last_modified(mailbox_id, message_id, attachment_id)
+            cached_file = cache.open(mailbox_id, message_id, attachment_id, last_modified)
+            if cached_file is not None:
+                # Cached content is stored under its sha256, and stays readable through the open file if it is evicted
+                with cached_file:
+                    if is_path:
+                        path = os.fspath(destination)
+                        directory = os.path.dirname(path)
+                        if directory:
+                            os.makedirs(directory, exist_ok=True)
+                        with open(path, "wb") as file:
+                            shutil.copyfileobj(cached_file, file, chunk_size)
+                    else:
+                        path = None
+                        shutil.copyfileobj(cached_file, destination, chunk_size)
+                    return {"size": os.fstat(cached_file.fileno()).st_size, "sha256": os.path.basename(cached_file.name), "path": path}
+
+        # Constructing the URL for the raw content of the attachment
+        value_url = f'https://graph.microsoft.com/v1.0/users/{mailbox_id}/messages/{message_id}/attachments/{attachment_id}/$value'
+
+        # Setting up the authorization header with the access token
+        headers = self._auth_headers()
+
+        parallel = is_path and max_workers > 1
+        if parallel:
+            # Request the first range; a 206 response also tells us the total size
+            headers = {**headers, "Range": f"bytes=0-{range_size - 1}"}
+
+        size = 0
+        checksum = hashlib.sha256()
+
+        with self._request("GET", value_url, headers=headers, stream=True) as response:
+            response.raise_for_status()
+
+            if not is_path:
+                path = None
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    destination.write(chunk)
+                    checksum.update(chunk)
+                    size += len(chunk)
+                return {"size": size, "sha256": checksum.hexdigest(), "path": path}
+
+            path = os.fspath(destination)
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            temp_path = f"{path}.partial"
+            try:
+                with open(temp_path, "wb") as file:
+                    if response.status_code == 206:
+                        content_range = response.headers.get("Content-Range", "")
+                        if "/" not in content_range or content_range.endswith("/*"):
+                            raise Exception(f"Partial content returned without a total size. Content-Range: {content_range}")
+                        total_size = int(content_range.rsplit("/", 1)[1])
+                        file.truncate(total_size)
+
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        file.write(chunk)
+                        checksum.update(chunk)
+                        size += len(chunk)
+
+                ranges = []
+                if response.status_code == 206:
+                    ranges = [(start, min(start + range_size, total_size) - 1) for start in range(size, total_size, range_size)]
+
+                if ranges:
+                    # Fetch the remaining ranges concurrently, writing each at its offset
+                    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                        futures = [
+                            executor.submit(self._download_range, value_url, temp_path, start, end, chunk_size, max_range_retries)
+                            for start, end in ranges
+                        ]
+                        for future in futures:
+                            future.result()
+
+                    # The checksum needs the bytes in order, so it is calculated from the finished file
+                    checksum = hashlib.sha256()
+                    size = 0
+                    with open(temp_path, "rb") as file:
+                        for chunk in iter(lambda: file.read(chunk_size), b""):
+                            checksum.update(chunk)
+                            size += len(chunk)
+
+                os.replace(temp_path, path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+
+        if cache is not None:
+            cache.put_file(mailbox_id, message_id, attachment_id, last_modified, path, checksum.hexdigest())
+
+        return {"size": size, "sha256": checksum.hexdigest(), "path": path}
+
+    def read_attachment_batches(self, message_id, attachment_id, file_format=None, schema=None, block_size=16 * 1024 * 1024, batch_size=65536, delimiter=",", encoding="utf-8", sheet_name=None, skip_rows=0, shared_mailbox_email=None):
+        """
+        Parses a CSV or xlsx attachment into Arrow record batches without holding the file in memory.
+
+        CSV attachments are parsed by pyarrow as they are streamed from the $value endpoint,
+        block_size bytes at a time. xlsx attachments are zip archives, which can't be parsed
+        until complete, so they are first streamed to a temporary file and then read batch_size
+        rows at a time. Either way peak memory follows the batch size, not the file size.
+
+        Without a schema, column types are inferred from the first batch. Pass one if a
+        column's values only become ambiguous later in the file.
+
+        Requires the optional pyarrow dependency, and openpyxl for xlsx: pip install fabric_python_helper[tables,xlsx]
+
+        Parameters:
+            message_id (str): The ID of the message the attachment belongs to.
+            attachment_id (str): The ID of the attachment.
+            file_format (str): Optional. "csv" or "xlsx". Detected from the attachment's name if not given.
+            schema (pyarrow.Schema or dict): Optional. Column types, as a schema or a dict of column names to pyarrow types.
+            block_size (int): For CSV, bytes parsed into each batch. Defaults to 16 MiB.
+            batch_size (int): For xlsx, rows per batch. Defaults to 65,536.
+            delimiter (str): For CSV, the field delimiter. Defaults to ",".
+            encoding (str): For CSV, the encoding of the file. Defaults to 'utf-8'.
+            sheet_name (str): For xlsx, the worksheet to read. Defaults to the active sheet.
+            skip_rows (int): Rows to skip before the header. Defaults to 0.
+            shared_mailbox_email (str): Optional. The email address of the shared mailbox to retrieve the attachment from.
+
+        Returns:
+            pyarrow.RecordBatchReader: A reader yielding the batches. The download is released once it is exhausted.
+        """
+        # Determine the user ID or shared mailbox email to use in the endpoint
+        mailbox_id = shared_mailbox_email if shared_mailbox_email else self.user_id
+
+        attachment_url = f'https://graph.microsoft.com/v1.0/users/{mailbox_id}/messages/{message_id}/attachments/{attachment_id}'
+
+        if file_format is None:
+            response = self._request("GET", attachment_url, params={'$select': 'id,name'})
+            response.raise_for_status()
+            file_format = attachment_tables.detect_format(response.json().get('name'))
+
+        if file_format == "xlsx":
+            descriptor, temp_path = tempfile.mkstemp(suffix=".xlsx")
+            os.close(descriptor)
+            try:
+                self.download_attachment_to_file(message_id, attachment_id, temp_path, shared_mailbox_email=shared_mailbox_email)
+                reader = attachment_tables.read_xlsx_batches(temp_path, sheet_name=sheet_name, schema=schema, batch_size=batch_size, skip_rows=skip_rows)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+            return attachment_tables.with_cleanup(reader, lambda: os.remove(temp_path))
+
+        if file_format != "csv":
+            raise ValueError(f"Unsupported file format {file_format}. Use 'csv' or 'xlsx'.")
+
+        response = self._request("GET", f"{attachment_url}/$value", stream=True)
+        try:
+            response.raise_for_status()
+
+            # Read the body directly, decompressing it if the server compressed it
+            response.raw.decode_content = True
+            reader = attachment_tables.read_csv_batches(response.raw, schema=schema, block_size=block_size, delimiter=delimiter, encoding=encoding, skip_rows=skip_rows)
+        except BaseException:
+            response.close()
+            raise
+        return attachment_tables.with_cleanup(reader, response.close)
+
+    def save_attachment_as_parquet(self, message_id, attachment_id, destination, compression="snappy", **read_options):
+        """
+        Streams a CSV or xlsx attachment into a Parquet file, e.g. in the lakehouse Files area.
+
+        Batches are written as they are parsed, so the attachment is never held in memory whole.
+
+        Parameters:
+            message_id (str): The ID of the message the attachment belongs to.
+            attachment_id (str): The ID of the attachment.
+            destination (str): Path of the Parquet file, e.g. /lakehouse/default/Files/extracts/report.parquet.
+            compression (str): Parquet compression codec. Defaults to "snappy".
+            **read_options: Passed to read_attachment_batches, e.g. schema, file_format or shared_mailbox_email.
+
+        Returns:
+            dict: The number of rows and batches written and the path.
+        """
+        reader = self.read_attachment_batches(message_id, attachment_id, **read_options)
+        return attachment_tables.write_parquet(reader, destination, compression=compression)
+
+    def save_attachment_as_delta(self, message_id, attachment_id, table_uri, mode="append", partition_by=None, storage_options=None, **read_options):
+        """
+        Streams a CSV or xlsx attachment into a Delta table, e.g. in the lakehouse Tables area.
+
+        Batches are written as they are parsed, so the attachment is never held in memory whole.
+        Requires the optional deltalake dependency: pip install fabric_python_helper[delta]
+
+        Parameters:
+            message_id (str): The ID of the message the attachment belongs to.
+            attachment_id (str): The ID of the attachment.
+            table_uri (str): The table's location, e.g. /lakehouse/default/Tables/report or an abfss:// URI.
+            mode (str): "append", "overwrite", "error" or "ignore". Defaults to "append".
+            partition_by (list of str): Optional. Columns to partition a new table by.
+            storage_options (dict): Optional. Passed to deltalake, e.g. a bearer token for abfss:// URIs.
+            **read_options: Passed to read_attachment_batches, e.g. schema, file_format or shared_mailbox_email.
+
+        Returns:
+            dict: The number of rows and batches written and the table URI.
+        """
+        reader = self.read_attachment_batches(message_id, attachment_id, **read_options)
+        return attachment_tables.write_delta(reader, table_uri, mode=mode, partition_by=partition_by, storage_options=storage_options)
+
     def delete_email(self, message_id, shared_mailbox_email=None):
         """
         Deletes an email using the Microsoft Graph API.
@@ -318,17 +1102,14 @@ class Emails:
         delete_url = f'https://graph.microsoft.com/v1.0/users/{mailbox_id}/messages/{message_id}'
 
         # Setting up the authorization header with the access token
-        headers = {
-            'Authorization': f'Bearer {self.access_token}',
-            'Content-Type': 'application/json'
-        }
+        headers = self._auth_headers('application/json')
 
         # Sending the DELETE request
-        response = requests.delete(delete_url, headers=headers)
+        response = self._request("DELETE", delete_url, headers=headers)
 
         # Check if the request was successful
         if response.status_code == 204:
-            print("Email deleted successfully.")
+            notify(logger, logging.INFO, "Email deleted successfully.")
             return True
         else:
             raise Exception(f"Failed to delete email. Status code: {response.status_code}, Response: {response.text}")
@@ -347,13 +1128,10 @@ class Emails:
         me_url = "https://graph.microsoft.com/v1.0/me"
 
         # Setting up the authorization header with the access token
-        headers = {
-            'Authorization': f'Bearer {self.access_token}',
-            'Content-Type': 'application/json'
-        }
+        headers = self._auth_headers('application/json')
 
         # GET Response from endpoint.
-        response = requests.get(me_url, headers=headers)
+        response = self._request("GET", me_url, headers=headers)
         response.raise_for_status()
 
     # Extract user data
@@ -361,15 +1139,164 @@ class Emails:
 
         return user_data
     
-    def send_email(self, subject, content, email_addresses):
+    def _prepare_attachment(self, attachment):
+        """
+        Describes an attachment to send without reading its content.
+
+        Parameters:
+            attachment (str or tuple): A file path, or a (name, content) tuple where content is bytes or a file path.
+
+        Returns:
+            dict: The name, size, content type and either the path or the bytes of the attachment.
+        """
+        if isinstance(attachment, (str, os.PathLike)):
+            name, content = os.path.basename(os.fspath(attachment)), attachment
+        else:
+            name, content = attachment
+
+        path = None
+        if isinstance(content, (str, os.PathLike)):
+            path = os.fspath(content)
+            size = os.path.getsize(path)
+            content = None
+        else:
+            size = len(content)
+
+        return {
+            "name": name,
+            "path": path,
+            "content": content,
+            "size": size,
+            "content_type": mimetypes.guess_type(name)[0] or "application/octet-stream",
+        }
+
+    def _file_attachment(self, attachment):
+        """
+        Builds the fileAttachment resource for an attachment small enough to send in a request body.
+
+        Parameters:
+            attachment (dict): An attachment from _prepare_attachment.
+
+        Returns:
+            dict: The fileAttachment resource with its base64 encoded content.
+        """
+        content = attachment["content"]
+        if content is None:
+            with open(attachment["path"], "rb") as file:
+                content = file.read()
+
+        return {
+            "@odata.type": "#microsoft.graph.fileAttachment",
+            "name": attachment["name"],
+            "contentType": attachment["content_type"],
+            "contentBytes": base64.b64encode(content).decode(),
+        }
+
+    def _get_upload_offset(self, upload_url, offset):
         """
-        Sends an email using the Microsoft Graph API.
-        :param subject: Email subject.
-        :param content: Email content.
-        :param recipients: A list of recipient email addresses.
+        Asks an upload session which byte it expects next, so an interrupted upload can resume.
+
+        Parameters:
+            upload_url (str): The upload session URL.
+            offset (int): The offset to fall back to if the session can't be read.
+
+        Returns:
+            int: The offset to resume from.
+        """
+        try:
+            response = self.transport.request("GET", upload_url)
+            if response.status_code == 200:
+                ranges = response.json().get("nextExpectedRanges") or []
+                if ranges:
+                    return int(ranges[0].split("-")[0])
+        except Exception:
+            pass
+        return offset
+
+    def _upload_attachment(self, message_url, attachment, chunk_size, max_chunk_retries):
+        """
+        Uploads a large attachment to a draft through an upload session, reading one chunk at a time.
+
+        A chunk the session rejects is retried from the offset the session reports it expects
+        next, after the Graph retry policy's jittered backoff, so the upload resumes rather
+        than starting again. Throttling, server errors and connection errors are left to the transport.
+
+        Parameters:
+            message_url (str): The URL of the draft message.
+            attachment (dict): An attachment from _prepare_attachment.
+            chunk_size (int): Bytes uploaded per request; a multiple of 320 KiB under 4 MB.
+            max_chunk_retries (int): Number of times to retry a failed chunk.
         """
-        url = 'https://graph.microsoft.com/v1.0/me/sendMail'
-        headers = {'Authorization': f'Bearer {self.access_token}', 'Content-Type': 'application/json'}
+        headers = self._auth_headers('application/json')
+        session = {
+            "AttachmentItem": {
+                "attachmentType": "file",
+                "name": attachment["name"],
+                "size": attachment["size"],
+                "contentType": attachment["content_type"],
+            }
+        }
+
+        response = self._request("POST", f"{message_url}/attachments/createUploadSession", headers=headers, data=json.dumps(session))
+        if response.status_code != 201:
+            raise Exception(f"Failed to create an upload session for {attachment['name']}. Status code: {response.status_code}")
+
+        # The upload URL is pre-authenticated, so it is sent without the Authorization header
+        upload_url = response.json()["uploadUrl"]
+        size = attachment["size"]
+        retry_policy = self.transport.get_retry_policy("graph")
+
+        offset = 0
+        attempt = 0
+        with open(attachment["path"], "rb") if attachment["path"] else io.BytesIO(attachment["content"]) as file:
+            while offset < size:
+                file.seek(offset)
+                chunk = file.read(min(chunk_size, size - offset))
+                end = offset + len(chunk) - 1
+                chunk_headers = {"Content-Type": "application/octet-stream", "Content-Range": f"bytes {offset}-{end}/{size}"}
+
+                try:
+                    response = self.transport.request("PUT", upload_url, headers=chunk_headers, data=chunk)
+                    if response.status_code not in (200, 201):
+                        raise Exception(f"Failed to upload bytes {offset}-{end} of {attachment['name']}. Status code: {response.status_code}")
+                except Exception as e:
+                    attempt += 1
+                    wait = retry_policy.get_exception_wait(attempt, e, max_chunk_retries)
+                    if wait is None:
+                        raise
+                    time.sleep(wait)
+                    offset = self._get_upload_offset(upload_url, offset)
+                    continue
+
+                attempt = 0
+                ranges = response.json().get("nextExpectedRanges") if response.status_code == 200 and response.content else None
+                offset = int(ranges[0].split("-")[0]) if ranges else end + 1
+
+    def send_email(self, subject, content, email_addresses, attachments=None, content_type="Text", max_workers=1, chunk_size=10 * UPLOAD_CHUNK_UNIT, max_chunk_retries=3):
+        """
+        Sends an email using the Microsoft Graph API, optionally with attachments.
+
+        Attachments whose base64 encoding totals under 3 MB are sent inline in a single
+        sendMail request. Otherwise a draft is created, small attachments are added to it
+        directly and larger ones are streamed from disk through upload sessions in chunks,
+        so no file is ever held in memory whole, and then the draft is sent. If anything
+        fails the draft is deleted. Outlook accepts attachments of up to 150 MB.
+
+        Parameters:
+            subject (str): Email subject.
+            content (str): Email content.
+            email_addresses (list of str): Recipient email addresses.
+            attachments (list): Optional. File paths, or (name, content) tuples where content is bytes or a file path.
+            content_type (str): "Text" or "HTML". Defaults to "Text".
+            max_workers (int): Number of attachments uploaded at once. Chunks of one attachment are always uploaded in order. Defaults to 1.
+            chunk_size (int): Bytes per upload session request, a multiple of 320 KiB under 4 MB. Defaults to 3.125 MiB.
+            max_chunk_retries (int): Number of times to retry a failed chunk. Defaults to 3.
+        """
+        if chunk_size % UPLOAD_CHUNK_UNIT or chunk_size >= 4 * 1024 * 1024:
+            raise ValueError("chunk_size must be a multiple of 320 KiB and under 4 MB.")
+
+        headers = self._auth_headers('application/json')
+        attachments = [self._prepare_attachment(attachment) for attachment in attachments or []]
 
         # Produce recipients section in correct format.
         recipients = []
@@ -377,25 +1304,64 @@ class Emails:
             recipients.append({"emailAddress": {"address": address}})
 
         # JSON Representing the email.
-        email = {
-            "message": {
-                "subject": subject,
-                "body": {
-                    "contentType": "Text",
-                    "content": content
-                },
-                "toRecipients": recipients
+        message = {
+            "subject": subject,
+            "body": {
+                "contentType": content_type,
+                "content": content
             },
-            "saveToSentItems": "true"
+            "toRecipients": recipients
         }
 
-        # Post the email.
-        response = requests.post(url, headers=headers, data=json.dumps(email))
+        # Base64 encodes every 3 bytes as 4
+        encoded_sizes = [(attachment["size"] + 2) // 3 * 4 for attachment in attachments]
+
+        if sum(encoded_sizes) <= INLINE_ATTACHMENT_LIMIT:
+            if attachments:
+                message["attachments"] = [self._file_attachment(attachment) for attachment in attachments]
+
+            # Post the email.
+            url = 'https://graph.microsoft.com/v1.0/me/sendMail'
+            response = self._request("POST", url, headers=headers, data=json.dumps({"message": message, "saveToSentItems": "true"}))
+        else:
+            # Too large for one request, so build the message up as a draft
+            response = self._request("POST", 'https://graph.microsoft.com/v1.0/me/messages', headers=headers, data=json.dumps(message))
+            if response.status_code != 201:
+                notify(logger, logging.ERROR, f"Failed to create draft. Status code: {response.status_code}")
+                raise Exception(f"Failed to create draft. Status code: {response.status_code}")
+            message_url = f"https://graph.microsoft.com/v1.0/me/messages/{response.json()['id']}"
+
+            def add_attachment(attachment, encoded_size):
+                if encoded_size <= INLINE_ATTACHMENT_LIMIT:
+                    attachment_response = self._request("POST", f"{message_url}/attachments", headers=headers, data=json.dumps(self._file_attachment(attachment)))
+                    if attachment_response.status_code != 201:
+                        raise Exception(f"Failed to attach {attachment['name']}. Status code: {attachment_response.status_code}")
+                else:
+                    self._upload_attachment(message_url, attachment, chunk_size, max_chunk_retries)
+
+            try:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    futures = [executor.submit(add_attachment, attachment, encoded_size) for attachment, encoded_size in zip(attachments, encoded_sizes)]
+                    for future in futures:
+                        future.result()
+
+                response = self._request("POST", f"{message_url}/send", headers=headers)
+                if response.status_code != 202:
+                    raise Exception(f"Failed to send email. Status code: {response.status_code}")
+            except BaseException as e:
+                notify(logger, logging.ERROR, f"Failed to send email. {e}")
+
+                # Don't leave a half built draft behind
+                try:
+                    self._request("DELETE", message_url)
+                except Exception:
+                    pass
+                raise
 
         if response.status_code == 202:
-            print("Email sent successfully!")
+            notify(logger, logging.INFO, "Email sent successfully!")
         else:
-            print(f"Failed to send email. Status code: {response.status_code}")
+            notify(logger, logging.ERROR, f"Failed to send email. Status code: {response.status_code}")
             raise Exception(f"Failed to send email. Status code: {response.status_code}")
     
     def _check_if_message_exists(self, message_id, shared_mailbox_email=None):
@@ -416,11 +1382,11 @@ class Emails:
         message_url = f'https://graph.microsoft.com/v1.0/users/{mailbox_id}/messages/{message_id}/'
 
         # Setting up the authorization header with the access token
-        headers = {'Authorization': f'Bearer {self.access_token}'}
+        headers = self._auth_headers()
 
         try:
             # Making a GET request to the Graph API
-            response = requests.get(message_url, headers=headers)
+            response = self._request("GET", message_url, headers=headers)
 
             # If the status code is 200, the message exists
             if response.status_code == 200:
@@ -431,3 +1397,144 @@ class Emails:
             # Log any exceptions
             raise Exception(f"Failed to check for message existence. Error: {e}") from None
 
+    def _send_batch(self, sub_requests, max_retries=5):
+        """
+        Sends up to BATCH_SIZE sub-requests in a single Graph $batch call.
+
+        Sub-requests that are throttled or hit a transient error are retried on their own,
+        according to the transport's Graph RetryPolicy, after the longest Retry-After they
+        were given, while the other responses are kept.
+
+        Parameters:
+            sub_requests (list of dict): Each with a method, a url relative to /v1.0, and optionally headers and body.
+            max_retries (int): Number of times to retry throttled sub-requests. Defaults to 5.
+
+        Returns:
+            list of dict: The status, headers and body of each sub-response, in the order of sub_requests.
+        """
+        batch_url = 'https://graph.microsoft.com/v1.0/$batch'
+
+        retry_policy = self.transport.get_retry_policy("graph")
+        responses = {}
+        pending = {str(index): sub_request for index, sub_request in enumerate(sub_requests)}
+
+        for attempt in range(max_retries + 1):
+            payload = {"requests": [{"id": request_id, **sub_request} for request_id, sub_request in pending.items()]}
+
+            response = self._request("POST", batch_url, headers=self._auth_headers('application/json'), data=json.dumps(payload))
+            if response.status_code != 200:
+                raise Exception(f"Batch request failed. Status code: {response.status_code}, Response: {response.text}")
+
+            retry_after = 0
+            for sub_response in response.json().get('responses', []):
+                request_id = sub_response['id']
+                wait = None
+                if attempt < max_retries:
+                    wait = retry_policy.get_status_wait(attempt + 1, sub_response.get('status'), sub_response.get('headers') or {}, pending[request_id].get('method'))
+                if wait is not None:
+                    retry_after = max(retry_after, wait)
+                    continue
+
+                responses[request_id] = sub_response
+                pending.pop(request_id, None)
+
+            if not pending:
+                break
+
+            notify(logger, logging.WARNING, f"{len(pending)} batched requests were throttled. Retrying in {retry_after} seconds...")
+            time.sleep(retry_after)
+
+        return [responses.get(str(index), {"status": None, "headers": {}, "body": None}) for index in range(len(sub_requests))]
+
+    def batch_requests(self, sub_requests):
+        """
+        Sends any number of Graph sub-requests, packed BATCH_SIZE at a time into $batch calls.
+
+        Parameters:
+            sub_requests (list of dict): Each with a method, a url relative to /v1.0 (e.g. "/users/{id}/messages/{id}"), and optionally headers and body.
+
+        Returns:
+            list of dict: The status, headers and body of each sub-response, in the order of sub_requests.
+        """
+        responses = []
+        for start in range(0, len(sub_requests), self.BATCH_SIZE):
+            responses.extend(self._send_batch(sub_requests[start:start + self.BATCH_SIZE]))
+        return responses
+
+    def delete_emails(self, message_ids, shared_mailbox_email=None):
+        """
+        Deletes many emails using batched Graph requests.
+
+        Parameters:
+            message_ids (list of str): The IDs of the messages to be deleted.
+            shared_mailbox_email (str): Optional. The email address of the shared mailbox to delete the emails from.
+
+        Returns:
+            dict: True or False for each message ID, depending on whether it was deleted.
+        """
+        # Determine the user ID or shared mailbox email to use in the endpoint
+        mailbox_id = shared_mailbox_email if shared_mailbox_email else self.user_id
+
+        sub_requests = [{"method": "DELETE", "url": f"/users/{mailbox_id}/messages/{message_id}"} for message_id in message_ids]
+        responses = self.batch_requests(sub_requests)
+
+        results = {message_id: response.get('status') == 204 for message_id, response in zip(message_ids, responses)}
+        notify(logger, logging.INFO, f"Deleted {sum(results.values())} of {len(results)} emails.")
+        return results
+
+    def get_attachments_for_messages(self, message_ids, shared_mailbox_email=None):
+        """
+        Retrieves the attachment IDs and names for many messages using batched Graph requests.
+
+        A message whose request fails doesn't stop the others: it is mapped to None and the
+        failure is reported with a warning, so the attachments that were listed aren't lost.
+
+        Parameters:
+            message_ids (list of str): The IDs of the messages whose attachments are to be retrieved.
+            shared_mailbox_email (str): Optional. The email address of the shared mailbox to retrieve attachments from.
+
+        Returns:
+            dict: A list of (ID, name) tuples for each message ID, or None if its attachments couldn't be retrieved.
+        """
+        # Determine the user ID or shared mailbox email to use in the endpoint
+        mailbox_id = shared_mailbox_email if shared_mailbox_email else self.user_id
+
+        sub_requests = [{"method": "GET", "url": f"/users/{mailbox_id}/messages/{message_id}/attachments?$select=id,name"} for message_id in message_ids]
+        responses = self.batch_requests(sub_requests)
+
+        attachments_info = {}
+        failures = []
+        for message_id, response in zip(message_ids, responses):
+            if response.get('status') != 200:
+                attachments_info[message_id] = None
+                failures.append(f"{message_id} (status {response.get('status')}: {response.get('body')})")
+                continue
+
+            attachments_info[message_id] = [
+                (attachment['id'], attachment['name'])
+                for attachment in response['body'].get('value', [])
+            ]
+
+        if failures:
+            notify(logger, logging.WARNING, f"Failed to get attachments for {len(failures)} of {len(attachments_info)} messages: {'; '.join(failures)}")
+
+        return attachments_info
+
+    def _check_if_messages_exist(self, message_ids, shared_mailbox_email=None):
+        """
+        Checks whether many email messages exist using batched Graph requests.
+
+        Parameters:
+            message_ids (list of str): The IDs of the messages to be checked.
+            shared_mailbox_email (str): Optional. The email address of the shared mailbox to check the messages in.
+
+        Returns:
+            dict: True or False for each message ID.
+        """
+        # Determine the user ID or shared mailbox email to use in the endpoint
+        mailbox_id = shared_mailbox_email if shared_mailbox_email else self.user_id
+
+        sub_requests = [{"method": "GET", "url": f"/users/{mailbox_id}/messages/{message_id}?$select=id"} for message_id in message_ids]
+        responses = self.batch_requests(sub_requests)
+
+        return {message_id: response.get('status') == 200 for message_id, response in zip(message_ids, responses)}
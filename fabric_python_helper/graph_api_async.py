@@ -0,0 +1,321 @@
+import asyncio
+import base64
+import json
+import time
+
+from . import instrumentation
+from .transport import get_rate_limiter
+from .mail_query import MessageQuery, ATTACHMENT_METADATA_FIELDS, order_by_in_filter
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class AsyncEmails:
+    """
+    An asyncio client for the Microsoft Graph mail operations of an authenticated Emails instance.
+
+    Authentication stays with the Emails instance (run connect() first); this class reads its
+    access token and user ID and sends requests through one pooled aiohttp session, limited to
+    max_concurrency requests in flight, so many calls can be run together with asyncio.gather.
+
+    Requires the optional aiohttp dependency: pip install fabric_python_helper[async]
+
+    Attributes:
+        emails (Emails): The authenticated Emails instance.
+        max_concurrency (int): Maximum number of Graph requests in flight at once.
+        connection_limit (int): Maximum number of pooled connections.
+    """
+
+    GRAPH_URL = "https://graph.microsoft.com/v1.0"
+
+    def __init__(self, emails, max_concurrency=20, connection_limit=100, timeout=120):
+        """
+        Initializes the async client.
+
+        Parameters:
+            emails (Emails): An Emails instance that has been connected.
+            max_concurrency (int): Maximum number of Graph requests in flight at once. Defaults to 20.
+            connection_limit (int): Maximum number of pooled connections. Defaults to 100.
+            timeout (int): Total timeout for each request in seconds. Defaults to 120.
+        """
+        if aiohttp is None:
+            raise ImportError("AsyncEmails requires aiohttp. Install it with: pip install fabric_python_helper[async]")
+
+        self.emails = emails
+        self.max_concurrency = max_concurrency
+        self.connection_limit = connection_limit
+        self.timeout = timeout
+
+        # Created on first use as they must belong to the running event loop
+        self._session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """
+        Closes the pooled session.
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self):
+        """
+        Returns the pooled session, creating it in the running event loop on first use.
+
+        Returns:
+            aiohttp.ClientSession: The session.
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.connection_limit)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def _auth_headers(self, content_type=None):
+        """
+        Returns the Graph API headers for the Emails instance's current access token.
+
+        A token about to expire is renewed off the event loop, as renewal makes blocking
+        MSAL and Key Vault calls.
+
+        Parameters:
+            content_type (str): Optional. Value for the Content-Type header.
+
+        Returns:
+            dict: The request headers. Must not be modified.
+        """
+        emails = self.emails
+        access_token = emails.access_token
+        if access_token is not None and time.time() >= emails.token_expires_at - emails.renew_before_expiry:
+            await asyncio.to_thread(emails._renew_access_token, access_token)
+        return emails.transport.auth_headers(emails.access_token, content_type)
+
+    def _mailbox_id(self, shared_mailbox_email):
+        # Determine the user ID or shared mailbox email to use in the endpoint
+        return shared_mailbox_email if shared_mailbox_email else self.emails.user_id
+
+    async def _request(self, method, url, **kwargs):
+        """
+        Sends a request within the concurrency limit and reads the response.
+
+        Requests share the process-wide Graph rate limiter with the synchronous clients,
+        and throttled responses are retried by the transport's Graph RetryPolicy, as are
+        dropped connections and timeouts for idempotent methods. A 401 renews the Emails
+        instance's access token and retries the request once.
+
+        Parameters:
+            method (str): HTTP method.
+            url (str): The request URL.
+            **kwargs: Passed through to aiohttp.ClientSession.request.
+
+        Returns:
+            tuple: The status code, the response text, and the parsed JSON body (or None).
+        """
+        session = self._get_session()
+        retry_policy = self.emails.transport.get_retry_policy("graph")
+        rate_limiter = get_rate_limiter("graph", url)
+
+        started = time.perf_counter()
+        throttle_wait = 0.0
+        rate_limit_wait = 0.0
+
+        attempt = 0
+        renewed = False
+        async with self._semaphore:
+            while True:
+                attempt += 1
+                if rate_limiter is not None:
+                    reserved = rate_limiter.reserve()
+                    rate_limit_wait += reserved
+                    await asyncio.sleep(reserved)
+
+                sent_headers = kwargs.get("headers") or {}
+                try:
+                    async with session.request(method, url, **kwargs) as response:
+                        text = await response.text()
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    # As in the transport, only idempotent requests are resent after a dropped connection or timeout
+                    wait = retry_policy.get_error_wait(attempt, method)
+                    if wait is None:
+                        if instrumentation.is_enabled():
+                            instrumentation.record_http("graph", method, url, None, started, attempt - 1, throttle_wait, rate_limit_wait, error=e)
+                        raise
+                    await asyncio.sleep(wait)
+                    throttle_wait += wait
+                    continue
+
+                if response.status == 401 and not renewed:
+                    wait = 0
+                else:
+                    wait = retry_policy.get_status_wait(attempt, response.status, response.headers, method)
+                if wait is None:
+                    if instrumentation.is_enabled():
+                        instrumentation.record_http(
+                            "graph", method, url, response.status, started, attempt - 1, throttle_wait, rate_limit_wait,
+                            bytes_sent=instrumentation.body_size(kwargs.get("data")), bytes_received=len(text.encode()),
+                        )
+                    try:
+                        data = json.loads(text) if text else None
+                    except json.JSONDecodeError:
+                        data = None
+                    return response.status, text, data
+
+                if response.status == 401:
+                    # Renew the rejected token off the event loop, then retry once with the new one
+                    renewed = True
+                    stale_token = sent_headers.get("Authorization", "")[len("Bearer "):]
+                    await asyncio.to_thread(self.emails._renew_access_token, stale_token)
+                    kwargs["headers"] = {**sent_headers, **await self._auth_headers()}
+                    continue
+
+                await asyncio.sleep(wait)
+                throttle_wait += wait
+
+    async def search_message_by_subject_and_sender(self, subject, sender_email, only_search_inbox=True, only_return_latest=True, shared_mailbox_email=None):
+        """
+        Searches for an email by its subject and sender's email, newest first.
+
+        Results are ordered by the server, so when only the latest message is wanted a
+        single one-message page is requested; otherwise every page is followed.
+
+        Parameters:
+            subject (str): The subject of the email to search for.
+            sender_email (str): The email address of the sender of the email.
+            only_search_inbox (bool): Defaults to True. Limits search to only the main inbox.
+            only_return_latest (bool): Defaults to True. If True, returns the ID of the latest message.
+            shared_mailbox_email (str): Optional. The email address of the shared mailbox to search in.
+
+        Returns:
+            str or list: The ID of the latest email or a list of emails that match the search criteria.
+        """
+        mailbox_id = self._mailbox_id(shared_mailbox_email)
+
+        query = MessageQuery(folder="Inbox" if only_search_inbox else None).subject_equals(subject).from_senders(sender_email)
+        query_parameters, extra_headers = query.build()
+        query_parameters['$top'] = 1 if only_return_latest else 50
+        order_by_in_filter(query_parameters)
+
+        if query.folder:
+            endpoint = f"{self.GRAPH_URL}/users/{mailbox_id}/mailFolders/{query.folder}/messages"
+        else:
+            endpoint = f"{self.GRAPH_URL}/users/{mailbox_id}/messages"
+
+        messages = []
+        while endpoint:
+            headers = {**await self._auth_headers(), **extra_headers}
+            status, text, data = await self._request("GET", endpoint, headers=headers, params=query_parameters)
+            if status != 200:
+                raise Exception(f"Error searching message by subject: {data or text}")
+
+            messages.extend(data.get('value', []))
+            if only_return_latest:
+                break
+
+            # Update the endpoint for the next page, if any
+            endpoint = data.get('@odata.nextLink')
+            query_parameters = None
+
+        if messages:
+            if only_return_latest:
+                return messages[0]['id']
+            else:
+                return messages
+
+        raise Exception("No matching messages found.")
+
+    async def get_attachment_ids_and_names(self, message_id, shared_mailbox_email=None):
+        """
+        Retrieves a list of attachment IDs and names for a specified email message.
+
+        Parameters:
+            message_id (str): The ID of the email message whose attachments are to be retrieved.
+            shared_mailbox_email (str): Optional. The email address of the shared mailbox to retrieve attachments from.
+
+        Returns:
+            list of tuple: A list of tuples, where each tuple contains the ID and name of an attachment.
+        """
+        url = f"{self.GRAPH_URL}/users/{self._mailbox_id(shared_mailbox_email)}/messages/{message_id}/attachments"
+
+        # Only list the metadata, so the content of every attachment isn't downloaded too
+        status, text, data = await self._request("GET", url, headers=await self._auth_headers('application/json'), params={'$select': ATTACHMENT_METADATA_FIELDS})
+        if status != 200:
+            raise Exception(f"Failed to get attachments. Status code: {status}, Response: {text}")
+
+        return [(attachment['id'], attachment['name']) for attachment in data.get('value', [])]
+
+    async def download_attachment(self, message_id, attachment_id, is_binary=False, encoding='utf-8', shared_mailbox_email=None):
+        """
+        Downloads an attachment from an email.
+
+        Parameters:
+            message_id (str): The ID of the message from which the attachment is to be downloaded.
+            attachment_id (str): The ID of the attachment to be downloaded.
+            is_binary (bool): Flag indicating whether the attachment is a binary file. Default is False.
+            encoding (str): The encoding used to decode the attachment's content. Ignored if is_binary is True. Default is 'utf-8'.
+            shared_mailbox_email (str): Optional. The email address of the shared mailbox to retrieve the attachment from.
+
+        Returns:
+            bytes or str: The content of the attachment, either as a byte string (for binary files) or a decoded string (for text files).
+        """
+        url = f"{self.GRAPH_URL}/users/{self._mailbox_id(shared_mailbox_email)}/messages/{message_id}/attachments/{attachment_id}"
+
+        status, text, data = await self._request("GET", url, headers=await self._auth_headers())
+        if status != 200:
+            raise Exception(f"Failed to download attachment. Status code: {status}, Response: {text}")
+
+        attachment_content = base64.b64decode(data["contentBytes"])
+        return attachment_content if is_binary else attachment_content.decode(encoding)
+
+    async def delete_email(self, message_id, shared_mailbox_email=None):
+        """
+        Deletes an email.
+
+        Parameters:
+            message_id (str): The ID of the message to be deleted.
+            shared_mailbox_email (str): Optional. The email address of the shared mailbox to delete the email from.
+
+        Returns:
+            bool: True if the email was successfully deleted. Raises an exception otherwise.
+        """
+        url = f"{self.GRAPH_URL}/users/{self._mailbox_id(shared_mailbox_email)}/messages/{message_id}"
+
+        status, text, _ = await self._request("DELETE", url, headers=await self._auth_headers('application/json'))
+        if status == 204:
+            return True
+        raise Exception(f"Failed to delete email. Status code: {status}, Response: {text}")
+
+    async def send_email(self, subject, content, email_addresses):
+        """
+        Sends a plain text email from the authenticated user.
+
+        Parameters:
+            subject (str): Email subject.
+            content (str): Email content.
+            email_addresses (list of str): Recipient email addresses.
+        """
+        url = f"{self.GRAPH_URL}/me/sendMail"
+
+        email = {
+            "message": {
+                "subject": subject,
+                "body": {
+                    "contentType": "Text",
+                    "content": content
+                },
+                "toRecipients": [{"emailAddress": {"address": address}} for address in email_addresses]
+            },
+            "saveToSentItems": "true"
+        }
+
+        status, text, _ = await self._request("POST", url, headers=await self._auth_headers('application/json'), data=json.dumps(email))
+        if status != 202:
+            raise Exception(f"Failed to send email. Status code: {status}")
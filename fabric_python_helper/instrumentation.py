@@ -0,0 +1,353 @@
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+
+# Path segments followed by an ID, which endpoint templates replace with {id}.
+ID_COLLECTIONS = {
+    "users", "messages", "mailFolders", "attachments", "groups", "dataflows", "datasets",
+    "refreshes", "transactions", "secrets", "childFolders",
+}
+
+# Listeners called with every event. Replaced rather than mutated so it can be read without a lock.
+_listeners = ()
+_listeners_lock = threading.Lock()
+
+# Whether notify() writes to logging instead of printing.
+_use_logging = False
+
+
+def add_listener(listener):
+    """
+    Registers a callable to receive every instrumentation event.
+
+    Listeners are called on the thread that made the request, so they should be quick
+    and must not raise. Events are dicts with a "type" of "http" or "poll".
+
+    HTTP events hold: api, method, endpoint (the URL path with IDs replaced by {id}),
+    status, latency, bytes_sent, bytes_received, retries, throttle_wait, rate_limit_wait,
+    error and timestamp. Poll events hold: refresher, object_id, refreshes, requests,
+    completed, latency, error and timestamp. Times are in seconds; for streamed
+    downloads the latency is to the response headers.
+
+    Parameters:
+        listener (callable): Called as listener(event), e.g. a MetricsCollector.
+    """
+    global _listeners
+    with _listeners_lock:
+        _listeners = _listeners + (listener,)
+
+
+def remove_listener(listener):
+    """
+    Unregisters a listener added with add_listener.
+
+    Parameters:
+        listener (callable): The listener to remove.
+    """
+    global _listeners
+    with _listeners_lock:
+        _listeners = tuple(existing for existing in _listeners if existing is not listener)
+
+
+def is_enabled():
+    """
+    Returns:
+        bool: Whether any listener is registered. Callers skip building events when it isn't.
+    """
+    return bool(_listeners)
+
+
+def emit(event):
+    """
+    Sends an event to every registered listener.
+
+    Parameters:
+        event (dict): The event.
+    """
+    for listener in _listeners:
+        try:
+            listener(event)
+        except Exception:
+            logging.getLogger(__name__).exception("Instrumentation listener failed.")
+
+
+def use_logging(enabled=True):
+    """
+    Switches the library's progress messages from print to the logging module.
+
+    Messages are logged to the module's logger (e.g. fabric_python_helper.graph_api) at
+    INFO, or WARNING and ERROR for problems, so they can be filtered by level or routed
+    to any handler.
+
+    Parameters:
+        enabled (bool): Whether to use logging. Defaults to True; False restores printing.
+    """
+    global _use_logging
+    _use_logging = enabled
+
+
+def notify(logger, level, message):
+    """
+    Prints a progress message, or logs it if use_logging() has been called.
+
+    Parameters:
+        logger (logging.Logger): The calling module's logger.
+        level (int): The logging level, e.g. logging.INFO.
+        message (str): The message.
+    """
+    if _use_logging:
+        logger.log(level, message)
+    else:
+        print(message)
+
+
+def endpoint_template(url):
+    """
+    Reduces a URL to its endpoint, so calls to the same endpoint can be grouped.
+
+    Parameters:
+        url (str): The request URL.
+
+    Returns:
+        str: The path with IDs replaced, e.g. /v1.0/users/{id}/messages/{id}/attachments.
+    """
+    segments = urlsplit(url).path.split("/")
+    for index in range(1, len(segments)):
+        if segments[index - 1] in ID_COLLECTIONS and segments[index] and not segments[index].startswith("$"):
+            segments[index] = "{id}"
+    return "/".join(segments)
+
+
+def body_size(body):
+    """
+    Parameters:
+        body: A request body.
+
+    Returns:
+        int: Its size in bytes, or None if it is streamed, e.g. from an open file.
+    """
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, bytearray, str)):
+        return len(body)
+    return None
+
+
+def record_http(api, method, url, status, started, retries=0, throttle_wait=0.0, rate_limit_wait=0.0, bytes_sent=None, bytes_received=None, error=None):
+    """
+    Emits an "http" event for a call. Only call it when is_enabled().
+
+    Parameters:
+        api (str): The API name, e.g. "graph".
+        method (str): The HTTP method.
+        url (str): The request URL.
+        status (int): The final status code, or None if the call raised.
+        started (float): time.perf_counter() when the call began.
+        retries (int): Number of retries made.
+        throttle_wait (float): Seconds spent waiting between retries.
+        rate_limit_wait (float): Seconds spent waiting on the client-side rate limiter.
+        bytes_sent (int): Optional. Size of the request body.
+        bytes_received (int): Optional. Size of the response body from its Content-Length.
+        error (Exception): Optional. The exception the call raised.
+    """
+    emit({
+        "type": "http",
+        "timestamp": time.time(),
+        "api": api,
+        "method": method.upper(),
+        "endpoint": endpoint_template(url),
+        "status": status,
+        "latency": time.perf_counter() - started,
+        "bytes_sent": bytes_sent,
+        "bytes_received": bytes_received,
+        "retries": retries,
+        "throttle_wait": throttle_wait,
+        "rate_limit_wait": rate_limit_wait,
+        "error": None if error is None else str(error),
+    })
+
+
+def record_poll(refresher, object_id, refreshes, requests, completed, started, error=None):
+    """
+    Emits a "poll" event for one status check of a dataflow or semantic model. Only called when is_enabled().
+
+    Parameters:
+        refresher (str): "dataflow" or "semantic_model".
+        object_id (str): The dataflow or semantic model ID.
+        refreshes (int): Number of refreshes checked.
+        requests (int): Number of history requests made.
+        completed (int): Number of the refreshes that had finished.
+        started (float): time.perf_counter() when the check began.
+        error (Exception): Optional. The exception the check raised.
+    """
+    emit({
+        "type": "poll",
+        "timestamp": time.time(),
+        "refresher": refresher,
+        "object_id": object_id,
+        "refreshes": refreshes,
+        "requests": requests,
+        "completed": completed,
+        "latency": time.perf_counter() - started,
+        "error": None if error is None else str(error),
+    })
+
+
+class MetricsCollector:
+    """
+    An in-memory listener that keeps recent events and summarises them by endpoint.
+
+    Example:
+        metrics = MetricsCollector()
+        add_listener(metrics)
+        ...
+        display(metrics.summary_to_pandas())
+        metrics.save_delta("Tables/request_metrics", spark)
+
+    Attributes:
+        max_events (int): Number of most recent events kept.
+    """
+
+    def __init__(self, max_events=100000):
+        """
+        Initializes an empty collector.
+
+        Parameters:
+            max_events (int): Number of most recent events to keep. Defaults to 100,000.
+        """
+        self.max_events = max_events
+        self._events = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock:
+            self._events.append(event)
+
+    def events(self, event_type=None):
+        """
+        Parameters:
+            event_type (str): Optional. Only return events of this type, "http" or "poll".
+
+        Returns:
+            list of dict: The kept events, oldest first.
+        """
+        with self._lock:
+            events = list(self._events)
+        if event_type:
+            events = [event for event in events if event["type"] == event_type]
+        return events
+
+    def clear(self):
+        """
+        Forgets every kept event.
+        """
+        with self._lock:
+            self._events.clear()
+
+    def summary(self):
+        """
+        Summarises the HTTP events by API, method and endpoint.
+
+        Returns:
+            list of dict: Per endpoint: calls, errors (no response or status >= 400), throttled (retried calls),
+                          latency_p50, latency_p99, latency_total, bytes_sent, bytes_received, retries,
+                          throttle_wait and rate_limit_wait.
+        """
+        groups = {}
+        for event in self.events("http"):
+            groups.setdefault((event["api"], event["method"], event["endpoint"]), []).append(event)
+
+        rows = []
+        for (api, method, endpoint), events in sorted(groups.items()):
+            latencies = sorted(event["latency"] for event in events)
+            rows.append({
+                "api": api,
+                "method": method,
+                "endpoint": endpoint,
+                "calls": len(events),
+                "errors": sum(1 for event in events if event["status"] is None or event["status"] >= 400),
+                "throttled": sum(1 for event in events if event["retries"]),
+                "latency_p50": statistics.median(latencies),
+                "latency_p99": latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)],
+                "latency_total": sum(latencies),
+                "bytes_sent": sum(event["bytes_sent"] or 0 for event in events),
+                "bytes_received": sum(event["bytes_received"] or 0 for event in events),
+                "retries": sum(event["retries"] for event in events),
+                "throttle_wait": sum(event["throttle_wait"] for event in events),
+                "rate_limit_wait": sum(event["rate_limit_wait"] for event in events),
+            })
+        return rows
+
+    def to_pandas(self, event_type="http"):
+        """
+        Parameters:
+            event_type (str): Type of events to include, "http" or "poll". Defaults to "http".
+
+        Returns:
+            pandas.DataFrame: One row per event.
+        """
+        import pandas as pd
+        return pd.DataFrame(self.events(event_type))
+
+    def summary_to_pandas(self):
+        """
+        Returns:
+            pandas.DataFrame: The summary, one row per endpoint.
+        """
+        import pandas as pd
+        return pd.DataFrame(self.summary())
+
+    def save_delta(self, table, spark, event_type="http", mode="append"):
+        """
+        Writes the kept events to a Delta table.
+
+        Parameters:
+            table (str): Table name, e.g. "request_metrics", or a path such as "Tables/request_metrics".
+            spark (SparkSession): The notebook's Spark session.
+            event_type (str): Type of events to write, "http" or "poll". Defaults to "http".
+            mode (str): Spark save mode. Defaults to "append".
+        """
+        events = self.events(event_type)
+        if not events:
+            return
+
+        writer = spark.createDataFrame(self.to_pandas(event_type)).write.format("delta").mode(mode)
+        if "/" in table:
+            writer.save(table)
+        else:
+            writer.saveAsTable(table)
+
+
+class OpenTelemetryListener:
+    """
+    A listener that turns each event into an OpenTelemetry span, for export to any OpenTelemetry backend.
+
+    Requires the opentelemetry-api package.
+    """
+
+    def __init__(self, tracer=None):
+        """
+        Parameters:
+            tracer (Tracer): Optional. The tracer to create spans with. Defaults to one named after this module.
+        """
+        if tracer is None:
+            from opentelemetry import trace
+            tracer = trace.get_tracer("fabric_python_helper")
+        self.tracer = tracer
+
+    def __call__(self, event):
+        end = time.time_ns()
+        start = end - int(event["latency"] * 1e9)
+
+        if event["type"] == "http":
+            name = f"{event['method']} {event['endpoint']}"
+        else:
+            name = f"poll {event['refresher']}"
+
+        attributes = {key: value for key, value in event.items() if key not in ("type", "timestamp", "latency") and value is not None}
+        span = self.tracer.start_span(name, start_time=start, attributes=attributes)
+        span.end(end_time=end)
@@ -0,0 +1,183 @@
+import os
+import sqlite3
+import threading
+
+
+class MailboxIndex:
+    """
+    A compact local index of mailbox messages kept up to date with Graph delta queries.
+
+    The index is a SQLite database holding the ID, subject, sender, received time and
+    attachment flag of each message, along with the deltaLink of every synced folder.
+    Emails.sync_mailbox() fills it, after which subject and sender lookups can be answered
+    locally without paging through the mailbox.
+
+    Attributes:
+        path (str): Path of the SQLite database, e.g. /lakehouse/default/Files/mail_index.db.
+    """
+
+    def __init__(self, path):
+        """
+        Opens the index, creating the database and its tables if needed.
+
+        Parameters:
+            path (str): Path of the SQLite database.
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+
+        with self._connection:
+            primary_key = [row[1] for row in sorted(self._connection.execute("PRAGMA table_info(messages)"), key=lambda row: row[5]) if row[5]]
+            if primary_key == ["mailbox", "id"]:
+                # Indexes from older versions keyed messages without their folder; rebuild them with a full sync
+                self._connection.execute("DROP TABLE messages")
+                self._connection.execute("DROP TABLE IF EXISTS delta_links")
+
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS messages (
+                    mailbox TEXT NOT NULL,
+                    folder TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    subject TEXT,
+                    sender TEXT,
+                    received_date_time TEXT,
+                    has_attachments INTEGER,
+                    PRIMARY KEY (mailbox, folder, id)
+                )
+                """
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS ix_messages_lookup ON messages (mailbox, folder, subject, sender, received_date_time)"
+            )
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS delta_links (
+                    mailbox TEXT NOT NULL,
+                    folder TEXT NOT NULL,
+                    delta_link TEXT NOT NULL,
+                    PRIMARY KEY (mailbox, folder)
+                )
+                """
+            )
+
+    def close(self):
+        """
+        Closes the database connection.
+        """
+        self._connection.close()
+
+    def get_delta_link(self, mailbox, folder):
+        """
+        Parameters:
+            mailbox (str): The user ID or shared mailbox email.
+            folder (str): The mail folder ID or well-known name.
+
+        Returns:
+            str: The deltaLink saved by the last sync of the folder, or None.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT delta_link FROM delta_links WHERE mailbox = ? AND folder = ?", (mailbox, folder)
+            ).fetchone()
+        return row[0] if row else None
+
+    def apply_changes(self, mailbox, folder, changed_messages, removed_ids, delta_link=None):
+        """
+        Applies one page of delta results, and optionally the final deltaLink, in a single transaction.
+
+        Parameters:
+            mailbox (str): The user ID or shared mailbox email.
+            folder (str): The mail folder ID or well-known name.
+            changed_messages (list of dict): Added or updated messages as returned by Graph.
+            removed_ids (list of str): IDs of messages removed from the folder.
+            delta_link (str): Optional. The deltaLink to resume the next sync from.
+        """
+        rows = [
+            (
+                mailbox,
+                folder,
+                message['id'],
+                message.get('subject'),
+                ((message.get('from') or {}).get('emailAddress') or {}).get('address', '').lower() or None,
+                message.get('receivedDateTime'),
+                None if 'hasAttachments' not in message else int(bool(message['hasAttachments'])),
+            )
+            for message in changed_messages
+        ]
+
+        with self._lock, self._connection:
+            # Delta results only include changed properties, so keep existing values that weren't returned
+            self._connection.executemany(
+                """
+                INSERT INTO messages (mailbox, folder, id, subject, sender, received_date_time, has_attachments)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (mailbox, folder, id) DO UPDATE SET
+                    subject = COALESCE(excluded.subject, messages.subject),
+                    sender = COALESCE(excluded.sender, messages.sender),
+                    received_date_time = COALESCE(excluded.received_date_time, messages.received_date_time),
+                    has_attachments = COALESCE(excluded.has_attachments, messages.has_attachments)
+                """,
+                rows,
+            )
+            self._connection.executemany(
+                "DELETE FROM messages WHERE mailbox = ? AND folder = ? AND id = ?", [(mailbox, folder, message_id) for message_id in removed_ids]
+            )
+            if delta_link:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO delta_links (mailbox, folder, delta_link) VALUES (?, ?, ?)", (mailbox, folder, delta_link)
+                )
+
+    def reset(self, mailbox, folder):
+        """
+        Forgets a folder's messages and deltaLink so that the next sync starts from scratch.
+
+        Parameters:
+            mailbox (str): The user ID or shared mailbox email.
+            folder (str): The mail folder ID or well-known name.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM messages WHERE mailbox = ? AND folder = ?", (mailbox, folder))
+            self._connection.execute("DELETE FROM delta_links WHERE mailbox = ? AND folder = ?", (mailbox, folder))
+
+    def search_message_by_subject_and_sender(self, mailbox, subject, sender_email, folder="Inbox", only_return_latest=True):
+        """
+        Looks up messages by subject and sender in the index.
+
+        Parameters:
+            mailbox (str): The user ID or shared mailbox email.
+            subject (str): The exact subject of the email.
+            sender_email (str): The email address of the sender.
+            folder (str): The mail folder ID or well-known name. Defaults to "Inbox".
+            only_return_latest (bool): Defaults to True. If True, returns the ID of the latest message.
+
+        Returns:
+            str or list: The ID of the latest email, or a list of matching messages (newest first) with
+                         id, subject, sender, receivedDateTime and hasAttachments.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                """
+                SELECT id, subject, sender, received_date_time, has_attachments
+                FROM messages
+                WHERE mailbox = ? AND folder = ? AND subject = ? AND sender = ?
+                ORDER BY received_date_time DESC
+                """,
+                (mailbox, folder, subject, sender_email.lower()),
+            ).fetchall()
+
+        if not rows:
+            raise Exception("No matching messages found.")
+
+        if only_return_latest:
+            return rows[0][0]
+
+        return [
+            {"id": row[0], "subject": row[1], "sender": row[2], "receivedDateTime": row[3], "hasAttachments": bool(row[4])}
+            for row in rows
+        ]
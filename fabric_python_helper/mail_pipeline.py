@@ -0,0 +1,362 @@
+import hashlib
+import logging
+import os
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from .instrumentation import notify
+
+logger = logging.getLogger(__name__)
+
+
+# Marks the end of the work for a stage's workers.
+_STOP = object()
+
+# Characters that can't appear in a file name on Windows or OneLake, including path separators.
+_UNSAFE_FILE_NAME_CHARACTERS = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+
+def _safe_file_name(name):
+    """
+    Makes an attachment name safe to use as a file name, so it can't write outside the target directory.
+
+    Parameters:
+        name (str): The attachment's name.
+
+    Returns:
+        str: The name with unsafe characters replaced by underscores.
+    """
+    name = _UNSAFE_FILE_NAME_CHARACTERS.sub("_", name or "").strip(" .")
+    return name or "attachment"
+
+
+class IngestionCheckpoint:
+    """
+    An append-only record of the messages a pipeline has persisted and deleted.
+
+    Each line holds a stage and a message ID, so re-running after an interruption skips
+    messages that were already persisted, and only finishes deleting them if needed.
+
+    Attributes:
+        path (str): Path of the checkpoint file, or None to keep it in memory only.
+        persisted (set): IDs of messages whose attachments have been persisted.
+        deleted (set): IDs of messages that have been deleted.
+    """
+
+    def __init__(self, path=None):
+        """
+        Loads the checkpoint file if it exists.
+
+        Parameters:
+            path (str): Optional. Path of the checkpoint file, e.g. /lakehouse/default/Files/checkpoints/feed.txt.
+        """
+        self.path = path
+        self.persisted = set()
+        self.deleted = set()
+        self._lock = threading.Lock()
+
+        if path and os.path.exists(path):
+            with open(path) as file:
+                for line in file:
+                    stage, _, message_id = line.rstrip("\n").partition("\t")
+                    if stage == "persisted":
+                        self.persisted.add(message_id)
+                    elif stage == "deleted":
+                        self.deleted.add(message_id)
+
+    def mark(self, stage, message_id):
+        """
+        Records that a message has completed a stage, flushing it to disk straight away.
+
+        Parameters:
+            stage (str): "persisted" or "deleted".
+            message_id (str): The ID of the message.
+        """
+        with self._lock:
+            getattr(self, stage).add(message_id)
+            if self.path:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.path, "a") as file:
+                    file.write(f"{stage}\t{message_id}\n")
+                    file.flush()
+                    os.fsync(file.fileno())
+
+
+class MailboxIngestionPipeline:
+    """
+    Searches a mailbox, downloads attachments, persists them and deletes the messages, with the stages running concurrently.
+
+    Each stage has its own pool of workers connected by bounded queues, so downloads overlap
+    with writes and a slow stage holds back the ones before it rather than filling memory.
+    Deletes are held back until the search has paged through every matching message, as
+    deleting messages from the result set being paged would shift later pages and skip messages.
+    Errors the transport doesn't retry itself are retried up to max_retries times before an
+    item is recorded as failed, and an IngestionCheckpoint lets an interrupted run resume
+    without redoing finished work.
+
+    Attributes:
+        emails (Emails): The authenticated Emails instance.
+        query (MessageQuery): The messages to ingest.
+        checkpoint (IngestionCheckpoint): Record of persisted and deleted messages.
+        results (dict): Counts and failures from the last run.
+    """
+
+    def __init__(self, emails, query, persist=None, target_directory=None, shared_mailbox_email=None, checkpoint_path=None,
+                 staging_directory=None, attachment_filter=None, download_workers=4, persist_workers=2, queue_size=16,
+                 max_retries=3, delete_after_persist=True):
+        """
+        Initializes the pipeline.
+
+        Parameters:
+            emails (Emails): An Emails instance that has been connected.
+            query (MessageQuery): The messages to ingest.
+            persist (callable): Optional. Called as persist(message, attachment, local_path) to store each attachment. Must be safe to repeat.
+            target_directory (str): Optional. Directory to copy attachments into when persist isn't given, e.g. /lakehouse/default/Files/landing.
+            shared_mailbox_email (str): Optional. The email address of the shared mailbox to ingest from.
+            checkpoint_path (str): Optional. File recording processed messages so that a re-run resumes where it stopped.
+            staging_directory (str): Optional. Local directory attachments are downloaded to before persisting. Defaults to a temporary directory.
+            attachment_filter (callable): Optional. Called with each attachment's metadata; only attachments it returns True for are ingested.
+            download_workers (int): Number of concurrent downloads. Defaults to 4.
+            persist_workers (int): Number of concurrent persist calls. Defaults to 2.
+            queue_size (int): Maximum number of messages waiting between stages. Defaults to 16.
+            max_retries (int): Number of times to retry an item in any stage after an error the transport doesn't retry itself. Defaults to 3.
+            delete_after_persist (bool): Whether to delete messages once their attachments are persisted. Defaults to True.
+        """
+        if persist is None and target_directory is None:
+            raise ValueError("Either persist or target_directory must be given.")
+
+        self.emails = emails
+        self.query = query
+        self.persist = persist or self._copy_to_target_directory
+        self.target_directory = target_directory
+        self.shared_mailbox_email = shared_mailbox_email
+        self.checkpoint = IngestionCheckpoint(checkpoint_path)
+        self.staging_directory = staging_directory
+        self.attachment_filter = attachment_filter
+        self.download_workers = download_workers
+        self.persist_workers = persist_workers
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.delete_after_persist = delete_after_persist
+        self.results = None
+
+        self._results_lock = threading.Lock()
+
+    def _copy_to_target_directory(self, message, attachment, local_path):
+        """
+        Default persist step: copies the attachment into target_directory.
+
+        Files are named by the message's received time, a short hash of the message and
+        attachment IDs, and the attachment's name, so attachments with the same name received
+        in the same second don't overwrite each other.
+        """
+        received = datetime.fromisoformat(message['receivedDateTime'].replace("Z", "+00:00")).strftime("%Y%m%dT%H%M%S")
+        key = hashlib.sha256(f"{message['id']}/{attachment['id']}".encode()).hexdigest()[:12]
+        os.makedirs(self.target_directory, exist_ok=True)
+        shutil.copyfile(local_path, os.path.join(self.target_directory, f"{received}_{key}_{_safe_file_name(attachment['name'])}"))
+
+    def _record(self, counter, failure=None):
+        with self._results_lock:
+            self.results[counter] += 1
+            if failure:
+                self.results["failures"].append(failure)
+
+    def _with_retries(self, function, *args):
+        """
+        Calls function, retrying errors the transport hasn't already retried, such as a
+        download cut off part way through or a failed persist, with the Graph retry policy's
+        jittered backoff.
+
+        Returns:
+            The function's result.
+        """
+        retry_policy = self.emails.transport.get_retry_policy("graph")
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return function(*args)
+            except Exception as e:
+                wait = retry_policy.get_exception_wait(attempt, e, self.max_retries)
+                if wait is None:
+                    raise
+                time.sleep(wait)
+
+    def _download_worker(self, download_queue, persist_queue, staging_directory):
+        """
+        Downloads every wanted attachment of each message to the staging directory.
+        """
+        while True:
+            message = download_queue.get()
+            if message is _STOP:
+                return
+
+            downloads = []
+            try:
+                attachments = message.get('attachments')
+                if attachments is None:
+                    attachments = self._with_retries(self.emails.get_attachments_metadata, message['id'], self.shared_mailbox_email)
+
+                for attachment in attachments:
+                    if self.attachment_filter and not self.attachment_filter(attachment):
+                        continue
+                    local_path = os.path.join(staging_directory, uuid.uuid4().hex)
+                    self._with_retries(
+                        lambda: self.emails.download_attachment_to_file(message['id'], attachment['id'], local_path, shared_mailbox_email=self.shared_mailbox_email)
+                    )
+                    downloads.append((attachment, local_path))
+            except Exception as e:
+                for _, local_path in downloads:
+                    os.remove(local_path)
+                self._record("failed", (message['id'], "download", str(e)))
+                continue
+
+            if not downloads:
+                # Nothing wanted on this message, so leave it in the mailbox
+                self._record("skipped")
+                continue
+
+            self._record("downloaded")
+            persist_queue.put((message, downloads))
+
+    def _persist_worker(self, persist_queue, delete_queue):
+        """
+        Persists each downloaded attachment, then passes the message on for deletion.
+        """
+        while True:
+            item = persist_queue.get()
+            if item is _STOP:
+                return
+
+            message, downloads = item
+            try:
+                for attachment, local_path in downloads:
+                    self._with_retries(self.persist, message, attachment, local_path)
+            except Exception as e:
+                self._record("failed", (message['id'], "persist", str(e)))
+                continue
+            finally:
+                for _, local_path in downloads:
+                    if os.path.exists(local_path):
+                        os.remove(local_path)
+
+            try:
+                self.checkpoint.mark("persisted", message['id'])
+            except Exception as e:
+                # Leave the message in the mailbox so a re-run persists it again
+                self._record("failed", (message['id'], "checkpoint", str(e)))
+                continue
+
+            self._record("persisted")
+            if self.delete_after_persist:
+                delete_queue.put(message['id'])
+
+    def _delete_worker(self, delete_queue):
+        """
+        Deletes messages in batches of up to Emails.BATCH_SIZE.
+        """
+        stopping = False
+        while not stopping:
+            message_ids = []
+            while len(message_ids) < self.emails.BATCH_SIZE:
+                try:
+                    # Wait briefly for a fuller batch, but don't hold messages back for long
+                    item = delete_queue.get(timeout=1 if message_ids else None)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                message_ids.append(item)
+
+            if not message_ids:
+                continue
+
+            try:
+                deleted = self._with_retries(self.emails.delete_emails, message_ids, self.shared_mailbox_email)
+            except Exception as e:
+                deleted = {}
+                error = str(e)
+            else:
+                error = "Message was not deleted."
+
+            for message_id in message_ids:
+                if deleted.get(message_id):
+                    try:
+                        self.checkpoint.mark("deleted", message_id)
+                    except Exception as e:
+                        self._record("failed", (message_id, "checkpoint", str(e)))
+                        continue
+                    self._record("deleted")
+                else:
+                    self._record("failed", (message_id, "delete", error))
+
+    def run(self):
+        """
+        Runs the pipeline until every matching message has been processed.
+
+        Returns:
+            dict: Counts of messages skipped, downloaded, persisted, deleted and failed, and a list of (message ID, stage, error) failures.
+        """
+        self.results = {"skipped": 0, "downloaded": 0, "persisted": 0, "deleted": 0, "failed": 0, "failures": []}
+
+        staging_directory = self.staging_directory or tempfile.mkdtemp(prefix="mail_pipeline_")
+        os.makedirs(staging_directory, exist_ok=True)
+
+        download_queue = queue.Queue(maxsize=self.queue_size)
+        persist_queue = queue.Queue(maxsize=self.queue_size)
+        # Unbounded as nothing is deleted until the search finishes; it only holds message IDs
+        delete_queue = queue.Queue()
+
+        download_threads = [threading.Thread(target=self._download_worker, args=(download_queue, persist_queue, staging_directory), daemon=True) for _ in range(self.download_workers)]
+        persist_threads = [threading.Thread(target=self._persist_worker, args=(persist_queue, delete_queue), daemon=True) for _ in range(self.persist_workers)]
+        delete_thread = threading.Thread(target=self._delete_worker, args=(delete_queue,), daemon=True)
+
+        for thread in download_threads + persist_threads:
+            thread.start()
+
+        try:
+            messages = self.emails.iter_messages(query=self.query, shared_mailbox_email=self.shared_mailbox_email, expand_attachments=True)
+            for message in messages:
+                message_id = message['id']
+                if message_id in self.checkpoint.deleted:
+                    self._record("skipped")
+                elif message_id in self.checkpoint.persisted:
+                    # Persisted by an earlier run that stopped before deleting it
+                    self._record("skipped")
+                    if self.delete_after_persist:
+                        delete_queue.put(message_id)
+                else:
+                    # Blocks while the download stage is full
+                    download_queue.put(message)
+        finally:
+            # Every matching message has been paged through, so deleting can't shift the results
+            delete_thread.start()
+
+            # Shut the stages down in order so every queued item is finished
+            for _ in download_threads:
+                download_queue.put(_STOP)
+            for thread in download_threads:
+                thread.join()
+
+            for _ in persist_threads:
+                persist_queue.put(_STOP)
+            for thread in persist_threads:
+                thread.join()
+
+            delete_queue.put(_STOP)
+            delete_thread.join()
+
+            if self.staging_directory is None:
+                shutil.rmtree(staging_directory, ignore_errors=True)
+
+        notify(logger, logging.INFO, f"Ingestion finished. {self.results['persisted']} persisted, {self.results['deleted']} deleted, {self.results['skipped']} skipped, {self.results['failed']} failed.")
+        return self.results
@@ -0,0 +1,262 @@
+from datetime import timezone
+
+# Attachment fields that can be listed without downloading the attachment content.
+ATTACHMENT_METADATA_FIELDS = 'id,name,contentType,size,lastModifiedDateTime'
+
+
+def escape_odata_string(value):
+    """
+    Escapes a value for use inside a single quoted OData string literal.
+
+    Parameters:
+        value (str): The raw value, e.g. a subject containing an apostrophe.
+
+    Returns:
+        str: The value with single quotes doubled.
+    """
+    return str(value).replace("'", "''")
+
+
+def escape_kql_phrase(value):
+    """
+    Escapes a value for use inside a double quoted KQL phrase in $search.
+
+    Parameters:
+        value (str): The raw value.
+
+    Returns:
+        str: The value with backslashes and double quotes escaped.
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def order_by_in_filter(parameters):
+    """
+    Makes a $filter usable with $orderby. Graph requires the properties in $orderby to also
+    appear first in $filter, so a filter that doesn't start with the first one is prefixed
+    with a condition on it that every message meets.
+
+    Parameters:
+        parameters (dict): Query parameters, updated in place.
+    """
+    filter = parameters.get('$filter')
+    order_by = parameters.get('$orderby')
+    if filter and order_by and not filter.startswith(order_by.split()[0]):
+        parameters['$filter'] = f"{order_by.split()[0]} ge 1900-01-01T00:00:00Z and ({filter})"
+
+
+def _format_datetime(value):
+    """
+    Formats a datetime or ISO string as a UTC timestamp for $filter or KQL.
+
+    Parameters:
+        value (datetime or str): The timestamp. Naive datetimes are treated as UTC.
+
+    Returns:
+        str: The timestamp, e.g. 2024-01-31T00:00:00Z.
+    """
+    if isinstance(value, str):
+        return value
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class MessageQuery:
+    """
+    Builds a server-side mail query for Emails.iter_messages.
+
+    Conditions are combined with "and". Simple conditions are sent as an OData $filter.
+    Graph can't combine $filter with $search on messages, so once a condition that needs
+    KQL is added (subject_contains, attachment_name or search) every condition is sent as
+    KQL in $search instead, and results come back newest first without $orderby.
+
+    Example:
+        query = MessageQuery().from_senders(["a@x.com", "b@x.com"]).received_between(start=datetime(2024, 1, 1)).has_attachments()
+
+    Attributes:
+        folder (str): Mail folder ID or well-known name, or None for the whole mailbox.
+    """
+
+    DEFAULT_SELECT = 'id,subject,from,receivedDateTime,parentFolderId,hasAttachments'
+
+    def __init__(self, folder="Inbox"):
+        """
+        Initializes an empty query.
+
+        Parameters:
+            folder (str): Mail folder ID or well-known name. Defaults to "Inbox"; None searches the whole mailbox.
+        """
+        self.folder = folder
+        self.select_fields = self.DEFAULT_SELECT
+        self.order_by = 'receivedDateTime desc'
+        self.count = False
+        self.expand_attachment_metadata = False
+
+        # Each condition is kept as both an OData and a KQL clause; None where one form isn't possible
+        self._received_conditions = []
+        self._conditions = []
+
+    def _add(self, odata_clause, kql_clause):
+        self._conditions.append((odata_clause, kql_clause))
+        return self
+
+    def in_folder(self, folder):
+        """
+        Parameters:
+            folder (str): Mail folder ID or well-known name, or None for the whole mailbox.
+        """
+        self.folder = folder
+        return self
+
+    def received_between(self, start=None, end=None):
+        """
+        Limits results to messages received on or after start and before end.
+
+        Parameters:
+            start (datetime or str): Optional. Earliest received time.
+            end (datetime or str): Optional. Received time to stop before.
+        """
+        if start is not None:
+            start = _format_datetime(start)
+            self._received_conditions.append((f"receivedDateTime ge {start}", f"received>={start}"))
+        if end is not None:
+            end = _format_datetime(end)
+            self._received_conditions.append((f"receivedDateTime lt {end}", f"received<{end}"))
+        return self
+
+    def has_attachments(self, value=True):
+        """
+        Parameters:
+            value (bool): Whether messages must (True) or must not (False) have attachments. Defaults to True.
+        """
+        return self._add(f"hasAttachments eq {str(value).lower()}", f"hasAttachments:{str(value).lower()}")
+
+    def subject_equals(self, subject):
+        """
+        Parameters:
+            subject (str): The exact subject.
+        """
+        return self._add(f"subject eq '{escape_odata_string(subject)}'", f'subject:"{escape_kql_phrase(subject)}"')
+
+    def subject_starts_with(self, prefix):
+        """
+        Parameters:
+            prefix (str): The start of the subject.
+        """
+        return self._add(f"startswith(subject, '{escape_odata_string(prefix)}')", f'subject:"{escape_kql_phrase(prefix)}*"')
+
+    def subject_contains(self, text):
+        """
+        Matches words or phrases anywhere in the subject. Switches the query to $search.
+
+        Parameters:
+            text (str): The text to look for.
+        """
+        return self._add(None, f'subject:"{escape_kql_phrase(text)}"')
+
+    def from_senders(self, sender_emails):
+        """
+        Parameters:
+            sender_emails (str or list of str): One or more sender email addresses, any of which may match.
+        """
+        if isinstance(sender_emails, str):
+            sender_emails = [sender_emails]
+        sender_emails = list(sender_emails)
+        if not sender_emails:
+            raise ValueError("from_senders needs at least one sender email address.")
+
+        odata_clause = " or ".join(f"from/emailAddress/address eq '{escape_odata_string(sender)}'" for sender in sender_emails)
+        kql_clause = " OR ".join(f'from:"{escape_kql_phrase(sender)}"' for sender in sender_emails)
+        if len(sender_emails) > 1:
+            odata_clause, kql_clause = f"({odata_clause})", f"({kql_clause})"
+        return self._add(odata_clause, kql_clause)
+
+    def attachment_name(self, name):
+        """
+        Matches messages with an attachment of this name. Switches the query to $search.
+
+        Parameters:
+            name (str): The attachment file name, e.g. "report.csv".
+        """
+        return self._add(None, f'attachment:"{escape_kql_phrase(name)}"')
+
+    def search(self, kql):
+        """
+        Adds a raw KQL condition, e.g. 'body:"invoice"'. Switches the query to $search.
+
+        Parameters:
+            kql (str): The KQL expression, escaped by the caller.
+        """
+        return self._add(None, kql)
+
+    def select(self, fields):
+        """
+        Parameters:
+            fields (str): Comma separated fields to return.
+        """
+        self.select_fields = fields
+        return self
+
+    def expand_attachments(self, value=True):
+        """
+        Includes attachment metadata (not content) in an "attachments" list on each message.
+
+        Parameters:
+            value (bool): Whether to expand attachments. Defaults to True.
+        """
+        self.expand_attachment_metadata = value
+        return self
+
+    def with_count(self, value=True):
+        """
+        Requests the total number of matches in @odata.count on the first page.
+
+        Parameters:
+            value (bool): Whether to include the count. Defaults to True.
+        """
+        self.count = value
+        return self
+
+    def uses_search(self):
+        """
+        Returns:
+            bool: Whether the query has to be sent as KQL $search.
+        """
+        return any(odata_clause is None for odata_clause, _ in self._conditions)
+
+    def build(self):
+        """
+        Builds the query parameters and any extra headers the query needs.
+
+        Returns:
+            tuple: A dict of query parameters and a dict of extra request headers.
+        """
+        conditions = self._received_conditions + self._conditions
+        parameters = {}
+        headers = {}
+
+        if self.uses_search():
+            if conditions:
+                kql = " AND ".join(kql_clause for _, kql_clause in conditions)
+                parameters['$search'] = f'"{escape_kql_phrase(kql)}"'
+        else:
+            if conditions:
+                # Received date conditions come first so they can also serve the $orderby requirement
+                parameters['$filter'] = " and ".join(odata_clause for odata_clause, _ in conditions)
+            if self.order_by:
+                parameters['$orderby'] = self.order_by
+
+        if self.select_fields:
+            parameters['$select'] = self.select_fields
+
+        if self.expand_attachment_metadata:
+            parameters['$expand'] = f"attachments($select={ATTACHMENT_METADATA_FIELDS})"
+
+        if self.count:
+            parameters['$count'] = 'true'
+            if self.uses_search():
+                # Counting search results is an advanced query
+                headers['ConsistencyLevel'] = 'eventual'
+
+        return parameters, headers
@@ -0,0 +1,243 @@
+import json
+import logging
+import os
+import queue
+import time
+
+from .pbi_admin import Dataflows, SemanticModels, RefreshPoller
+from .instrumentation import notify
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshOrchestrator:
+    """
+    Refreshes a dependency graph of dataflows and semantic models in parallel.
+
+    Each node is started as soon as all of its upstream nodes have refreshed successfully.
+    Concurrency is capped overall and per group (a workspace or capacity), and when more nodes
+    are ready than there are free slots, the ones expected to take longest start first so that
+    the critical path isn't held up behind short refreshes. Refreshes are started without
+    waiting for them and followed by a single RefreshPoller, which checks refreshes of the
+    same dataflow or semantic model with one request, so no thread is held per refresh.
+
+    Attributes:
+        max_concurrency (int): Maximum number of refreshes running at once.
+        max_concurrency_per_group (int): Maximum number of refreshes running at once in each group.
+        history_path (str): Optional. JSON file holding past refresh durations, e.g. a lakehouse file path.
+        durations (dict): Expected duration in seconds of each node, by node name.
+        results (dict): Outcome of each node after run(), by node name.
+    """
+
+    SUCCESS_STATUSES = {"Success", "Completed"}
+
+    def __init__(self, max_concurrency=8, max_concurrency_per_group=4, history_path=None, loop_interval=10):
+        """
+        Initializes the orchestrator.
+
+        Parameters:
+            max_concurrency (int): Maximum number of refreshes running at once. Defaults to 8.
+            max_concurrency_per_group (int): Maximum number of refreshes running at once per group. Defaults to 4.
+            history_path (str): Optional. JSON file to load past durations from and save them back to after a run.
+            loop_interval (int): Interval between status checks for each refresh. Defaults to 10 seconds.
+        """
+        if max_concurrency < 1 or max_concurrency_per_group < 1:
+            raise ValueError("max_concurrency and max_concurrency_per_group must both be at least 1.")
+
+        self.max_concurrency = max_concurrency
+        self.max_concurrency_per_group = max_concurrency_per_group
+        self.history_path = history_path
+        self.loop_interval = loop_interval
+
+        self.nodes = {}
+        self.durations = {}
+        self.results = {}
+
+        if history_path and os.path.exists(history_path):
+            try:
+                with open(history_path) as f:
+                    durations = json.load(f)
+                if not isinstance(durations, dict):
+                    raise ValueError("Expected durations by node name.")
+                self.durations = durations
+            except ValueError as e:
+                # Durations only order the refreshes, so a damaged file just means starting without them
+                notify(logger, logging.WARNING, f"Ignoring refresh history in {history_path} as it couldn't be read. Error: {e}")
+
+    def add(self, name, refresher, depends_on=None, group=None, expected_duration=None):
+        """
+        Adds a dataflow or semantic model to the graph.
+
+        Parameters:
+            name (str): Unique name of the node, used in depends_on and in the results.
+            refresher (Dataflows or SemanticModels): The object to refresh.
+            depends_on (list of str): Optional. Names of nodes that must refresh successfully first.
+            group (str): Optional. Concurrency group, e.g. a capacity name. Defaults to the dataflow's workspace ID, or "semantic_models".
+            expected_duration (int): Optional. Expected duration in seconds, used when there is no history for the node.
+        """
+        if name in self.nodes:
+            raise ValueError(f"A node named '{name}' has already been added.")
+
+        if not isinstance(refresher, (Dataflows, SemanticModels)):
+            raise TypeError("refresher must be a Dataflows or SemanticModels instance.")
+
+        if group is None:
+            group = refresher.workspace_id if isinstance(refresher, Dataflows) else "semantic_models"
+
+        self.nodes[name] = {
+            "refresher": refresher,
+            "depends_on": list(depends_on or []),
+            "group": group,
+        }
+
+        if expected_duration is not None and name not in self.durations:
+            self.durations[name] = expected_duration
+
+        return self
+
+    def _validate(self):
+        """
+        Checks that every dependency exists and that the graph has no cycles.
+        """
+        for name, node in self.nodes.items():
+            for upstream in node["depends_on"]:
+                if upstream not in self.nodes:
+                    raise ValueError(f"Node '{name}' depends on unknown node '{upstream}'.")
+
+        # Depth first search for cycles
+        visiting, visited = set(), set()
+
+        def visit(name, path):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle detected: {' -> '.join(path + [name])}")
+            visiting.add(name)
+            for upstream in self.nodes[name]["depends_on"]:
+                visit(upstream, path + [name])
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in self.nodes:
+            visit(name, [])
+
+    def _start_node(self, name, poller):
+        """
+        Requests a single refresh and starts tracking it.
+
+        Parameters:
+            name (str): Name of the node to refresh.
+            poller (RefreshPoller): The poller that follows the refresh.
+
+        Returns:
+            RefreshHandle: The handle for the refresh.
+        """
+        refresher = self.nodes[name]["refresher"]
+        expected_duration = self.durations.get(name, self.loop_interval)
+        return refresher.start_refresh(expected_duration=expected_duration, poller=poller)
+
+    def _node_result(self, handle):
+        """
+        Reads the outcome of a finished refresh.
+
+        Parameters:
+            handle (RefreshHandle): The finished refresh.
+
+        Returns:
+            dict: The status and timings of the refresh. refresh_duration is the service's own
+                  endTime - startTime, or None if it couldn't be read.
+        """
+        try:
+            status = handle.result()
+        except Exception as e:
+            status = str(e)
+
+        # The wall time includes the initial wait and the lag before completion is noticed
+        return {"status": status, "started": handle.started, "finished": handle.finished, "duration": handle.finished - handle.started, "refresh_duration": handle.refresh_duration()}
+
+    def _save_history(self):
+        """
+        Writes the expected durations back to history_path.
+
+        The file is written alongside history_path and moved into place once complete, so an
+        interrupted run never leaves it half written.
+        """
+        if self.history_path:
+            temp_path = f"{self.history_path}.partial"
+            with open(temp_path, "w") as f:
+                json.dump(self.durations, f, indent=4)
+            os.replace(temp_path, self.history_path)
+
+    def run(self):
+        """
+        Refreshes every node in dependency order, in parallel where possible.
+
+        Nodes whose upstream refresh didn't succeed are not started and get the status "Skipped".
+
+        Returns:
+            dict: The status, start and finish times, wall time duration and service-side refresh_duration of each node, by node name.
+        """
+        self._validate()
+        self.results = {}
+
+        pending = set(self.nodes)
+        running = {}
+        group_counts = {}
+
+        poller = RefreshPoller(loop_interval=self.loop_interval)
+        finished = queue.Queue()
+
+        while pending or running:
+            # Skip anything downstream of a failure
+            for name in sorted(pending):
+                failed = [u for u in self.nodes[name]["depends_on"] if u in self.results and self.results[u]["status"] not in self.SUCCESS_STATUSES]
+                if failed:
+                    notify(logger, logging.WARNING, f"Skipping {name} as upstream {', '.join(failed)} did not succeed.")
+                    self.results[name] = {"status": "Skipped", "started": None, "finished": None, "duration": None, "refresh_duration": None}
+                    pending.discard(name)
+
+            # Start ready nodes, longest expected duration first
+            ready = [name for name in pending if all(u in self.results for u in self.nodes[name]["depends_on"])]
+            ready.sort(key=lambda n: self.durations.get(n, 0), reverse=True)
+
+            for name in ready:
+                if len(running) >= self.max_concurrency:
+                    break
+                group = self.nodes[name]["group"]
+                if group_counts.get(group, 0) >= self.max_concurrency_per_group:
+                    continue
+
+                notify(logger, logging.INFO, f"Starting refresh of {name}.")
+                pending.discard(name)
+                try:
+                    handle = self._start_node(name, poller)
+                except Exception as e:
+                    self.results[name] = {"status": str(e), "started": None, "finished": time.time(), "duration": None, "refresh_duration": None}
+                    notify(logger, logging.INFO, f"{name} finished with status: {self.results[name]['status']}")
+                    continue
+
+                group_counts[group] = group_counts.get(group, 0) + 1
+                running[name] = handle
+                handle.add_done_callback(lambda _, name=name: finished.put(name))
+
+            if not running:
+                # Every node started this pass failed to start, so go round again to skip their downstream nodes
+                continue
+
+            name = finished.get()
+            handle = running.pop(name)
+            group_counts[self.nodes[name]["group"]] -= 1
+
+            result = self._node_result(handle)
+            self.results[name] = result
+            notify(logger, logging.INFO, f"{name} finished with status: {result['status']}")
+
+            # Only successful runs are representative of how long a refresh takes. The
+            # service's duration is used rather than the wall time, which includes the
+            # wait for the current estimate and so could never fall below it.
+            if result["status"] in self.SUCCESS_STATUSES and result["refresh_duration"] is not None:
+                previous = self.durations.get(name)
+                self.durations[name] = result["refresh_duration"] if previous is None else 0.5 * previous + 0.5 * result["refresh_duration"]
+
+        self._save_history()
+        return self.results
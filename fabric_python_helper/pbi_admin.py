@@ -1,14 +1,324 @@
-import msal
 import logging
-import requests
+import base64
+import threading
+from concurrent.futures import Future
 import json
 import time
-from notebookutils import mssparkutils
+import random
+import statistics
+from datetime import datetime
+from .credentials import get_default_provider
+from .transport import get_default_transport
+from . import instrumentation
+from .instrumentation import notify
+
+logger = logging.getLogger(__name__)
+
+# Allowance for clock differences with the Power BI service when deciding whether a page of history goes back past a request.
+CLOCK_SKEW_SECONDS = 30
+
+# Largest page of refresh history fetched when looking for a specific refresh.
+MAX_HISTORY_SEARCH = 100
+
+
+def _parse_time(value):
+    """
+    Parses an ISO 8601 timestamp from the Power BI API.
+
+    Parameters:
+        value (str): The timestamp, e.g. "2024-01-31T09:25:43.153Z".
+
+    Returns:
+        float: The timestamp as a unix time, or None if it is missing or can't be parsed.
+    """
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def _find_refresh(entries, refresh_ref, id_field, reaches_back, claimed_ids=()):
+    """
+    Finds the history entry for a specific refresh.
+
+    A refresh whose ID is known is only ever matched on it, and isn't found until it is
+    listed. Otherwise the refresh is the oldest entry that started after the request was
+    sent and isn't one of the refreshes already listed before it (refresh_ref's
+    "listed_ids") or tracked separately (claimed_ids). Its ID is then recorded on
+    refresh_ref so that later polls match it exactly.
+
+    Parameters:
+        entries (list of dict): Refresh history, newest first.
+        refresh_ref (dict): The "id" and "requested_at" time of the refresh, and optionally the "listed_ids" seen before it.
+        id_field (str): Name of the ID field in the history entries.
+        reaches_back (bool): Whether entries go back to before the refresh was requested.
+        claimed_ids (set of str): Optional. IDs of other tracked refreshes, which can't be this one.
+
+    Returns:
+        dict: The matching entry, or None if it can't be identified from entries.
+    """
+    if refresh_ref.get("id"):
+        for entry in entries:
+            if entry.get(id_field) == refresh_ref["id"]:
+                refresh_ref["id_confirmed"] = True
+                refresh_ref["entry"] = entry
+                return entry
+        return None
+
+    # Matching on start time is only safe once the page includes everything since the request
+    if not reaches_back:
+        return None
+
+    excluded_ids = set(refresh_ref.get("listed_ids") or ()) | set(claimed_ids)
+    match = None
+    for entry in entries:
+        started = _parse_time(entry.get("startTime"))
+        if started is not None and started >= refresh_ref["requested_at"] and entry.get(id_field) not in excluded_ids:
+            match = entry
+
+    if match is not None:
+        refresh_ref["id"] = match.get(id_field)
+        refresh_ref["id_confirmed"] = True
+        refresh_ref["entry"] = match
+    return match
+
+
+def _match_refresh_statuses(entries, refresh_refs, id_field, in_progress_status, is_full_history):
+    """
+    Reads the status of each tracked refresh from a page of refresh history.
+
+    Parameters:
+        entries (list of dict): Refresh history, newest first.
+        refresh_refs (list of dict): The refreshes to look for.
+        id_field (str): Name of the ID field in the history entries.
+        in_progress_status (str): Status reported while a refresh is running.
+        is_full_history (bool): Whether entries holds the whole history rather than just its newest page.
+
+    Returns:
+        list: A (status, is_complete) tuple per refresh, or None where a larger page of history is needed to find it.
+    """
+    oldest_start = _parse_time(entries[-1].get("startTime")) if entries else None
+
+    statuses = []
+    for refresh_ref in refresh_refs:
+        reaches_back = is_full_history or (oldest_start is not None and oldest_start < refresh_ref["requested_at"] - CLOCK_SKEW_SECONDS)
+
+        # Refreshes requested together mustn't be matched to the same entry
+        claimed_ids = {other["id"] for other in refresh_refs if other is not refresh_ref and other.get("id")}
+        entry = _find_refresh(entries, refresh_ref, id_field, reaches_back, claimed_ids)
+        if entry is not None:
+            status = entry.get("status")
+            statuses.append((status, status != in_progress_status))
+        elif reaches_back:
+            # The history goes back past the request, so the refresh simply hasn't been listed yet
+            statuses.append((in_progress_status, False))
+        else:
+            statuses.append(None)
+    return statuses
+
+
+def _completed_durations(entries, success_status):
+    """
+    Calculates how long each successful refresh in a page of history took.
+
+    Parameters:
+        entries (list of dict): Refresh history entries with startTime and endTime.
+        success_status (str): Status of a successful refresh.
+
+    Returns:
+        list of float: Durations in seconds.
+    """
+    durations = []
+    for entry in entries:
+        if entry.get("status") != success_status:
+            continue
+        started = _parse_time(entry.get("startTime"))
+        ended = _parse_time(entry.get("endTime"))
+        if started is not None and ended is not None and ended >= started:
+            durations.append(ended - started)
+    return durations
+
+
+def _refresh_stats(status, refresh_ref, schedule, poll_calls):
+    """
+    Summarises how a refresh was polled.
+
+    Parameters:
+        status (str): Final status of the refresh.
+        refresh_ref (dict): The refresh, including the last history entry seen for it.
+        schedule (PollSchedule): The schedule used to poll it.
+        poll_calls (int): Number of status checks made.
+
+    Returns:
+        dict: The status, poll_calls, duration, detection_lag (seconds between the refresh ending and it being seen), estimated_duration and p90_duration.
+    """
+    detected_at = time.time()
+    entry = refresh_ref.get("entry") or {}
+    started = _parse_time(entry.get("startTime"))
+    ended = _parse_time(entry.get("endTime"))
+
+    return {
+        "status": status,
+        "poll_calls": poll_calls,
+        "duration": ended - started if started is not None and ended is not None else None,
+        "detection_lag": max(detected_at - ended, 0) if ended is not None else None,
+        "estimated_duration": schedule.median,
+        "p90_duration": schedule.p90,
+    }
+
+
+class PollSchedule:
+    """
+    Decides how long to wait between refresh status checks.
+
+    Without history this is the fixed expected_duration then loop_interval schedule.
+    Given the durations of recent refreshes it sleeps until shortly before the median,
+    polls at a short interval scaled to the median until the 90th percentile, and then
+    backs off towards max_interval. All adaptive waits are jittered so parallel refreshes don't poll in step.
+
+    Attributes:
+        median (float): Median duration of recent refreshes, or None without history.
+        p90 (float): 90th percentile duration of recent refreshes, or None without history.
+    """
+
+    def __init__(self, expected_duration=30, loop_interval=10, durations=None, min_interval=2, max_interval=60, jitter=0.2):
+        """
+        Initializes the schedule.
+
+        Parameters:
+            expected_duration (int): Initial wait when there is no history. Defaults to 30 seconds.
+            loop_interval (int): Interval between checks when there is no history. Defaults to 10 seconds.
+            durations (list of float): Optional. Durations of recent successful refreshes in seconds.
+            min_interval (int): Shortest interval between checks. Defaults to 2 seconds.
+            max_interval (int): Longest interval between checks. Defaults to 60 seconds.
+            jitter (float): Fraction by which adaptive waits are randomly varied. Defaults to 0.2.
+        """
+        self.expected_duration = expected_duration
+        self.loop_interval = loop_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.median = None
+        self.p90 = None
+        self._interval = min_interval
+
+        if durations:
+            ordered = sorted(durations)
+            self.median = statistics.median(ordered)
+            self.p90 = ordered[min(int(0.9 * len(ordered)), len(ordered) - 1)]
+
+            # Check about twenty times over a typical run, within the interval limits
+            self._interval = min(max(0.05 * self.median, min_interval), max_interval)
+
+    def _jittered(self, seconds):
+        return max(seconds * random.uniform(1 - self.jitter, 1 + self.jitter), 0)
+
+    def first_wait(self):
+        """
+        Returns:
+            float: Seconds to wait after requesting the refresh before the first check.
+        """
+        if self.median is None:
+            return self.expected_duration
+        # Only jitter downwards so the first check never lands after the typical finish time
+        return 0.9 * self.median * random.uniform(1 - self.jitter, 1)
+
+    def next_wait(self, elapsed):
+        """
+        Parameters:
+            elapsed (float): Seconds since the refresh was requested.
+
+        Returns:
+            float: Seconds to wait before the next check.
+        """
+        if self.median is None:
+            return self.loop_interval
+
+        if elapsed < self.p90:
+            # Completion is likely soon, so check often
+            return self._jittered(self._interval)
+
+        # Overrunning, so back off gradually
+        self._interval = min(self._interval * 1.5, self.max_interval)
+        return self._jittered(self._interval)
+
 
 class AccessTokens:
-    def __init__(self):
+    """
+    Retrieves Power BI access tokens, caching them in-process until shortly before they expire.
+
+    Tokens are cached per (tenant, client, scope) and shared between all instances, as are
+    the MSAL applications used for service principal authentication, so the client secret is
+    only read from Key Vault when an application is first created.
+    """
+
+    # The scope for Power BI API
+    PBI_SCOPE = "https://analysis.windows.net/powerbi/api/.default"
+
+    # Lifetime assumed for tokens whose expiry can't be determined.
+    DEFAULT_TOKEN_LIFETIME = 3600
+
+    # Shared across instances so that every caller in the process benefits from the cache.
+    _token_cache = {}
+    _msal_apps = {}
+    _cache_lock = threading.Lock()
+
+    def __init__(self, renew_before_expiry=300, credentials=None):
+        """
+        Initializes the AccessTokens instance.
+
+        Parameters:
+            renew_before_expiry (int): Seconds before expiry at which a cached token is renewed. Defaults to 300.
+            credentials (CredentialProvider): Optional. Source of Key Vault secrets and notebook owner tokens. Defaults to the process-wide provider, which uses mssparkutils.
+        """
         # Setting up a logger for this class
         self.logger = logging.getLogger(__name__)
+        self.renew_before_expiry = renew_before_expiry
+        self.credentials = credentials or get_default_provider()
+
+    def _get_cached_token(self, key):
+        """
+        Returns a cached token if it is not within the renewal window of its expiry.
+
+        Parameters:
+            key (tuple): The (tenant, client, scope) cache key.
+
+        Returns:
+            str: The cached access token, or None if there isn't a usable one.
+        """
+        entry = self._token_cache.get(key)
+        if entry and entry[1] - self.renew_before_expiry > time.time():
+            return entry[0]
+        return None
+
+    @staticmethod
+    def _get_jwt_expiry(access_token):
+        """
+        Reads the exp claim from a JWT access token.
+
+        Parameters:
+            access_token (str): The JWT access token.
+
+        Returns:
+            float: The expiry as a unix timestamp, or None if it can't be read.
+        """
+        try:
+            payload = access_token.split(".")[1]
+            payload += "=" * (-len(payload) % 4)
+            return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+        except Exception:
+            return None
+
+    @classmethod
+    def clear_cache(cls):
+        """
+        Removes all cached tokens and MSAL applications, e.g. after rotating a client secret.
+        """
+        with cls._cache_lock:
+            cls._token_cache.clear()
+            cls._msal_apps.clear()
 
     def get_token_as_service_principal(self, tenant_id, client_id, akv_url, akv_secret_name):
         """
@@ -16,7 +326,8 @@ class AccessTokens:
 
         This method retrieves a client secret from Azure Key Vault and uses it
         to authenticate with Microsoft Azure as a service principal, obtaining
-        an access token for Power BI.
+        an access token for Power BI. The token is cached and returned again until
+        it is within renew_before_expiry seconds of expiring.
 
         Parameters:
             tenant_id (str): Azure tenant ID.
@@ -30,34 +341,54 @@ class AccessTokens:
         Raises:
             Exception: If the authentication fails or any other error occurs.
         """
+        key = (tenant_id, client_id, self.PBI_SCOPE)
+        access_token = self._get_cached_token(key)
+        if access_token:
+            return access_token
+
         try:
-            # Retrieve the client secret from Azure Key Vault
-            client_secret = mssparkutils.credentials.getSecret(akv_url, akv_secret_name)
+            with self._cache_lock:
+                # Another thread may have renewed the token while we waited for the lock
+                access_token = self._get_cached_token(key)
+                if access_token:
+                    return access_token
 
-            # Setting the authority URL for Azure AD
-            authority_url = f"https://login.microsoftonline.com/{tenant_id}/"
-            # The scope for Power BI API
-            scope = ["https://analysis.windows.net/powerbi/api/.default"]
-            
-            # Creating an MSAL application instance
-            app = msal.ConfidentialClientApplication(
-                client_id,
-                authority=authority_url,
-                validate_authority=True,
-                client_credential=client_secret
-            )
-            
-            # Acquiring the token for the client
-            result = app.acquire_token_for_client(scopes=scope)
-            
-            # Checking if the access token is in the result
-            if "access_token" in result:
-                return result["access_token"]
-            else:
-                # Log and raise an error if no access token is found
-                error_msg = f"Error in getAccessToken: {result.get('error')}, {result.get('error_description')}"
-                self.logger.error(error_msg)
-                raise Exception(error_msg)
+                app = self._msal_apps.get((tenant_id, client_id))
+                if app is None:
+                    # Retrieve the client secret from Azure Key Vault
+                    client_secret = self.credentials.get_secret(akv_url, akv_secret_name)
+
+                    # Setting the authority URL for Azure AD
+                    authority_url = f"https://login.microsoftonline.com/{tenant_id}/"
+
+                    # Imported on first use as it is slow to load and only needed here
+                    import msal
+
+                    # Creating an MSAL application instance, reused along with its token cache
+                    app = msal.ConfidentialClientApplication(
+                        client_id,
+                        authority=authority_url,
+                        validate_authority=True,
+                        client_credential=client_secret
+                    )
+                    self._msal_apps[(tenant_id, client_id)] = app
+
+                # Acquiring the token for the client
+                result = app.acquire_token_for_client(scopes=[self.PBI_SCOPE])
+
+                # Checking if the access token is in the result
+                if "access_token" in result:
+                    expires_in = result.get("expires_in", self.DEFAULT_TOKEN_LIFETIME)
+                    self._token_cache[key] = (result["access_token"], time.time() + float(expires_in))
+                    return result["access_token"]
+                else:
+                    # Drop the app so the secret is read again next time, in case it has been rotated
+                    self._msal_apps.pop((tenant_id, client_id), None)
+
+                    # Log and raise an error if no access token is found
+                    error_msg = f"Error in getAccessToken: {result.get('error')}, {result.get('error_description')}"
+                    self.logger.error(error_msg)
+                    raise Exception(error_msg)
         except Exception as e:
             # Log and re-raise any exceptions that occur
             self.logger.error(f"Error in as_service_principal: {str(e)}")
@@ -67,8 +398,9 @@ class AccessTokens:
         """
         Retrieves an access token as the notebook owner in Fabric.
 
-        This method obtains an access token for Power BI by using the mssparkutils function, 
-        assuming that the notebook is running as a Fabric notebook.
+        This method obtains an access token for Power BI from the credential provider, which
+        uses mssparkutils by default, assuming that the notebook is running as a Fabric notebook.
+        The token is cached until it is within renew_before_expiry seconds of the expiry in its exp claim.
 
         Returns:
             str: An access token for Power BI API.
@@ -76,10 +408,23 @@ class AccessTokens:
         Raises:
             Exception: If retrieving the access token fails.
         """
-        try:
-            # Get the access token using Databricks utilities
-            access_token = mssparkutils.credentials.getToken("pbi")
+        key = (None, self.credentials, self.PBI_SCOPE)
+        access_token = self._get_cached_token(key)
+        if access_token:
             return access_token
+
+        try:
+            with self._cache_lock:
+                access_token = self._get_cached_token(key)
+                if access_token:
+                    return access_token
+
+                # Get the access token using Fabric utilities
+                access_token = self.credentials.get_token("pbi")
+
+                expires_at = self._get_jwt_expiry(access_token) or time.time() + self.DEFAULT_TOKEN_LIFETIME
+                self._token_cache[key] = (access_token, expires_at)
+                return access_token
         except Exception as e:
             # Log and re-raise any exceptions that occur
             self.logger.error(f"Error in as_fabric_notebook_owner: {str(e)}")
@@ -88,8 +433,10 @@ class AccessTokens:
 class Dataflows:
     # Base URL for Power BI API calls
     BASE_URL = "https://api.powerbi.com/v1.0/myorg/groups/"
+    # Status the transactions API reports while a refresh is running
+    IN_PROGRESS_STATUS = "InProgress"
 
-    def __init__(self, workspace_id, dataflow_id, access_token, refresh_body={"notifyOption": "NoNotification"}):
+    def __init__(self, workspace_id, dataflow_id, access_token, refresh_body={"notifyOption": "NoNotification"}, transport=None):
         """
         Initializes the dataflow refresher instance with necessary parameters.
 
@@ -98,31 +445,41 @@ class Dataflows:
             dataflow_id (str): The ID of the Power BI dataflow.
             access_token (str): Access token for Power BI API authentication.
             refresh_body (dict): The request body for the refresh. Defaults to no notification.
+            transport (HttpTransport): Optional. Shared transport to send requests through. Defaults to the process-wide transport.
         """
         self.workspace_id = workspace_id
         self.dataflow_id = dataflow_id
         self.access_token = access_token
         self.refresh_body = refresh_body
+        self.transport = transport or get_default_transport()
+        self.last_refresh = None
+        self.last_refresh_stats = None
 
     def _send_refresh_request(self):
         """
         Sends a refresh request to the Power BI API for the specified dataflow.
 
+        The refresh is recorded in last_refresh. The API doesn't return the transaction ID,
+        so the transactions already listed are noted first, and the refresh is identified
+        on the first poll as the oldest new transaction that started after the request.
+
         Returns:
-            Response: The response object from the requests.post call.
+            Response: The response object from the POST call.
         """
         # Constructing the refresh endpoint URL
         refresh_endpoint = f"{self.BASE_URL}{self.workspace_id}/dataflows/{self.dataflow_id}/refreshes"
         
         # Setting up the request headers
-        headers = {
-            "Authorization": f"Bearer {self.access_token}",
-            "Content-Type": "application/json"
-        }
+        headers = self.transport.auth_headers(self.access_token, "application/json")
+
+        listed_ids = self._get_listed_transaction_ids()
 
         # Making a POST request to start the refresh
-        response = requests.post(refresh_endpoint, headers=headers, json=self.refresh_body)
+        requested_at = time.time()
+        response = self.transport.post(refresh_endpoint, headers=headers, json=self.refresh_body)
         response.raise_for_status()  # Raises an HTTPError if the HTTP request returned an unsuccessful status code
+
+        self.last_refresh = {"id": None, "requested_at": requested_at, "listed_ids": listed_ids}
         
         return response
 
@@ -137,21 +494,24 @@ class Dataflows:
             str: The result of the refresh request handling.
         """
         if response.ok:
-            print("Refresh requested successfully.")
+            notify(logger, logging.INFO, "Refresh requested successfully.")
             return "Refresh started"
         elif response.status_code == 404:
             error_message = "Resource Not Found. Check the WorkspaceId and DataflowId."
-            print(error_message)
+            notify(logger, logging.ERROR, error_message)
             raise Exception(f"Refresh Request Failed: {error_message}")
         else:
             error_message = f"Request failed with status code: {response.status_code}"
-            print(error_message)
+            notify(logger, logging.ERROR, error_message)
             raise Exception(f"Refresh Request Failed: {error_message}")
 
-    def _get_transaction_status(self):
+    def _get_transaction_status(self, top=1):
         """
         Gets the transaction status of the dataflow refresh.
 
+        Parameters:
+            top (int): Number of the most recent transactions to return. Defaults to 1.
+
         Returns:
             dict: The JSON response from the transaction status request.
         """
@@ -159,16 +519,32 @@ class Dataflows:
         transaction_endpoint = f"{self.BASE_URL}{self.workspace_id}/dataflows/{self.dataflow_id}/transactions"
         
         # Setting up the request headers
-        headers = {
-            "Authorization": f"Bearer {self.access_token}",
-        }
+        headers = self.transport.auth_headers(self.access_token)
 
         # Making a GET request to retrieve the transaction status
-        response = requests.get(transaction_endpoint, headers=headers)
+        response = self.transport.get(transaction_endpoint, headers=headers, params={"$top": top})
         response.raise_for_status()
         
         return response
 
+    def _get_listed_transaction_ids(self, top=10):
+        """
+        Gets the IDs of the newest transactions, so that a refresh requested next isn't mistaken for one of them.
+
+        Parameters:
+            top (int): Number of the most recent transactions to note. Defaults to 10.
+
+        Returns:
+            list of str: The transaction IDs, or an empty list if they couldn't be fetched.
+        """
+        try:
+            result = self._handle_transaction_response(self._get_transaction_status(top))
+        except Exception as e:
+            # Only refreshes started after the request are matched, so this just loses the guard against overlapping ones
+            notify(logger, logging.WARNING, f"Couldn't list the dataflow's transactions before refreshing. Error: {e}")
+            return []
+        return [entry.get("id") for entry in result.get('value', []) if entry.get("id")]
+
     def _handle_transaction_response(self, response):
         """
         Handles the transaction response from the Power BI API.
@@ -184,21 +560,133 @@ class Dataflows:
                 return response.json()
             else:
                 error_message = f"Transaction Request failed with status code: {response.status_code}"
-                print(error_message)
+                notify(logger, logging.ERROR, error_message)
                 raise Exception(f"Refresh Request Failed: {error_message}")
         except json.JSONDecodeError:
             error_message = f"Invalid JSON response. Status Code: {response.status_code}. Response Text: {response.text}"
-            print(error_message)
+            notify(logger, logging.ERROR, error_message)
             raise Exception(f"Refresh Request Failed: {error_message}")
 
-    def refresh_dataflow(self, expected_duration=30, wait_for_completion=True, loop_interval=10):
+    def _check_refresh_statuses(self, refresh_refs):
+        """
+        Polls the status of one or more refreshes of this dataflow with a single request where possible.
+
+        Only the newest transactions are fetched. The page is widened only if a tracked
+        refresh has been pushed down the history by newer ones.
+
+        Parameters:
+            refresh_refs (list of dict): The refreshes to check, as recorded in last_refresh.
+
+        Returns:
+            list of tuple: The status string and whether the refresh has finished, per refresh.
+        """
+        started = time.perf_counter()
+        requests = 0
+
+        # Refreshes not yet identified need one older entry to show nothing was missed
+        top = max(len(refresh_refs), 1) + (0 if all(ref.get("id_confirmed") for ref in refresh_refs) else 1)
+        try:
+            while True:
+                requests += 1
+                transaction_status = self._get_transaction_status(top)
+                result = self._handle_transaction_response(transaction_status)
+
+                entries = result.get('value', [])
+                statuses = _match_refresh_statuses(entries, refresh_refs, "id", self.IN_PROGRESS_STATUS, len(entries) < top)
+                if None not in statuses:
+                    break
+                if top >= MAX_HISTORY_SEARCH:
+                    raise Exception(f"Refresh Request Failed: Couldn't find the refresh in the last {top} transactions.")
+                top = min(top * 10, MAX_HISTORY_SEARCH)
+        except Exception as e:
+            if instrumentation.is_enabled():
+                instrumentation.record_poll("dataflow", self.dataflow_id, len(refresh_refs), requests, 0, started, e)
+            raise
+
+        if instrumentation.is_enabled():
+            completed = sum(1 for _, is_complete in statuses if is_complete)
+            instrumentation.record_poll("dataflow", self.dataflow_id, len(refresh_refs), requests, completed, started)
+        return statuses
+
+    def _check_refresh_status(self, refresh_ref=None):
+        """
+        Polls the status of the dataflow refresh once.
+
+        Parameters:
+            refresh_ref (dict): Optional. The refresh to check. Defaults to the last refresh requested by this instance.
+
+        Returns:
+            tuple: The status string and whether the refresh has finished.
+        """
+        refresh_ref = refresh_ref or self.last_refresh
+        if refresh_ref is None:
+            # No refresh requested from here, so report the latest transaction
+            result = self._handle_transaction_response(self._get_transaction_status())
+            status = result['value'][0]['status']
+            return status, status != self.IN_PROGRESS_STATUS
+
+        return self._check_refresh_statuses([refresh_ref])[0]
+
+    def _poll_key(self):
+        """
+        Identifies the status endpoint polled for this dataflow, so that handles sharing it are polled once.
+
+        Returns:
+            tuple: The poll key.
+        """
+        return ("dataflow", self.workspace_id, self.dataflow_id)
+
+    def start_refresh(self, expected_duration=0, poller=None):
+        """
+        Starts a dataflow refresh and returns a handle without waiting for it to finish.
+
+        Parameters:
+            expected_duration (int): Seconds to wait before the first status check. Defaults to 0.
+            poller (RefreshPoller): Optional. Poller that tracks the refresh. Defaults to the process-wide poller.
+
+        Returns:
+            RefreshHandle: A future-like handle whose result() is the final status of the refresh.
+        """
+        refresh_response = self._send_refresh_request()
+        self._handle_refresh_response(refresh_response)
+
+        poller = poller or get_default_poller()
+        return poller.track(self, expected_duration, self.last_refresh)
+
+    def _get_refresh_durations(self, top=20):
+        """
+        Gets the durations of recent successful refreshes of the dataflow.
+
+        The refresh has already been requested when this is called, so a failure is logged
+        rather than raised and the fixed polling schedule is used instead.
+
+        Parameters:
+            top (int): Number of recent transactions to look at. Defaults to 20.
+
+        Returns:
+            list of float: Durations in seconds, or None if the history couldn't be fetched.
+        """
+        try:
+            result = self._handle_transaction_response(self._get_transaction_status(top))
+        except Exception as e:
+            notify(logger, logging.WARNING, f"Couldn't get the dataflow's refresh history, so polling on the fixed schedule. Error: {e}")
+            return None
+        return _completed_durations(result.get('value', []), "Success")
+
+    def refresh_dataflow(self, expected_duration=30, wait_for_completion=True, loop_interval=10, adaptive_polling=False):
         """
         Initiates and optionally waits for the completion of a dataflow refresh.
 
+        With adaptive_polling the status checks are scheduled from the durations of recent
+        refreshes (see PollSchedule), and expected_duration and loop_interval are only used
+        when there is no history. Either way the number of status checks and the delay
+        between the refresh ending and it being detected are stored in last_refresh_stats.
+
         Parameters:
             expected_duration (int): Expected duration to wait before checking the status. Defaults to 30 seconds.
             wait_for_completion (bool): Whether to wait for the completion of the refresh. Defaults to True.
             loop_interval (int): Interval between status checks if waiting for completion. Defaults to 10 seconds.
+            adaptive_polling (bool): Whether to schedule status checks from refresh history. Defaults to False.
 
         Returns:
             str: The status of the dataflow refresh or error message.
@@ -210,34 +698,39 @@ class Dataflows:
             
             # If not waiting for completion, return the initial result
             if not wait_for_completion:
-                print("Refresh has started but completion won't be checked.")
+                notify(logger, logging.INFO, "Refresh has started but completion won't be checked.")
                 return result
             
-            print("Waiting for expected duration...")
+            refresh_ref = self.last_refresh
+            durations = self._get_refresh_durations() if adaptive_polling else None
+            schedule = PollSchedule(expected_duration, loop_interval, durations)
+
+            notify(logger, logging.INFO, "Waiting for expected duration...")
             # Wait for the expected duration before checking the status
-            time.sleep(expected_duration)
+            time.sleep(schedule.first_wait())
             
             # Loop to check the transaction status
+            poll_calls = 0
             while True:
-                transaction_status = self._get_transaction_status()
-                result = self._handle_transaction_response(transaction_status)
-                
-                # Check the status of the refresh
-                status = result['value'][0]['status']
-                if status != "InProgress":
-                    print(f"Dataflow refresh completed with status: {status}")
+                status, is_complete = self._check_refresh_status(refresh_ref)
+                poll_calls += 1
+                if is_complete:
+                    self.last_refresh_stats = _refresh_stats(status, refresh_ref, schedule, poll_calls)
+                    notify(logger, logging.INFO, f"Dataflow refresh completed with status: {status}")
                     return status
                 
-                print("Refresh is in progress. Waiting to check again...")
-                time.sleep(loop_interval)
+                notify(logger, logging.INFO, "Refresh is in progress. Waiting to check again...")
+                time.sleep(schedule.next_wait(time.time() - refresh_ref["requested_at"]))
         except Exception as e:
             return str(e)
 
 class SemanticModels:
     # Base URL for Power BI API calls
     BASE_URL = "https://api.powerbi.com/v1.0/myorg/datasets/"
+    # Status the refresh history API reports while a refresh is running
+    IN_PROGRESS_STATUS = "Unknown"
 
-    def __init__(self, semantic_model_id, access_token, refresh_body={"notifyOption": "NoNotification"}):
+    def __init__(self, semantic_model_id, access_token, refresh_body={"notifyOption": "NoNotification"}, transport=None):
         """
         Initializes the RefreshSemanticModel instance.
 
@@ -245,30 +738,43 @@ class SemanticModels:
             semantic_model_id (str): The ID of the semantic model to be refreshed.
             access_token (str): Access token for Power BI API authentication.
             refresh_body (dict): The request body for the refresh, defaults to no notification.
+            transport (HttpTransport): Optional. Shared transport to send requests through. Defaults to the process-wide transport.
         """
         self.semantic_model_id = semantic_model_id
         self.access_token = access_token
         self.refresh_body = refresh_body
+        self.transport = transport or get_default_transport()
+        self.last_refresh = None
+        self.last_refresh_stats = None
 
     def _send_refresh_request(self):
         """
         Sends a refresh request to the Power BI API for the specified semantic model.
 
+        The refresh is recorded in last_refresh, along with its request ID from the
+        RequestId or Location response header.
+
         Returns:
-            Response: The response object from the requests.post call.
+            Response: The response object from the POST call.
         """
         # Constructing the refresh endpoint URL
         refresh_endpoint = f"{self.BASE_URL}{self.semantic_model_id}/refreshes"
         
         # Setting up the request headers
-        headers = {
-            "Authorization": f"Bearer {self.access_token}",
-            "Content-Type": "application/json"
-        }
+        headers = self.transport.auth_headers(self.access_token, "application/json")
 
         # Making a POST request to start the refresh
-        response = requests.post(refresh_endpoint, headers=headers, json=self.refresh_body)
+        requested_at = time.time()
+        response = self.transport.post(refresh_endpoint, headers=headers, json=self.refresh_body)
         response.raise_for_status()  # Raises an HTTPError for failed requests
+
+        # The Location header ends with the refresh's request ID
+        request_id = response.headers.get("RequestId")
+        location = response.headers.get("Location")
+        if location:
+            request_id = location.rstrip("/").rsplit("/", 1)[-1]
+
+        self.last_refresh = {"id": request_id, "requested_at": requested_at}
         
         return response
 
@@ -283,21 +789,24 @@ class SemanticModels:
             str: The result of handling the refresh request.
         """
         if response.ok:
-            print("Refresh requested successfully.")
+            notify(logger, logging.INFO, "Refresh requested successfully.")
             return "Refresh started"
         elif response.status_code == 404:
             error_message = "Resource Not Found. Check the Semantic Model ID."
-            print(error_message)
+            notify(logger, logging.ERROR, error_message)
             raise Exception(f"Refresh Request Failed: {error_message}")
         else:
             error_message = f"Request failed with status code: {response.status_code}"
-            print(error_message)
+            notify(logger, logging.ERROR, error_message)
             raise Exception(f"Refresh Request Failed: {error_message}")
 
-    def _get_refresh_status(self):
+    def _get_refresh_status(self, top=1):
         """
         Gets the refresh status of the semantic model.
 
+        Parameters:
+            top (int): Number of the most recent refreshes to return. Defaults to 1.
+
         Returns:
             dict: The JSON response from the refresh status request.
         """
@@ -305,12 +814,10 @@ class SemanticModels:
         refresh_endpoint = f"{self.BASE_URL}{self.semantic_model_id}/refreshes"
         
         # Setting up the request headers
-        headers = {
-            "Authorization": f"Bearer {self.access_token}",
-        }
+        headers = self.transport.auth_headers(self.access_token)
 
         # Making a GET request to retrieve the refresh status
-        response = requests.get(refresh_endpoint, headers=headers)
+        response = self.transport.get(refresh_endpoint, headers=headers, params={"$top": top})
         response.raise_for_status()
         
         return response
@@ -330,21 +837,133 @@ class SemanticModels:
                 return response.json()
             else:
                 error_message = f"Refresh Status Request failed with status code: {response.status_code}"
-                print(error_message)
+                notify(logger, logging.ERROR, error_message)
                 raise Exception(f"Refresh Request Failed: {error_message}")
         except json.JSONDecodeError:
             error_message = f"Invalid JSON response. Status Code: {response.status_code}. Response Text: {response.text}"
-            print(error_message)
+            notify(logger, logging.ERROR, error_message)
             raise Exception(f"Refresh Request Failed: {error_message}")
 
-    def refresh_semantic_model(self, expected_duration=30, wait_for_completion=True, loop_interval=10):
+    def _check_refresh_statuses(self, refresh_refs):
+        """
+        Polls the status of one or more refreshes of this semantic model with a single request where possible.
+
+        Only the newest refreshes are fetched. The page is widened only if a tracked
+        refresh has been pushed down the history by newer ones.
+
+        Parameters:
+            refresh_refs (list of dict): The refreshes to check, as recorded in last_refresh.
+
+        Returns:
+            list of tuple: The status string and whether the refresh has finished, per refresh.
+        """
+        started = time.perf_counter()
+        requests = 0
+
+        # Refreshes not yet identified need one older entry to show nothing was missed
+        top = max(len(refresh_refs), 1) + (0 if all(ref.get("id_confirmed") for ref in refresh_refs) else 1)
+        try:
+            while True:
+                requests += 1
+                refresh_status = self._get_refresh_status(top)
+                result = self._handle_refresh_status_response(refresh_status)
+
+                entries = result.get("value", [])
+                statuses = _match_refresh_statuses(entries, refresh_refs, "requestId", self.IN_PROGRESS_STATUS, len(entries) < top)
+                if None not in statuses:
+                    break
+                if top >= MAX_HISTORY_SEARCH:
+                    raise Exception(f"Refresh Request Failed: Couldn't find the refresh in the last {top} refreshes.")
+                top = min(top * 10, MAX_HISTORY_SEARCH)
+        except Exception as e:
+            if instrumentation.is_enabled():
+                instrumentation.record_poll("semantic_model", self.semantic_model_id, len(refresh_refs), requests, 0, started, e)
+            raise
+
+        if instrumentation.is_enabled():
+            completed = sum(1 for _, is_complete in statuses if is_complete)
+            instrumentation.record_poll("semantic_model", self.semantic_model_id, len(refresh_refs), requests, completed, started)
+        return statuses
+
+    def _check_refresh_status(self, refresh_ref=None):
+        """
+        Polls the status of the semantic model refresh once.
+
+        Parameters:
+            refresh_ref (dict): Optional. The refresh to check. Defaults to the last refresh requested by this instance.
+
+        Returns:
+            tuple: The status string and whether the refresh has finished.
+        """
+        refresh_ref = refresh_ref or self.last_refresh
+        if refresh_ref is None:
+            # No refresh requested from here, so report the latest refresh
+            result = self._handle_refresh_status_response(self._get_refresh_status())
+            status = result["value"][0]["status"]
+            return status, status != self.IN_PROGRESS_STATUS
+
+        return self._check_refresh_statuses([refresh_ref])[0]
+
+    def _poll_key(self):
+        """
+        Identifies the status endpoint polled for this semantic model, so that handles sharing it are polled once.
+
+        Returns:
+            tuple: The poll key.
+        """
+        return ("semantic_model", self.semantic_model_id)
+
+    def start_refresh(self, expected_duration=0, poller=None):
+        """
+        Starts a semantic model refresh and returns a handle without waiting for it to finish.
+
+        Parameters:
+            expected_duration (int): Seconds to wait before the first status check. Defaults to 0.
+            poller (RefreshPoller): Optional. Poller that tracks the refresh. Defaults to the process-wide poller.
+
+        Returns:
+            RefreshHandle: A future-like handle whose result() is the final status of the refresh.
+        """
+        refresh_response = self._send_refresh_request()
+        self._handle_refresh_trigger_response(refresh_response)
+
+        poller = poller or get_default_poller()
+        return poller.track(self, expected_duration, self.last_refresh)
+
+    def _get_refresh_durations(self, top=20):
+        """
+        Gets the durations of recent successful refreshes of the semantic model.
+
+        The refresh has already been requested when this is called, so a failure is logged
+        rather than raised and the fixed polling schedule is used instead.
+
+        Parameters:
+            top (int): Number of recent refreshes to look at. Defaults to 20.
+
+        Returns:
+            list of float: Durations in seconds, or None if the history couldn't be fetched.
+        """
+        try:
+            result = self._handle_refresh_status_response(self._get_refresh_status(top))
+        except Exception as e:
+            notify(logger, logging.WARNING, f"Couldn't get the semantic model's refresh history, so polling on the fixed schedule. Error: {e}")
+            return None
+        return _completed_durations(result.get("value", []), "Completed")
+
+    def refresh_semantic_model(self, expected_duration=30, wait_for_completion=True, loop_interval=10, adaptive_polling=False):
         """
         Initiates and optionally waits for the completion of a semantic model refresh.
 
+        With adaptive_polling the status checks are scheduled from the durations of recent
+        refreshes (see PollSchedule), and expected_duration and loop_interval are only used
+        when there is no history. Either way the number of status checks and the delay
+        between the refresh ending and it being detected are stored in last_refresh_stats.
+
         Parameters:
             expected_duration (int): Expected duration to wait before checking the status. Defaults to 30 seconds.
             wait_for_completion (bool): Whether to wait for the completion of the refresh. Defaults to True.
             loop_interval (int): Interval between status checks if waiting for completion. Defaults to 10 seconds.
+            adaptive_polling (bool): Whether to schedule status checks from refresh history. Defaults to False.
 
         Returns:
             str: The status of the semantic model refresh or an error message.
@@ -356,24 +975,239 @@ class SemanticModels:
             
             # If not waiting for completion, return the initial result
             if not wait_for_completion:
-                print("Refresh has started but completion won't be checked.")
+                notify(logger, logging.INFO, "Refresh has started but completion won't be checked.")
                 return result
-            print("Waiting for expected duration...")
+            refresh_ref = self.last_refresh
+            durations = self._get_refresh_durations() if adaptive_polling else None
+            schedule = PollSchedule(expected_duration, loop_interval, durations)
+
+            notify(logger, logging.INFO, "Waiting for expected duration...")
             # Wait for the expected duration before checking the status
-            time.sleep(expected_duration)
+            time.sleep(schedule.first_wait())
             
             # Loop to check the refresh status
+            poll_calls = 0
             while True:
-                refresh_status = self._get_refresh_status()
-                result = self._handle_refresh_status_response(refresh_status)
-                
-                # Check the status of the refresh
-                status = result["value"][0]["status"]
-                if status != "Unknown":
-                    print(f"Semantic model refresh completed with status: {status}")
+                status, is_complete = self._check_refresh_status(refresh_ref)
+                poll_calls += 1
+                if is_complete:
+                    self.last_refresh_stats = _refresh_stats(status, refresh_ref, schedule, poll_calls)
+                    notify(logger, logging.INFO, f"Semantic model refresh completed with status: {status}")
                     return status
                 
-                print("Refresh is in progress. Waiting to check again...")
-                time.sleep(loop_interval)
+                notify(logger, logging.INFO, "Refresh is in progress. Waiting to check again...")
+                time.sleep(schedule.next_wait(time.time() - refresh_ref["requested_at"]))
         except Exception as e:
-            return str(e)
\ No newline at end of file
+            return str(e)
+
+class RefreshHandle:
+    """
+    A future-like handle to a dataflow or semantic model refresh tracked by a RefreshPoller.
+
+    Attributes:
+        refresher (Dataflows or SemanticModels): The object being refreshed.
+        status (str): The most recently polled status. Before the first poll, the in-progress status of the refresher's API.
+        started (float): Time the refresh was requested.
+        finished (float): Time the poller saw the refresh finish, or None while it is running.
+    """
+
+    def __init__(self, refresher, next_poll_at, refresh_ref=None):
+        self.refresher = refresher
+        self.refresh_ref = refresh_ref or {"id": None, "requested_at": time.time()}
+        self.status = refresher.IN_PROGRESS_STATUS
+        self.started = time.time()
+        self.finished = None
+        self.next_poll_at = next_poll_at
+        self.poll_errors = 0
+        self._future = Future()
+
+    def done(self):
+        """
+        Returns:
+            bool: True if the refresh has finished or polling failed.
+        """
+        return self._future.done()
+
+    def result(self, timeout=None):
+        """
+        Waits for the refresh to finish.
+
+        Parameters:
+            timeout (float): Optional. Maximum seconds to wait. Waits indefinitely by default.
+
+        Returns:
+            str: The final status of the refresh.
+
+        Raises:
+            TimeoutError: If the refresh hasn't finished within the timeout.
+            Exception: If the status could not be polled.
+        """
+        return self._future.result(timeout)
+
+    def refresh_duration(self):
+        """
+        Returns:
+            float: The service's own endTime - startTime for the refresh, or None if it hasn't been seen to finish.
+        """
+        entry = self.refresh_ref.get("entry") or {}
+        started = _parse_time(entry.get("startTime"))
+        ended = _parse_time(entry.get("endTime"))
+        return ended - started if started is not None and ended is not None else None
+
+    def add_done_callback(self, fn):
+        """
+        Calls fn(handle) once the refresh finishes.
+
+        Parameters:
+            fn (callable): The callback.
+        """
+        self._future.add_done_callback(lambda _: fn(self))
+
+    def _set_result(self, status):
+        self.status = status
+        self.finished = time.time()
+        self._future.set_result(status)
+
+    def _set_exception(self, exception):
+        self.finished = time.time()
+        self._future.set_exception(exception)
+
+
+class RefreshPoller:
+    """
+    Polls the status of many outstanding refreshes from a single background thread.
+
+    Handles for the same dataflow or semantic model are checked with one request per cycle, so
+    a notebook can follow hundreds of refreshes without a blocked thread per refresh.
+
+    Attributes:
+        loop_interval (int): Seconds between poll cycles.
+        max_poll_errors (int): Consecutive failed polls after which a handle fails.
+    """
+
+    def __init__(self, loop_interval=10, max_poll_errors=3):
+        """
+        Initializes the poller. The background thread starts when the first refresh is tracked.
+
+        Parameters:
+            loop_interval (int): Seconds between poll cycles. Defaults to 10.
+            max_poll_errors (int): Consecutive failed polls after which a handle fails. Defaults to 3.
+        """
+        self.loop_interval = loop_interval
+        self.max_poll_errors = max_poll_errors
+
+        self._handles = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def track(self, refresher, expected_duration=0, refresh_ref=None):
+        """
+        Starts tracking a refresh that has already been requested.
+
+        Parameters:
+            refresher (Dataflows or SemanticModels): The object being refreshed.
+            expected_duration (int): Seconds to wait before the first status check. Defaults to 0.
+            refresh_ref (dict): Optional. The refresh to track, as recorded in the refresher's last_refresh.
+
+        Returns:
+            RefreshHandle: The handle for the refresh.
+        """
+        handle = RefreshHandle(refresher, time.time() + expected_duration, refresh_ref)
+
+        with self._lock:
+            self._handles.append(handle)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="RefreshPoller", daemon=True)
+                self._thread.start()
+
+        self._wake.set()
+        return handle
+
+    def outstanding(self):
+        """
+        Returns:
+            list of RefreshHandle: The handles that haven't finished yet.
+        """
+        with self._lock:
+            return list(self._handles)
+
+    def _poll_once(self):
+        """
+        Polls every endpoint that has at least one handle due, once each.
+        """
+        now = time.time()
+        with self._lock:
+            handles = list(self._handles)
+
+        # Group handles by the endpoint that reports their status
+        groups = {}
+        for handle in handles:
+            groups.setdefault(handle.refresher._poll_key(), []).append(handle)
+
+        for group in groups.values():
+            if not any(handle.next_poll_at <= now for handle in group):
+                continue
+
+            try:
+                statuses = group[0].refresher._check_refresh_statuses([handle.refresh_ref for handle in group])
+            except Exception as e:
+                for handle in group:
+                    handle.poll_errors += 1
+                    if handle.poll_errors >= self.max_poll_errors:
+                        handle._set_exception(e)
+                continue
+
+            for handle, (status, is_complete) in zip(group, statuses):
+                handle.poll_errors = 0
+                handle.status = status
+                if is_complete:
+                    handle._set_result(status)
+
+        with self._lock:
+            self._handles = [handle for handle in self._handles if not handle.done()]
+
+    def _run(self):
+        """
+        Background loop that polls until there are no outstanding handles left.
+        """
+        while True:
+            with self._lock:
+                if not self._handles:
+                    self._thread = None
+                    return
+                next_poll_at = min(handle.next_poll_at for handle in self._handles)
+                # Cleared while the handles can't change, so a handle tracked after this always wakes the wait
+                self._wake.clear()
+
+            # Sleep until the earliest first check, or the poll interval, whichever is later
+            delay = max(next_poll_at - time.time(), 0)
+            self._wake.wait(delay)
+            if delay > 0 and self._wake.is_set():
+                # A new handle arrived; recalculate when the next poll is due
+                continue
+
+            self._poll_once()
+
+            with self._lock:
+                for handle in self._handles:
+                    handle.next_poll_at = max(handle.next_poll_at, time.time() + self.loop_interval)
+
+
+_default_poller = None
+_default_poller_lock = threading.Lock()
+
+
+def get_default_poller():
+    """
+    Returns the process-wide poller used by start_refresh() when one isn't given.
+
+    Returns:
+        RefreshPoller: The shared default poller.
+    """
+    global _default_poller
+    if _default_poller is None:
+        with _default_poller_lock:
+            if _default_poller is None:
+                _default_poller = RefreshPoller()
+    return _default_poller
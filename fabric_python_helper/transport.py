@@ -0,0 +1,513 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+from . import instrumentation
+
+
+# Hosts of each API that rate limits and retry policies can be configured for.
+API_HOSTS = {
+    "graph.microsoft.com": "graph",
+    "api.powerbi.com": "powerbi",
+}
+
+
+def get_api_name(url):
+    """
+    Works out which API a URL belongs to.
+
+    Parameters:
+        url (str): The request URL.
+
+    Returns:
+        str: "graph", "powerbi", "keyvault" or "other".
+    """
+    host = urlsplit(url).hostname or ""
+    if host in API_HOSTS:
+        return API_HOSTS[host]
+    if host.endswith(".vault.azure.net"):
+        return "keyvault"
+    return "other"
+
+
+class RetryPolicy:
+    """
+    Decides whether and when to retry a throttled or failed request.
+
+    Throttling (429) and transient server errors are retried after the Retry-After the
+    server asked for, or otherwise after a jittered exponential backoff. A POST may already
+    have been processed when it fails, so for non-idempotent methods only a 429, or a 503
+    with a Retry-After, is retried, and connection errors and timeouts aren't retried at all.
+
+    Attributes:
+        max_retries (int): Maximum number of retries per request.
+        backoff_factor (float): Base of the exponential backoff in seconds.
+        max_backoff (float): Longest wait between attempts in seconds.
+        retry_statuses (tuple): Status codes that are retried.
+    """
+
+    IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+
+    def __init__(self, max_retries=5, backoff_factor=1, max_backoff=120, retry_statuses=(429, 500, 502, 503, 504)):
+        """
+        Initializes the retry policy.
+
+        Parameters:
+            max_retries (int): Maximum number of retries per request. Defaults to 5.
+            backoff_factor (float): Base of the exponential backoff in seconds. Defaults to 1.
+            max_backoff (float): Longest wait between attempts in seconds. Defaults to 120.
+            retry_statuses (tuple): Status codes that are retried. Defaults to 429, 500, 502, 503 and 504.
+        """
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.retry_statuses = retry_statuses
+
+    def backoff(self, attempt):
+        """
+        Parameters:
+            attempt (int): Number of attempts made so far, starting at 1.
+
+        Returns:
+            float: Seconds to wait, using full jitter.
+        """
+        return random.uniform(0, min(self.backoff_factor * 2 ** attempt, self.max_backoff))
+
+    @staticmethod
+    def retry_after(headers):
+        """
+        Reads the Retry-After header, which may be in seconds or an HTTP date.
+
+        Parameters:
+            headers (dict): The response headers.
+
+        Returns:
+            float: Seconds to wait, or None if the header is missing or invalid.
+        """
+        value = next((value for key, value in headers.items() if key.lower() == "retry-after"), None)
+        if not value:
+            return None
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            pass
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+        except (TypeError, ValueError):
+            return None
+
+    def get_status_wait(self, attempt, status_code, headers, method=None):
+        """
+        Parameters:
+            attempt (int): Number of attempts made so far, starting at 1.
+            status_code (int): Status code of the latest attempt.
+            headers (dict): Response headers of the latest attempt.
+            method (str): HTTP method of the request. Non-idempotent methods are only retried after a 429, or a 503 with a Retry-After.
+
+        Returns:
+            float: Seconds to wait before retrying, or None if the response shouldn't be retried.
+        """
+        if attempt > self.max_retries or status_code not in self.retry_statuses:
+            return None
+
+        retry_after = self.retry_after(headers)
+        if method is not None and method.upper() not in self.IDEMPOTENT_METHODS:
+            # The request was refused rather than processed only for a 429, or a 503 asking to come back later
+            if not (status_code == 429 or (status_code == 503 and retry_after is not None)):
+                return None
+
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        return self.backoff(attempt)
+
+    def get_error_wait(self, attempt, method):
+        """
+        Parameters:
+            attempt (int): Number of attempts made so far, starting at 1.
+            method (str): HTTP method of the request.
+
+        Returns:
+            float: Seconds to wait before retrying after a connection error, or None if it shouldn't be retried.
+        """
+        if attempt > self.max_retries or method.upper() not in self.IDEMPOTENT_METHODS:
+            return None
+        return self.backoff(attempt)
+
+    def get_exception_wait(self, attempt, exception, max_retries=None):
+        """
+        For retry loops above the transport, such as re-fetching a download that was cut off part way through.
+
+        HTTP error statuses, connection errors and timeouts have already been retried by the
+        transport as far as is safe, so they aren't retried again.
+
+        Parameters:
+            attempt (int): Number of attempts made so far, starting at 1.
+            exception (Exception): The error raised by the latest attempt.
+            max_retries (int): Optional. Maximum number of retries for this loop. Defaults to the policy's max_retries.
+
+        Returns:
+            float: Seconds to wait before retrying, or None if the error shouldn't be retried.
+        """
+        import requests
+
+        max_retries = self.max_retries if max_retries is None else max_retries
+        if attempt > max_retries or isinstance(exception, (requests.HTTPError, requests.ConnectionError, requests.Timeout)):
+            return None
+        return self.backoff(attempt)
+
+
+class RateLimiter:
+    """
+    A thread-safe token bucket limiting the rate of requests to an API.
+
+    Attributes:
+        rate (float): Requests per second sustained.
+        burst (int): Maximum number of requests that can be made at once after a quiet period.
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        Initializes the bucket full.
+
+        Parameters:
+            rate (float): Requests per second sustained.
+            burst (int): Optional. Bucket size. Defaults to one second's worth of requests.
+        """
+        self.rate = rate
+        self.burst = burst or max(int(rate), 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Takes a token, going into debt if none is available, without waiting.
+
+        Returns:
+            float: Seconds the caller must wait before sending its request.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return max(-self._tokens / self.rate, 0)
+
+    def acquire(self):
+        """
+        Takes a token, waiting until one is available.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+# Rate limits shared by every transport in the process, as (rate, burst) by API name.
+# Graph allows 10,000 requests per 10 minutes per mailbox, roughly 16 a second, so its
+# limit applies to each mailbox separately.
+_rate_limits = {
+    "graph": (16, 32),
+}
+
+# APIs whose limit applies per mailbox rather than to the API as a whole.
+PER_MAILBOX_APIS = {"graph"}
+
+# Rate limiters created from _rate_limits, by (API name, mailbox).
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_mailbox(url):
+    """
+    Works out which mailbox a Graph URL addresses.
+
+    Parameters:
+        url (str): The request URL.
+
+    Returns:
+        str: The user ID or email address after /users/, "me" for /me, or None for other URLs such as $batch.
+    """
+    segments = urlsplit(url).path.split("/")
+    for index, segment in enumerate(segments):
+        if segment == "me":
+            return "me"
+        if segment == "users" and index + 1 < len(segments) and segments[index + 1]:
+            return segments[index + 1].lower()
+    return None
+
+
+def configure_rate_limit(api, rate, burst=None):
+    """
+    Sets the process-wide request rate limit for an API, shared by every transport.
+
+    For Graph the limit applies to each mailbox separately, so searching many mailboxes
+    at once isn't held to a single mailbox's budget.
+
+    Parameters:
+        api (str): "graph", "powerbi", "keyvault" or "other".
+        rate (float): Requests per second sustained, or None to remove the limit.
+        burst (int): Optional. Maximum number of requests at once after a quiet period.
+    """
+    with _rate_limiters_lock:
+        if rate is None:
+            _rate_limits.pop(api, None)
+        else:
+            _rate_limits[api] = (rate, burst)
+
+        # Existing limiters are replaced on next use
+        for key in [key for key in _rate_limiters if key[0] == api]:
+            del _rate_limiters[key]
+
+
+def get_rate_limiter(api, url=None):
+    """
+    Parameters:
+        api (str): The API name.
+        url (str): Optional. The request URL, used to find the mailbox for per-mailbox limits.
+
+    Returns:
+        RateLimiter: The shared rate limiter for the API, or for the URL's mailbox, or None if it isn't limited.
+    """
+    if api not in _rate_limits:
+        return None
+
+    key = (api, get_mailbox(url) if api in PER_MAILBOX_APIS and url else None)
+    rate_limiter = _rate_limiters.get(key)
+    if rate_limiter is None:
+        with _rate_limiters_lock:
+            limit = _rate_limits.get(api)
+            if limit is None:
+                return None
+            rate_limiter = _rate_limiters.setdefault(key, RateLimiter(*limit))
+    return rate_limiter
+
+
+class HttpTransport:
+    """
+    A shared HTTP transport holding one pooled requests.Session per host.
+
+    Emails, Dataflows and SemanticModels all accept a transport so that
+    connections to the Graph, Power BI and Key Vault endpoints are reused
+    between calls instead of paying for a new TCP and TLS handshake every time.
+
+    Every request first waits on the process-wide rate limiter for its API (see
+    configure_rate_limit), and throttled or transiently failed requests are retried
+    according to the API's RetryPolicy, honouring Retry-After.
+
+    Attributes:
+        pool_connections (int): Number of connection pools to cache per session.
+        pool_maxsize (int): Maximum number of connections kept alive per host.
+        timeout (float or tuple): Default (connect, read) timeout in seconds applied to every request.
+        keep_alive (bool): If False, connections are closed after each request.
+        retry_policy (RetryPolicy): Retry policy used for APIs without their own in retry_policies.
+        retry_policies (dict): Retry policies by API name.
+    """
+
+    def __init__(self, pool_connections=4, pool_maxsize=32, timeout=(10, 120), keep_alive=True, retry_policy=None, retry_policies=None):
+        """
+        Initializes the transport with its pooling, timeout and retry settings.
+
+        Parameters:
+            pool_connections (int): Number of connection pools to cache per session. Defaults to 4.
+            pool_maxsize (int): Maximum number of connections kept alive per host. Defaults to 32.
+            timeout (float or tuple): Default (connect, read) timeout in seconds. Defaults to (10, 120).
+            keep_alive (bool): Whether to keep connections open between requests. Defaults to True.
+            retry_policy (RetryPolicy): Optional. Retry policy for every API. Defaults to RetryPolicy().
+            retry_policies (dict): Optional. Retry policies by API name ("graph", "powerbi", "keyvault", "other") overriding retry_policy.
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.retry_policies = retry_policies or {}
+
+        self._sessions = {}
+        self._header_cache = {}
+        self._lock = threading.Lock()
+
+    def _create_session(self):
+        """
+        Builds a new requests.Session with a pooled HTTPAdapter mounted.
+
+        Returns:
+            requests.Session: The configured session.
+        """
+        # Imported on first use so importing the package stays fast
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+        if not self.keep_alive:
+            session.headers["Connection"] = "close"
+
+        return session
+
+    def get_session(self, url):
+        """
+        Returns the pooled session for the host of the given URL, creating it on first use.
+
+        Parameters:
+            url (str): Any URL on the target host.
+
+        Returns:
+            requests.Session: The session for that host.
+        """
+        parts = urlsplit(url)
+        host_key = f"{parts.scheme}://{parts.netloc}"
+
+        session = self._sessions.get(host_key)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(host_key)
+                if session is None:
+                    session = self._create_session()
+                    self._sessions[host_key] = session
+
+        return session
+
+    def auth_headers(self, access_token, content_type=None):
+        """
+        Returns the cached Authorization headers for an access token.
+
+        The same dict is handed out on every call for a given token and content type,
+        so it must not be modified by the caller. Copy it first if extra headers are needed.
+
+        Parameters:
+            access_token (str): Bearer token for the target API.
+            content_type (str): Optional. Value for the Content-Type header.
+
+        Returns:
+            dict: The request headers.
+        """
+        key = (access_token, content_type)
+        headers = self._header_cache.get(key)
+        if headers is None:
+            headers = {"Authorization": f"Bearer {access_token}"}
+            if content_type:
+                headers["Content-Type"] = content_type
+
+            with self._lock:
+                # Tokens rotate roughly hourly so only a handful of entries are ever needed.
+                if len(self._header_cache) > 32:
+                    self._header_cache.clear()
+                self._header_cache[key] = headers
+
+        return headers
+
+    def get_retry_policy(self, api):
+        """
+        Parameters:
+            api (str): The API name, e.g. "graph".
+
+        Returns:
+            RetryPolicy: The retry policy used for the API.
+        """
+        return self.retry_policies.get(api, self.retry_policy)
+
+    def request(self, method, url, **kwargs):
+        """
+        Sends a request through the pooled session for the URL's host, rate limited and retried per its API.
+
+        Parameters:
+            method (str): HTTP method, e.g. "GET".
+            url (str): The request URL.
+            **kwargs: Passed through to requests.Session.request. The transport timeout is used unless one is given.
+
+        Returns:
+            Response: The response object. If retries run out, the last throttled or failed response is returned.
+        """
+        import requests
+
+        kwargs.setdefault("timeout", self.timeout)
+
+        api = get_api_name(url)
+        retry_policy = self.get_retry_policy(api)
+        rate_limiter = get_rate_limiter(api, url)
+        session = self.get_session(url)
+
+        started = time.perf_counter()
+        throttle_wait = 0.0
+        rate_limit_wait = 0.0
+
+        attempt = 0
+        while True:
+            attempt += 1
+            if rate_limiter is not None:
+                rate_limit_wait += rate_limiter.acquire()
+
+            try:
+                response = session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                wait = retry_policy.get_error_wait(attempt, method)
+                if wait is None:
+                    if instrumentation.is_enabled():
+                        instrumentation.record_http(api, method, url, None, started, attempt - 1, throttle_wait, rate_limit_wait, error=e)
+                    raise
+            else:
+                wait = retry_policy.get_status_wait(attempt, response.status_code, response.headers, method)
+                if wait is None:
+                    if instrumentation.is_enabled():
+                        content_length = response.headers.get("Content-Length")
+                        instrumentation.record_http(
+                            api, method, url, response.status_code, started, attempt - 1, throttle_wait, rate_limit_wait,
+                            bytes_sent=instrumentation.body_size(response.request.body),
+                            bytes_received=int(content_length) if content_length and content_length.isdigit() else None,
+                        )
+                    return response
+                # Release the connection back to the pool before waiting
+                response.close()
+
+            time.sleep(wait)
+            throttle_wait += wait
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def close(self):
+        """
+        Closes every pooled session held by the transport.
+        """
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._header_cache.clear()
+
+
+_default_transport = None
+_default_transport_lock = threading.Lock()
+
+
+def get_default_transport():
+    """
+    Returns the process-wide transport used when a class is not given one explicitly.
+
+    Returns:
+        HttpTransport: The shared default transport.
+    """
+    global _default_transport
+    if _default_transport is None:
+        with _default_transport_lock:
+            if _default_transport is None:
+                _default_transport = HttpTransport()
+    return _default_transport
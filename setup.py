@@ -8,6 +8,12 @@ setup(
         "msal",
         "requests"
     ],
+    extras_require={
+        "async": ["aiohttp"],
+        "tables": ["pyarrow"],
+        "xlsx": ["openpyxl"],
+        "delta": ["deltalake"]
+    },
     author="Ben Dobbs",
     author_email="bdobbs@archwaytrust.co.uk",
     description="Collection of useful python code for automation in Microsoft Fabric.",
@@ -0,0 +1,30 @@
+import os
+
+from fabric_python_helper.attachment_cache import AttachmentCache
+
+
+def test_opened_content_stays_readable_after_eviction(tmp_path):
+    cache = AttachmentCache(str(tmp_path), max_size_bytes=10)
+    cache.put("me", "message", "first", "2024-01-01T00:00:00Z", b"0123456789")
+
+    file = cache.open("me", "message", "first", "2024-01-01T00:00:00Z")
+    # Storing another attachment pushes the cache over its limit and evicts the first
+    cache.put("me", "message", "second", "2024-01-01T00:00:00Z", b"abcdefghij")
+
+    with file:
+        assert file.read() == b"0123456789"
+    assert cache.open("me", "message", "first", "2024-01-01T00:00:00Z") is None
+    assert cache.get("me", "message", "second", "2024-01-01T00:00:00Z") == b"abcdefghij"
+    cache.close()
+
+
+def test_content_removed_outside_the_cache_is_a_miss(tmp_path):
+    cache = AttachmentCache(str(tmp_path))
+    cache.put("me", "message", "attachment", "2024-01-01T00:00:00Z", b"content")
+
+    path = cache.get_path("me", "message", "attachment", "2024-01-01T00:00:00Z")
+    os.remove(path)
+
+    assert cache.get("me", "message", "attachment", "2024-01-01T00:00:00Z") is None
+    assert cache.size() == 0
+    cache.close()
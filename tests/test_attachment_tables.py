@@ -0,0 +1,42 @@
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+openpyxl = pytest.importorskip("openpyxl")
+
+from fabric_python_helper.attachment_tables import read_xlsx_batches
+
+
+def write_workbook(path, header, rows):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+    return str(path)
+
+
+def test_whole_numbers_then_fraction_keep_their_value(tmp_path):
+    path = write_workbook(tmp_path / "amounts.xlsx", ["amount"], [[100], [200], [300], [12.5]])
+
+    table = pa.Table.from_batches(read_xlsx_batches(path, batch_size=3))
+
+    assert table.schema.field("amount").type == pa.float64()
+    assert table.column("amount").to_pylist() == [100, 200, 300, 12.5]
+
+
+def test_fraction_in_integer_schema_raises(tmp_path):
+    path = write_workbook(tmp_path / "amounts.xlsx", ["amount"], [[100], [200], [300], [12.5]])
+
+    with pytest.raises(ValueError, match="amount"):
+        list(read_xlsx_batches(path, schema={"amount": pa.int64()}, batch_size=3))
+
+
+def test_column_empty_in_first_batch_asks_for_schema(tmp_path):
+    path = write_workbook(tmp_path / "notes.xlsx", ["id", "note"], [[1, None], [2, None], [3, "late"]])
+
+    with pytest.raises(ValueError, match="Pass a schema"):
+        list(read_xlsx_batches(path, batch_size=2))
+
+    table = pa.Table.from_batches(read_xlsx_batches(path, schema={"id": pa.int64(), "note": pa.string()}, batch_size=2))
+    assert table.column("note").to_pylist() == [None, None, "late"]
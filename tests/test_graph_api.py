@@ -0,0 +1,113 @@
+import json
+
+import pytest
+
+from fabric_python_helper.graph_api import Emails
+from fabric_python_helper.mail_index import MailboxIndex
+from fabric_python_helper.transport import HttpTransport, RetryPolicy
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self._body = body
+        self.text = json.dumps(body)
+
+    def json(self):
+        return self._body
+
+
+def make_emails(respond):
+    """
+    Builds an Emails instance whose Graph requests are answered by respond(method, url, kwargs), without authenticating.
+    """
+    emails = Emails.__new__(Emails)
+    emails.user_id = "me"
+    emails.transport = HttpTransport(retry_policy=RetryPolicy(backoff_factor=0.001))
+    emails._auth_headers = lambda content_type=None: {}
+    emails.requests = []
+
+    def request(method, url, headers=None, **kwargs):
+        emails.requests.append((method, url, kwargs))
+        return respond(method, url, kwargs)
+
+    emails._request = request
+    return emails
+
+
+def batch_responder(*rounds):
+    """
+    Answers successive $batch calls with the given sub-response statuses, by sub-request ID.
+    """
+    rounds = list(rounds)
+
+    def respond(method, url, kwargs):
+        statuses = rounds.pop(0)
+        sent = json.loads(kwargs["data"])["requests"]
+        responses = []
+        for sub_request in sent:
+            status, headers, body = statuses[sub_request["id"]]
+            responses.append({"id": sub_request["id"], "status": status, "headers": headers, "body": body})
+        return FakeResponse(200, {"responses": responses})
+
+    return respond
+
+
+def test_batch_retries_only_throttled_sub_requests():
+    emails = make_emails(batch_responder(
+        {"0": (204, {}, None), "1": (429, {"Retry-After": "0"}, None), "2": (404, {}, {"error": "NotFound"})},
+        {"1": (204, {}, None)},
+    ))
+
+    results = emails.delete_emails(["a", "b", "c"])
+
+    assert results == {"a": True, "b": True, "c": False}
+    retried = json.loads(emails.requests[1][2]["data"])["requests"]
+    assert [sub_request["id"] for sub_request in retried] == ["1"]
+
+
+def test_batched_post_is_not_retried_after_a_server_error():
+    emails = make_emails(batch_responder({"0": (503, {}, None)}))
+
+    responses = emails.batch_requests([{"method": "POST", "url": "/me/sendMail", "body": {}}])
+
+    assert responses[0]["status"] == 503
+    assert len(emails.requests) == 1
+
+
+def test_attachments_are_kept_when_other_sub_requests_fail():
+    emails = make_emails(batch_responder({
+        "0": (200, {}, {"value": [{"id": "attachment", "name": "report.csv"}]}),
+        "1": (404, {}, {"error": "NotFound"}),
+    }))
+
+    assert emails.get_attachments_for_messages(["a", "b"]) == {"a": [("attachment", "report.csv")], "b": None}
+
+
+def delta_page(message_ids, delta_link="new-delta"):
+    messages = [{"id": message_id, "subject": "Report", "from": {"emailAddress": {"address": "a@example.com"}}, "receivedDateTime": "2024-01-01T00:00:00Z", "hasAttachments": False} for message_id in message_ids]
+    return FakeResponse(200, {"value": messages, "@odata.deltaLink": delta_link})
+
+
+def test_expired_delta_link_resyncs_the_folder_once(tmp_path):
+    index = MailboxIndex(str(tmp_path / "index.db"))
+    index.apply_changes("me", "Inbox", [], [], "expired-delta")
+    responses = [FakeResponse(410, {"error": "SyncStateNotFound"}), delta_page(["1", "2"])]
+    emails = make_emails(lambda method, url, kwargs: responses.pop(0))
+
+    assert emails.sync_mailbox(index) == {"changed": 2, "removed": 0}
+    assert emails.requests[0][1] == "expired-delta"
+    assert emails.requests[1][1].endswith("/users/me/mailFolders/Inbox/messages/delta")
+    assert index.get_delta_link("me", "Inbox") == "new-delta"
+    index.close()
+
+
+def test_delta_link_expiring_again_raises(tmp_path):
+    index = MailboxIndex(str(tmp_path / "index.db"))
+    index.apply_changes("me", "Inbox", [], [], "expired-delta")
+    emails = make_emails(lambda method, url, kwargs: FakeResponse(410, {"error": "SyncStateNotFound"}))
+
+    with pytest.raises(Exception, match="expired again"):
+        emails.sync_mailbox(index)
+    assert len(emails.requests) == 2
+    index.close()
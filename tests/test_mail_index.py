@@ -0,0 +1,29 @@
+from fabric_python_helper.mail_index import MailboxIndex
+
+
+def message(message_id, subject="Daily report"):
+    return {"id": message_id, "subject": subject, "from": {"emailAddress": {"address": "Reports@Example.com"}}, "receivedDateTime": "2024-01-01T09:00:00Z", "hasAttachments": True}
+
+
+def test_removing_a_message_from_one_folder_keeps_it_in_another(tmp_path):
+    index = MailboxIndex(str(tmp_path / "index.db"))
+    index.apply_changes("me", "Inbox", [message("1")], [], "inbox-delta")
+    index.apply_changes("me", "Archive", [message("1")], [], "archive-delta")
+
+    index.apply_changes("me", "Archive", [], ["1"])
+
+    assert index.search_message_by_subject_and_sender("me", "Daily report", "reports@example.com") == "1"
+    assert index.get_delta_link("me", "Inbox") == "inbox-delta"
+    index.close()
+
+
+def test_reset_forgets_only_that_folder(tmp_path):
+    index = MailboxIndex(str(tmp_path / "index.db"))
+    index.apply_changes("me", "Inbox", [message("1")], [], "inbox-delta")
+    index.apply_changes("me", "Archive", [message("2")], [], "archive-delta")
+
+    index.reset("me", "Inbox")
+
+    assert index.get_delta_link("me", "Inbox") is None
+    assert index.search_message_by_subject_and_sender("me", "Daily report", "reports@example.com", folder="Archive") == "2"
+    index.close()
@@ -0,0 +1,104 @@
+import os
+
+from fabric_python_helper.mail_pipeline import MailboxIngestionPipeline
+from fabric_python_helper.transport import HttpTransport, RetryPolicy
+
+
+class FakeEmails:
+    """
+    Serves messages with one attachment each, recording when the search finishes and what is deleted.
+    """
+
+    BATCH_SIZE = 20
+
+    def __init__(self, message_ids, attachment_name="report.csv"):
+        self.transport = HttpTransport(retry_policy=RetryPolicy(backoff_factor=0.001))
+        self.messages = [
+            {"id": message_id, "receivedDateTime": "2024-01-01T09:00:00Z", "attachments": [{"id": f"{message_id}-attachment", "name": attachment_name}]}
+            for message_id in message_ids
+        ]
+        self.events = []
+        self.deleted = []
+
+    def iter_messages(self, query=None, shared_mailbox_email=None, expand_attachments=False):
+        for message in self.messages:
+            yield message
+        self.events.append("search finished")
+
+    def download_attachment_to_file(self, message_id, attachment_id, destination, shared_mailbox_email=None):
+        with open(destination, "wb") as file:
+            file.write(attachment_id.encode())
+
+    def delete_emails(self, message_ids, shared_mailbox_email=None):
+        self.events.append("delete")
+        self.deleted.extend(message_ids)
+        return {message_id: True for message_id in message_ids}
+
+
+def test_nothing_is_deleted_until_the_search_has_finished(tmp_path):
+    emails = FakeEmails([f"m{index}" for index in range(50)])
+    pipeline = MailboxIngestionPipeline(emails, None, target_directory=str(tmp_path / "landing"), queue_size=2)
+
+    results = pipeline.run()
+
+    assert results["persisted"] == 50 and results["deleted"] == 50 and results["failed"] == 0
+    assert emails.events[0] == "search finished"
+    assert sorted(emails.deleted) == sorted(message["id"] for message in emails.messages)
+
+
+def test_checkpoint_resumes_without_redoing_finished_work(tmp_path):
+    checkpoint_path = tmp_path / "checkpoint.txt"
+    checkpoint_path.write_text("persisted\tm1\ndeleted\tm2\n")
+    emails = FakeEmails(["m1", "m2", "m3"])
+    persisted = []
+    pipeline = MailboxIngestionPipeline(emails, None, persist=lambda message, attachment, local_path: persisted.append(message["id"]), checkpoint_path=str(checkpoint_path))
+
+    results = pipeline.run()
+
+    # m1 was persisted before the interruption, so it is only deleted; m2 is already done
+    assert persisted == ["m3"]
+    assert sorted(emails.deleted) == ["m1", "m3"]
+    assert results["skipped"] == 2
+    lines = checkpoint_path.read_text().splitlines()
+    assert lines.index("persisted\tm3") < lines.index("deleted\tm3")
+    assert "persisted\tm1" not in lines[2:]
+
+
+def test_message_is_kept_when_its_checkpoint_cant_be_written(tmp_path):
+    emails = FakeEmails(["m1"])
+    pipeline = MailboxIngestionPipeline(emails, None, persist=lambda *args: None)
+
+    def fail(stage, message_id):
+        raise OSError("disk full")
+
+    pipeline.checkpoint.mark = fail
+    results = pipeline.run()
+
+    assert results["failures"] == [("m1", "checkpoint", "disk full")]
+    assert emails.deleted == []
+
+
+def test_failed_persist_is_retried_then_leaves_the_message(tmp_path):
+    emails = FakeEmails(["m1"])
+    attempts = []
+
+    def persist(message, attachment, local_path):
+        attempts.append(message["id"])
+        raise OSError("lakehouse unavailable")
+
+    results = MailboxIngestionPipeline(emails, None, persist=persist, max_retries=2).run()
+
+    assert len(attempts) == 3
+    assert results["failures"] == [("m1", "persist", "lakehouse unavailable")]
+    assert emails.deleted == []
+
+
+def test_attachments_with_the_same_name_and_time_are_all_kept(tmp_path):
+    emails = FakeEmails(["m1", "m2"], attachment_name="../report.csv")
+    landing = tmp_path / "landing"
+
+    MailboxIngestionPipeline(emails, None, target_directory=str(landing)).run()
+
+    names = os.listdir(landing)
+    assert len(names) == 2
+    assert all(name.startswith("20240101T090000_") and name.endswith("__report.csv") for name in names)
@@ -0,0 +1,15 @@
+import pytest
+
+from fabric_python_helper.mail_query import MessageQuery
+
+
+def test_from_senders_rejects_an_empty_list():
+    with pytest.raises(ValueError):
+        MessageQuery().from_senders([])
+
+
+def test_sender_and_subject_are_escaped_in_the_filter():
+    parameters, _ = MessageQuery().subject_equals("O'Brien's report").from_senders("o'brien@example.com").build()
+
+    assert "subject eq 'O''Brien''s report'" in parameters["$filter"]
+    assert "from/emailAddress/address eq 'o''brien@example.com'" in parameters["$filter"]
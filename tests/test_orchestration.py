@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+from fabric_python_helper.orchestration import RefreshOrchestrator
+from fabric_python_helper.pbi_admin import Dataflows, RefreshHandle
+
+
+class FakeDataflow(Dataflows):
+    """
+    A dataflow whose refreshes finish as soon as they start, with a scripted status and service-side duration.
+    """
+
+    def __init__(self, name, started, status="Success", duration=60):
+        super().__init__("workspace", name, "token", transport=object())
+        self.name = name
+        self.started = started
+        self.status = status
+        self.duration = duration
+
+    def start_refresh(self, expected_duration=0, poller=None):
+        self.started.append(self.name)
+        handle = RefreshHandle(self, 0)
+        handle.refresh_ref["entry"] = {"startTime": "2024-01-01T00:00:00Z", "endTime": f"2024-01-01T00:{self.duration // 60:02d}:{self.duration % 60:02d}Z"}
+        handle._set_result(self.status)
+        return handle
+
+
+def test_nodes_downstream_of_a_failure_are_skipped():
+    started = []
+    orchestrator = RefreshOrchestrator()
+    orchestrator.add("a", FakeDataflow("a", started, status="Failed"))
+    orchestrator.add("b", FakeDataflow("b", started), depends_on=["a"])
+    orchestrator.add("c", FakeDataflow("c", started), depends_on=["b"])
+    orchestrator.add("d", FakeDataflow("d", started))
+
+    results = orchestrator.run()
+
+    assert {name: result["status"] for name, result in results.items()} == {"a": "Failed", "b": "Skipped", "c": "Skipped", "d": "Success"}
+    assert sorted(started) == ["a", "d"]
+
+
+def test_longest_ready_node_starts_first_and_dependencies_wait():
+    started = []
+    orchestrator = RefreshOrchestrator(max_concurrency=1)
+    orchestrator.add("short", FakeDataflow("short", started), expected_duration=5)
+    orchestrator.add("long", FakeDataflow("long", started), expected_duration=300)
+    orchestrator.add("medium", FakeDataflow("medium", started), expected_duration=60)
+    orchestrator.add("downstream", FakeDataflow("downstream", started), depends_on=["short"], expected_duration=1000)
+
+    orchestrator.run()
+
+    assert started == ["long", "medium", "short", "downstream"]
+
+
+def test_durations_follow_the_service_duration(tmp_path):
+    history_path = tmp_path / "history.json"
+    orchestrator = RefreshOrchestrator(history_path=str(history_path))
+    orchestrator.add("a", FakeDataflow("a", [], duration=120), expected_duration=600)
+
+    orchestrator.run()
+
+    assert orchestrator.durations["a"] == 360
+    assert json.loads(history_path.read_text()) == {"a": 360}
+
+
+def test_damaged_history_is_ignored(tmp_path):
+    history_path = tmp_path / "history.json"
+    history_path.write_text('{"a": 12')
+
+    assert RefreshOrchestrator(history_path=str(history_path)).durations == {}
+
+
+def test_concurrency_caps_must_allow_a_refresh():
+    with pytest.raises(ValueError):
+        RefreshOrchestrator(max_concurrency_per_group=0)
+    with pytest.raises(ValueError):
+        RefreshOrchestrator(max_concurrency=0)
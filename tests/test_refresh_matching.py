@@ -0,0 +1,139 @@
+import time
+from datetime import datetime, timezone
+
+from fabric_python_helper import pbi_admin
+
+
+def timestamp(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, body=None, headers=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.headers = headers or {}
+        self.text = str(body)
+        self._body = body
+
+    def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise Exception(f"HTTP {self.status_code}")
+
+
+class FakeTransport:
+    """
+    Serves a refresh history that the test edits between calls.
+    """
+
+    def __init__(self, history):
+        self.history = history
+        self.posted = False
+
+    def auth_headers(self, access_token, content_type=None):
+        return {}
+
+    def get(self, url, headers=None, params=None):
+        return FakeResponse(200, {"value": self.history[:params["$top"]]})
+
+    def post(self, url, headers=None, json=None):
+        self.posted = True
+        return FakeResponse(200)
+
+
+def test_known_id_is_not_matched_to_another_refresh():
+    requested_at = time.time()
+    refresh_ref = {"id": "ours", "requested_at": requested_at}
+    entries = [
+        {"requestId": "other", "status": "Completed", "startTime": timestamp(requested_at + 5), "endTime": timestamp(requested_at + 6)},
+        {"requestId": "older", "status": "Completed", "startTime": timestamp(requested_at - 3600)},
+    ]
+
+    statuses = pbi_admin._match_refresh_statuses(entries, [refresh_ref], "requestId", "Unknown", True)
+
+    assert statuses == [("Unknown", False)]
+    assert refresh_ref["id"] == "ours"
+
+
+def test_dataflow_refresh_that_finished_before_the_request_is_not_matched():
+    now = time.time()
+    transport = FakeTransport([
+        {"id": "earlier", "status": "Success", "startTime": timestamp(now - 10), "endTime": timestamp(now - 2)},
+        {"id": "old", "status": "Success", "startTime": timestamp(now - 3600), "endTime": timestamp(now - 3500)},
+    ])
+    dataflow = pbi_admin.Dataflows("workspace", "dataflow", "token", transport=transport)
+
+    dataflow._send_refresh_request()
+
+    assert dataflow.last_refresh["listed_ids"] == ["earlier", "old"]
+    assert dataflow._check_refresh_status() == ("InProgress", False)
+
+    # The new transaction is listed once it starts
+    transport.history.insert(0, {"id": "ours", "status": "InProgress", "startTime": timestamp(time.time() + 1)})
+    assert dataflow._check_refresh_status() == ("InProgress", False)
+    assert dataflow.last_refresh["id"] == "ours"
+
+    transport.history[0] = {**transport.history[0], "status": "Success", "endTime": timestamp(time.time() + 2)}
+    transport.history.insert(0, {"id": "later", "status": "Failed", "startTime": timestamp(time.time() + 3)})
+    assert dataflow._check_refresh_status() == ("Success", True)
+
+
+def test_dataflow_refresh_started_before_the_request_is_not_matched_without_a_snapshot():
+    requested_at = time.time()
+    refresh_ref = {"id": None, "requested_at": requested_at, "listed_ids": []}
+    entries = [{"id": "earlier", "status": "Success", "startTime": timestamp(requested_at - 10), "endTime": timestamp(requested_at - 2)}]
+
+    statuses = pbi_admin._match_refresh_statuses(entries, [refresh_ref], "id", "InProgress", True)
+
+    assert statuses == [("InProgress", False)]
+    assert refresh_ref["id"] is None
+
+
+def test_refreshes_requested_together_match_different_transactions():
+    requested_at = time.time()
+    first = {"id": None, "requested_at": requested_at}
+    second = {"id": None, "requested_at": requested_at + 1}
+    entries = [
+        {"id": "b", "status": "InProgress", "startTime": timestamp(requested_at + 2)},
+        {"id": "a", "status": "Success", "startTime": timestamp(requested_at + 1), "endTime": timestamp(requested_at + 3)},
+    ]
+
+    statuses = pbi_admin._match_refresh_statuses(entries, [first, second], "id", "InProgress", True)
+
+    assert statuses == [("Success", True), ("InProgress", False)]
+    assert (first["id"], second["id"]) == ("a", "b")
+
+
+class RefreshingTransport(FakeTransport):
+    """
+    Lists a finished transaction for every refresh requested, and counts the status requests.
+    """
+
+    def __init__(self):
+        super().__init__([])
+        self.gets = 0
+
+    def get(self, url, headers=None, params=None):
+        self.gets += 1
+        return super().get(url, headers, params)
+
+    def post(self, url, headers=None, json=None):
+        started = time.time()
+        self.history.insert(0, {"id": f"refresh-{len(self.history)}", "status": "Success", "startTime": timestamp(started), "endTime": timestamp(started + 1)})
+        return FakeResponse(200)
+
+
+def test_poller_checks_refreshes_of_one_dataflow_with_one_request():
+    transport = RefreshingTransport()
+    poller = pbi_admin.RefreshPoller(loop_interval=0.01)
+
+    # Requested before the poller's first check, so both are due together
+    handles = [pbi_admin.Dataflows("workspace", "dataflow", "token", transport=transport).start_refresh(expected_duration=0.2, poller=poller) for _ in range(2)]
+
+    assert [handle.result(timeout=5) for handle in handles] == ["Success", "Success"]
+    assert {handle.refresh_ref["id"] for handle in handles} == {"refresh-0", "refresh-1"}
+    # One snapshot per request, then a single poll for both
+    assert transport.gets == 3
@@ -0,0 +1,120 @@
+import time
+from email.utils import formatdate
+
+import pytest
+import requests
+
+from fabric_python_helper.transport import HttpTransport, RetryPolicy
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.request = type("Request", (), {"body": None})()
+
+    def close(self):
+        pass
+
+
+class FakeSession:
+    """
+    Returns, or raises, the scripted outcomes in order and records each call.
+    """
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append(method)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class ScriptedTransport(HttpTransport):
+    def __init__(self, outcomes):
+        super().__init__(retry_policy=RetryPolicy(max_retries=3, backoff_factor=0.001))
+        self.session = FakeSession(outcomes)
+
+    def _create_session(self):
+        return self.session
+
+
+URL = "https://example.com/resource"
+
+
+def test_retry_after_is_read_as_seconds_or_an_http_date():
+    assert RetryPolicy.retry_after({"Retry-After": "7"}) == 7
+    assert RetryPolicy.retry_after({"retry-after": formatdate(time.time() + 30, usegmt=True)}) == pytest.approx(30, abs=2)
+    assert RetryPolicy.retry_after({"Retry-After": "soon"}) is None
+    assert RetryPolicy.retry_after({}) is None
+
+
+def test_retry_after_is_waited_for_but_capped():
+    policy = RetryPolicy(max_backoff=60)
+
+    assert policy.get_status_wait(1, 429, {"Retry-After": "12"}, "GET") == 12
+    assert policy.get_status_wait(1, 503, {"Retry-After": "600"}, "GET") == 60
+
+
+def test_post_is_only_retried_when_the_server_refused_it():
+    policy = RetryPolicy()
+
+    assert policy.get_status_wait(1, 502, {}, "POST") is None
+    assert policy.get_status_wait(1, 503, {}, "POST") is None
+    assert policy.get_status_wait(1, 503, {"Retry-After": "2"}, "POST") == 2
+    assert policy.get_status_wait(1, 429, {}, "POST") is not None
+    assert policy.get_status_wait(1, 502, {}, "GET") is not None
+
+
+def test_retries_stop_after_max_retries():
+    policy = RetryPolicy(max_retries=2)
+
+    assert policy.get_status_wait(2, 429, {}, "GET") is not None
+    assert policy.get_status_wait(3, 429, {}, "GET") is None
+    assert policy.get_status_wait(1, 404, {}, "GET") is None
+
+
+def test_connection_errors_are_only_retried_for_idempotent_methods():
+    policy = RetryPolicy()
+
+    assert policy.get_error_wait(1, "GET") is not None
+    assert policy.get_error_wait(1, "DELETE") is not None
+    assert policy.get_error_wait(1, "POST") is None
+
+
+def test_errors_the_transport_retried_are_not_retried_again():
+    policy = RetryPolicy()
+
+    assert policy.get_exception_wait(1, requests.HTTPError("404")) is None
+    assert policy.get_exception_wait(1, requests.ConnectionError()) is None
+    assert policy.get_exception_wait(1, requests.exceptions.ChunkedEncodingError()) is not None
+    assert policy.get_exception_wait(4, OSError(), max_retries=3) is None
+
+
+def test_transport_retries_a_throttled_get_after_retry_after():
+    transport = ScriptedTransport([FakeResponse(429, {"Retry-After": "0"}), FakeResponse(200)])
+
+    assert transport.get(URL).status_code == 200
+    assert transport.session.calls == ["GET", "GET"]
+
+
+def test_transport_returns_a_failed_post_without_retrying():
+    transport = ScriptedTransport([FakeResponse(502), FakeResponse(200)])
+
+    assert transport.post(URL).status_code == 502
+    assert transport.session.calls == ["POST"]
+
+
+def test_transport_retries_a_get_after_a_dropped_connection_but_not_a_post():
+    transport = ScriptedTransport([requests.ConnectionError("reset"), FakeResponse(200)])
+    assert transport.get(URL).status_code == 200
+    assert transport.session.calls == ["GET", "GET"]
+
+    transport = ScriptedTransport([requests.ConnectionError("reset"), FakeResponse(200)])
+    with pytest.raises(requests.ConnectionError):
+        transport.post(URL)
+    assert transport.session.calls == ["POST"]